@@ -1,6 +1,10 @@
 #!/usr/bin/python
-import re
-import smbus
+from __future__ import print_function
+import logging
+
+# Debug output goes through logging with lazy %-formatting, so nothing is
+# formatted unless the record is actually emitted
+logger = logging.getLogger('Adafruit_I2C')
 
 # ===========================================================================
 # Adafruit_I2C Class
@@ -9,26 +13,41 @@ import smbus
 
 class Adafruit_I2C(object):
 
+    # Board revision and bus number detected from /proc/cpuinfo, cached for
+    # the process lifetime
+    _detectedRevision = None
+    _detectedBusNumber = None
+
     @staticmethod
     def getPiRevision():
         "Gets the version number of the Raspberry Pi board"
         # Revision list available at:
         # http://elinux.org/RPi_HardwareHistory#Board_Revision_History
+        if Adafruit_I2C._detectedRevision is None:
+            Adafruit_I2C._detectedRevision = Adafruit_I2C._readPiRevision()
+        return Adafruit_I2C._detectedRevision
+
+    @staticmethod
+    def _readPiRevision():
         try:
             with open('/proc/cpuinfo', 'r') as infile:
                 for line in infile:
-                    # Match a line of the form "Revision : 0002" while ignoring extra
-                    # info in front of the revsion (like 1000 when the Pi was
-                    # over-volted).
-                    match = re.match('Revision\s+:\s+.*(\w{4})$', line)
-                    if match and match.group(1) in ['0000', '0002', '0003']:
+                    if not line.startswith('Revision'):
+                        continue
+                    # A line of the form "Revision : 0002". Only the last 4
+                    # chars count, extra info in front of the revision (like
+                    # 1000 when the Pi was over-volted) is ignored.
+                    key, _, value = line.partition(':')
+                    value = value.strip()
+                    if key.strip() != 'Revision' or len(value) < 4:
+                        continue
+                    if value[-4:] in ('0000', '0002', '0003'):
                         # Return revision 1 if revision ends with 0000, 0002 or
                         # 0003.
                         return 1
-                    elif match:
-                        # Assume revision 2 if revision ends with any other 4
-                        # chars.
-                        return 2
+                    # Assume revision 2 if revision ends with any other 4
+                    # chars.
+                    return 2
                 # Couldn't find the revision, assume revision 0 like older code
                 # for compatibility.
                 return 0
@@ -38,17 +57,25 @@ class Adafruit_I2C(object):
     @staticmethod
     def getPiI2CBusNumber():
         # Gets the I2C bus number /dev/i2c#
-        return 1 if Adafruit_I2C.getPiRevision() > 1 else 0
+        if Adafruit_I2C._detectedBusNumber is None:
+            Adafruit_I2C._detectedBusNumber = \
+                1 if Adafruit_I2C.getPiRevision() > 1 else 0
+        return Adafruit_I2C._detectedBusNumber
 
-    def __init__(self, address, busnum=-1, debug=False):
+    def __init__(self, address, busnum=-1, debug=False, bus=None):
         self.address = address
         # By default, the correct I2C bus is auto-detected using /proc/cpuinfo
         # Alternatively, you can hard-code the bus version below:
         # self.bus = smbus.SMBus(0); # Force I2C0 (early 256MB Pi's)
         # self.bus = smbus.SMBus(1); # Force I2C1 (512MB Pi's)
-        self.bus = smbus.SMBus(
-            busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber())
+        self.busnum = busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber()
+        # An already open (and possibly shared) bus handle can be passed in
+        if bus is None:
+            import smbus
+            bus = smbus.SMBus(self.busnum)
+        self.bus = bus
         self.debug = debug
+        self.lastError = None
 
     def reverseByteOrder(self, data):
         "Reverses the byte order of an int (16-bit) or long (32-bit) value"
@@ -60,8 +87,10 @@ class Adafruit_I2C(object):
             data >>= 8
         return val
 
-    def errMsg(self):
-        print "Error accessing 0x%02X: Check your I2C address" % self.address
+    def errMsg(self, err=None):
+        # keep the exception so instrumentation can report its type
+        self.lastError = err
+        logger.error("Error accessing 0x%02X: Check your I2C address (%s)", self.address, err)
         return -1
 
     def write8(self, reg, value):
@@ -69,61 +98,59 @@ class Adafruit_I2C(object):
         try:
             self.bus.write_byte_data(self.address, reg, value)
             if self.debug:
-                print "I2C: Wrote 0x%02X to register 0x%02X" % (value, reg)
-        except IOError, err:
-            return self.errMsg()
+                logger.debug("I2C: Wrote 0x%02X to register 0x%02X", value, reg)
+        except IOError as err:
+            return self.errMsg(err)
 
     def write16(self, reg, value):
         "Writes a 16-bit value to the specified register/address pair"
         try:
             self.bus.write_word_data(self.address, reg, value)
             if self.debug:
-                print ("I2C: Wrote 0x%02X to register pair 0x%02X,0x%02X" %
-                       (value, reg, reg + 1))
-        except IOError, err:
-            return self.errMsg()
+                logger.debug("I2C: Wrote 0x%02X to register pair 0x%02X,0x%02X",
+                             value, reg, reg + 1)
+        except IOError as err:
+            return self.errMsg(err)
 
     def writeRaw8(self, value):
         "Writes an 8-bit value on the bus"
         try:
             self.bus.write_byte(self.address, value)
             if self.debug:
-                print "I2C: Wrote 0x%02X" % value
-        except IOError, err:
-            return self.errMsg()
+                logger.debug("I2C: Wrote 0x%02X", value)
+        except IOError as err:
+            return self.errMsg(err)
 
     def writeList(self, reg, list):
         "Writes an array of bytes using I2C format"
         try:
             if self.debug:
-                print "I2C: Writing list to register 0x%02X:" % reg
-                print list
+                logger.debug("I2C: Writing list to register 0x%02X: %s", reg, list)
             self.bus.write_i2c_block_data(self.address, reg, list)
-        except IOError, err:
-            return self.errMsg()
+        except IOError as err:
+            return self.errMsg(err)
 
     def readList(self, reg, length):
         "Read a list of bytes from the I2C device"
         try:
             results = self.bus.read_i2c_block_data(self.address, reg, length)
             if self.debug:
-                print ("I2C: Device 0x%02X returned the following from reg 0x%02X" %
-                       (self.address, reg))
-                print results
+                logger.debug("I2C: Device 0x%02X returned the following from reg 0x%02X: %s",
+                             self.address, reg, results)
             return results
-        except IOError, err:
-            return self.errMsg()
+        except IOError as err:
+            return self.errMsg(err)
 
     def readU8(self, reg):
         "Read an unsigned byte from the I2C device"
         try:
             result = self.bus.read_byte_data(self.address, reg)
             if self.debug:
-                print ("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" %
-                       (self.address, result & 0xFF, reg))
+                logger.debug("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X",
+                             self.address, result & 0xFF, reg)
             return result
-        except IOError, err:
-            return self.errMsg()
+        except IOError as err:
+            return self.errMsg(err)
 
     def readS8(self, reg):
         "Reads a signed byte from the I2C device"
@@ -132,11 +159,11 @@ class Adafruit_I2C(object):
             if result > 127:
                 result -= 256
             if self.debug:
-                print ("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" %
-                       (self.address, result & 0xFF, reg))
+                logger.debug("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X",
+                             self.address, result & 0xFF, reg)
             return result
-        except IOError, err:
-            return self.errMsg()
+        except IOError as err:
+            return self.errMsg(err)
 
     def readU16(self, reg, little_endian=True):
         "Reads an unsigned 16-bit value from the I2C device"
@@ -147,10 +174,10 @@ class Adafruit_I2C(object):
             if not little_endian:
                 result = ((result << 8) & 0xFF00) + (result >> 8)
             if (self.debug):
-                print "I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg)
+                logger.debug("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X", self.address, result & 0xFFFF, reg)
             return result
-        except IOError, err:
-            return self.errMsg()
+        except IOError as err:
+            return self.errMsg(err)
 
     def readS16(self, reg, little_endian=True):
         "Reads a signed 16-bit value from the I2C device"
@@ -159,12 +186,12 @@ class Adafruit_I2C(object):
             if result > 32767:
                 result -= 65536
             return result
-        except IOError, err:
-            return self.errMsg()
+        except IOError as err:
+            return self.errMsg(err)
 
 if __name__ == '__main__':
     try:
         bus = Adafruit_I2C(address=0)
-        print "Default I2C bus is accessible"
+        print("Default I2C bus is accessible")
     except:
-        print "Error accessing default I2C bus"
+        print("Error accessing default I2C bus")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+""" Prints gestures using the interrupt driven event engine. Each DR edge
+costs one burst read; events are delivered on a worker thread.
+
+ Raspberry Pin  ZX Sensor Board  Function
+ ---------------------------------------
+ GPIO17         DR               Data Ready
+"""
+
+# standard
+import time, sys, os
+import logging
+# project
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from zxsensor import *
+
+logging.basicConfig(level=logging.WARN)
+
+zx_sensor = ZxSensor()
+engine = ZxEventEngine(zx_sensor, RPiGPIOPin(channel=17),
+                       interrupts=interrupt_type.GESTURE_INTERRUPTS)
+
+def on_swipe(event):
+    print("{}. Speed: {}".format(event.sample.gesture.name, event.sample.speed))
+
+def on_hover(event):
+    print("Hover at x {} z {}".format(event.sample.x, event.sample.z))
+
+engine.subscribe(on_swipe, SwipeEvent)
+engine.subscribe(on_hover, HoverEvent)
+engine.start()
+
+try:
+    while (True):
+        time.sleep(1)
+except KeyboardInterrupt:
+    engine.stop()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -4,7 +4,7 @@
 a Rasberry Pi. Tested with Pi2. When run, prints 'x' & 'z' to console
 """
 
-import time, sys, os
+import sys, os
 # project
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from zxsensor import ZxSensor
@@ -12,15 +12,17 @@ from zxsensor import ZxSensor
 # Initialise the ZxSensor device using the default address
 zx_sensor = ZxSensor(0x10)
 
-while (True):
-    if zx_sensor.position_available():
+# Read as fast as the sensor produces data while a hand is in range and
+# back off while nothing is there
+stream = zx_sensor.start_adaptive_streaming(target_latency=0.05)
+
+for sample in stream:
+    if sample.position_available and sample.z != None:
         # display raw values:
-        # print('x {0} z {1}'.format(zx_sensor.read_x(), zx_sensor.read_z()))
+        # print('x {0} z {1}'.format(sample.x, sample.z))
 
         # display z as console animation:
-        z = zx_sensor.read_z()
+        z = sample.z
         z_str = "{0:03d} ".format(int(z))
         line = "." * (int(z / 4) + 1)
         print(z_str + line)
-
-        time.sleep(.07)
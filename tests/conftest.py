@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+""" Shared fixtures: a ZxSensor talking to a SimulatedZxSensor """
+
+# standard
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.simulator import SimulatedZxSensor
+
+
+@pytest.fixture
+def sim():
+    # frames only advance on step(), so tests decide when the hand moves
+    return SimulatedZxSensor(frame_rate=None)
+
+
+@pytest.fixture
+def sensor(sim):
+    return ZxSensor(i2c=sim)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
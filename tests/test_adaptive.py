@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+""" AdaptivePoller: locking on to the frame rate and backing off when idle """
+
+# standard
+from __future__ import division, print_function
+import time
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.adaptive import AdaptivePoller
+from zxsensor.i2c_registers import *
+from zxsensor.simulator import SimulatedZxSensor, idle_frames, move_frames
+from zxsensor.zx_sample import ZxSample
+
+
+def sample_with(status):
+    return ZxSample(0.0, status, gesture_type.NO_GESTURE, 0, 100, 60, 50, 50)
+
+
+DATA = sample_with(1 << STATUS_DAV)
+EMPTY = sample_with(0)
+
+
+def test_schedule_locks_on_to_the_cadence(sensor):
+    poller = AdaptivePoller(sensor, oversample=2.0)
+    now = 0.0
+    assert poller._schedule(DATA, now) == poller.period
+    assert not poller.idle
+    for _ in range(40):
+        # frames every 20ms, read twice per frame
+        now += 0.01
+        poller._schedule(EMPTY, now)
+        now += 0.01
+        delay = poller._schedule(DATA, now)
+    assert poller.cadence == pytest.approx(0.02)
+    assert delay == pytest.approx(0.01)
+
+
+def test_cadence_ignores_gaps_without_an_object(sensor):
+    poller = AdaptivePoller(sensor)
+    now = 0.0
+    for _ in range(10):
+        poller._schedule(DATA, now)
+        now += 0.02
+    poller._schedule(DATA, now + 0.2)
+    assert poller.cadence == pytest.approx(0.02)
+
+
+def test_schedule_backs_off_and_ramps_up(sensor):
+    poller = AdaptivePoller(sensor, target_latency=0.02, max_interval=0.25,
+                            idle_after=0.1, backoff=2.0)
+    poller._schedule(DATA, 0.0)
+    # still within idle_after: keep polling at the target
+    assert poller._schedule(EMPTY, 0.05) == poller.period
+    now = 0.1
+    delays = []
+    for _ in range(6):
+        delay = poller._schedule(EMPTY, now)
+        delays.append(delay)
+        now += delay
+    assert poller.idle
+    assert delays == pytest.approx([0.04, 0.08, 0.16, 0.25, 0.25, 0.25])
+    # the first data after idling is read again right away
+    assert poller._schedule(DATA, now) == poller.period
+    assert not poller.idle
+
+
+def test_live_poller_follows_the_simulator():
+    sim = SimulatedZxSensor(frames=move_frames((20, 60), (220, 120), 50), frame_rate=50.0,
+                            loop=True)
+    sensor = ZxSensor(i2c=sim)
+    poller = sensor.start_adaptive_streaming(target_latency=0.05, max_rate_hz=500.0)
+    try:
+        time.sleep(1.0)
+        active = poller.report()
+        sim.load(idle_frames(1))
+        time.sleep(0.6)
+        polls = poller.polls
+        time.sleep(1.0)
+        idle_polls = poller.polls - polls
+        idle = poller.report()
+    finally:
+        sensor.stop_streaming()
+
+    assert active['cadence_hz'] == pytest.approx(50.0, rel=0.2)
+    # about one useful sample per frame, about two reads per frame
+    assert 30 <= active['sample_hz'] <= 60
+    assert active['poll_hz'] < 150
+    assert active['efficiency'] > 0.3
+    assert active['errors'] == 0
+    assert idle['idle']
+    # backed off to max_interval
+    assert idle_polls <= 8
+    assert len(poller.drain()) == poller.useful
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+""" AsyncZxSensor against the simulated sensor """
+
+# standard
+from __future__ import division, print_function
+import asyncio
+import threading
+import time
+# project
+from zxsensor import ZxSensor
+from zxsensor.async_zx_sensor import AsyncZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.simulator import SimulatedZxSensor, idle_frames, swipe_frames
+from zxsensor.zx_events import SimulatedPin
+
+
+def run(coroutine, timeout=5.0):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout))
+
+
+def test_gestures_without_dr_pin():
+    frames = swipe_frames(gesture_type.RIGHT_SWIPE) + idle_frames(10) + \
+        swipe_frames(gesture_type.LEFT_SWIPE) + idle_frames(10)
+    sim = SimulatedZxSensor(frames=frames, frame_rate=200.0)
+    sensor = AsyncZxSensor(ZxSensor(i2c=sim))
+
+    async def collect():
+        found = []
+        async for sample in sensor.gestures(poll_interval=0.005):
+            found.append(sample.gesture)
+            if (len(found) == 2):
+                return found
+
+    assert run(collect()) == [gesture_type.RIGHT_SWIPE, gesture_type.LEFT_SWIPE]
+
+
+def test_wait_data_ready_times_out():
+    sim = SimulatedZxSensor(frame_rate=None)
+    sensor = AsyncZxSensor(ZxSensor(i2c=sim))
+    assert not run(sensor.wait_data_ready(timeout=0.02, poll_interval=0.005))
+    sim.load(idle_frames(1) + swipe_frames(gesture_type.UP_SWIPE, count=1))
+    sim.step(2)
+    assert run(sensor.wait_data_ready(timeout=0.02, poll_interval=0.005))
+
+
+def test_wait_data_ready_polls_under_the_sensor_lock():
+    sim = SimulatedZxSensor(frame_rate=None)
+    zx = ZxSensor(i2c=sim)
+    sensor = AsyncZxSensor(zx)
+    sim.load(swipe_frames(gesture_type.UP_SWIPE, count=1))
+    sim.step()
+    held = threading.Event()
+
+    def hold_lock():
+        with zx.lock:
+            held.set()
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    held.wait()
+    start = time.monotonic()
+    assert run(sensor.wait_data_ready(timeout=1.0, poll_interval=0.005))
+    assert time.monotonic() - start >= 0.05
+    thread.join()
+
+
+def pin_sensor(active_high=True):
+    pin = SimulatedPin(active_high)
+    sim = SimulatedZxSensor(frame_rate=None, pin=pin)
+    zx = ZxSensor(interrupts=interrupt_type.GESTURE_INTERRUPTS, active_high=active_high, i2c=sim)
+    return sim, AsyncZxSensor(zx, active_high=active_high, pin=pin)
+
+
+def test_wait_data_ready_on_the_dr_pin():
+    sim, sensor = pin_sensor()
+
+    async def wait():
+        asyncio.get_running_loop().call_later(0.02, sim.step)
+        return await sensor.wait_data_ready(timeout=0.01), await sensor.wait_data_ready(timeout=1.0)
+
+    sim.load(swipe_frames(gesture_type.RIGHT_SWIPE, count=1))
+    assert run(wait()) == (False, True)
+    # the pin backend did not poll the bus
+    assert sim.counts['readU8'] == 2
+    sensor.close()
+    assert sim.pin._callback == None
+
+
+def test_gestures_on_an_active_low_dr_pin():
+    sim, sensor = pin_sensor(active_high=False)
+    sim.load(swipe_frames(gesture_type.LEFT_SWIPE, count=1) + idle_frames(2) +
+             swipe_frames(gesture_type.UP_SWIPE, count=1))
+
+    async def collect():
+        loop = asyncio.get_running_loop()
+        for i in range(4):
+            loop.call_later(0.01 * (i + 1), sim.step)
+        found = []
+        async for sample in sensor.gestures():
+            found.append(sample.gesture)
+            if (len(found) == 2):
+                return found
+
+    assert run(collect()) == [gesture_type.LEFT_SWIPE, gesture_type.UP_SWIPE]
+    sensor.close()
+
+
+def test_read_snapshot_runs_in_the_bus_executor():
+    sim = SimulatedZxSensor(frames=swipe_frames(gesture_type.UP_SWIPE, count=1), frame_rate=None)
+    sensor = AsyncZxSensor(ZxSensor(i2c=sim))
+    sim.step()
+    sample = run(sensor.read_snapshot())
+    assert sample.gesture == gesture_type.UP_SWIPE
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
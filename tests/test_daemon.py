@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+""" The daemon run with --simulate, its shared memory ring and gesture socket """
+
+# standard
+from __future__ import division, print_function
+import os
+import signal
+import subprocess
+import sys
+import time
+# external
+import pytest
+# project
+from zxsensor.daemon import SharedSampleRing, ZxGestureClient, ZxSampleReader, gesture_message
+from zxsensor.i2c_registers import *
+from zxsensor.zx_sample import ZxSample
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while (time.monotonic() < deadline):
+        try:
+            result = condition()
+        except (OSError, ValueError):
+            result = None
+        if (result):
+            return result
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    name = 'zxtest{}'.format(os.getpid())
+    path = str(tmp_path / 'zx.sock')
+    process = subprocess.Popen([sys.executable, '-m', 'zxsensor.daemon', '--simulate',
+                                '--rate', '200', '--name', name, '--socket', path],
+                               cwd=ROOT)
+    yield process, name, path
+    if (process.poll() == None):
+        process.kill()
+        process.wait()
+
+
+def test_simulated_daemon(daemon):
+    process, name, path = daemon
+    reader = wait_for(lambda: ZxSampleReader(name, from_start=True))
+    assert reader
+    try:
+        assert wait_for(lambda: os.path.exists(path))
+        client = ZxGestureClient(path, timeout=10.0)
+        try:
+            samples = []
+            assert wait_for(lambda: samples.extend(reader.read_new()) or len(samples) >= 200)
+            assert all(a.timestamp < b.timestamp for a, b in zip(samples, samples[1:]))
+            assert any(sample.x != None for sample in samples)
+            assert reader.latest().timestamp >= samples[-1].timestamp
+            # the simulated script holds two swipes and a hover
+            messages = iter(client)
+            gestures = set(next(messages)['gesture'] for _ in range(3))
+            assert gestures == {'RIGHT_SWIPE', 'HOVER', 'LEFT_SWIPE'}
+        finally:
+            client.close()
+    finally:
+        reader.close()
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(10.0) == 0
+    # the daemon removed its socket and shared memory
+    assert not os.path.exists(path)
+    with pytest.raises(FileNotFoundError):
+        SharedSampleRing(name)
+
+
+def test_ring_round_trip_and_lapping():
+    name = 'zxring{}'.format(os.getpid())
+    ring = SharedSampleRing(name, capacity=4, create=True)
+    try:
+        reader = ZxSampleReader(name)
+        samples = [ZxSample(float(i), 1 << STATUS_DAV, gesture_type.NO_GESTURE, 0,
+                            i, None if i == 2 else 40, 10, 20) for i in range(6)]
+        for sample in samples[:3]:
+            ring.publish(sample)
+        assert reader.read_new() == samples[:3]
+        for sample in samples[3:]:
+            ring.publish(sample)
+        assert reader.read_new() == samples[3:]
+        for sample in samples:
+            ring.publish(sample)
+        assert reader.read_new() == samples[2:]
+        assert reader.missed == 2
+        assert reader.latest() == samples[-1]
+        reader.close()
+    finally:
+        ring.close()
+
+
+def test_gesture_message_is_one_json_line():
+    line = gesture_message(1.5, gesture_type.UP_SWIPE, 120, None, 'sensor', speed=9)
+    assert line.endswith(b'\n') and line.count(b'\n') == 1
+    assert b'"gesture": "UP_SWIPE"' in line
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
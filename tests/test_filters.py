@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+""" Filter stages """
+
+# standard
+from __future__ import division, print_function
+import math
+import random
+# external
+import pytest
+# project
+from zxsensor.filters import *
+from zxsensor.i2c_registers import *
+from zxsensor.zx_sample import ZxSample
+
+
+def reference_median(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    if (n % 2):
+        return ordered[n // 2]
+    return (ordered[n // 2 - 1] + ordered[n // 2]) / 2
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 8])
+def test_median_matches_sorting_the_window(size):
+    rng = random.Random(size)
+    median = MedianFilter(size)
+    values = []
+    for t in range(200):
+        # repeated values exercise removal of duplicates
+        value = rng.choice([rng.randint(0, 240), 120])
+        values.append(value)
+        assert median.update(t, value) == reference_median(values[-size:])
+
+
+def test_median_removes_a_spike():
+    median = MedianFilter(3)
+    out = [median.update(t, v) for t, v in enumerate([100, 100, 240, 100, 100])]
+    assert out[2:] == [100, 100, 100]
+
+
+def test_median_starts_over_after_dropouts():
+    median = MedianFilter(3, max_dropouts=1)
+    for t, value in enumerate([10, 20, 30]):
+        median.update(t, value)
+    assert median.update(3, None) == None
+    assert median.update(4, 200) == 30
+    median.update(5, None)
+    assert median.update(6, None) == None
+    assert median.update(7, 200) == 200
+
+
+RATE = 100.0
+
+
+def run(stage, values, t0=0.0):
+    return [stage.update(t0 + i / RATE, value) for i, value in enumerate(values)]
+
+
+def noisy(values, sigma=3.0, seed=1):
+    rng = random.Random(seed)
+    return [v + rng.gauss(0, sigma) for v in values]
+
+
+def spread(values):
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+
+def ramp(count, speed=200.0, start=20.0):
+    return [start + speed * i / RATE for i in range(count)]
+
+
+# =========
+# One Euro
+# =========
+
+def test_one_euro_smooths_jitter_at_rest():
+    raw = noisy([120.0] * 300)
+    out = run(OneEuroFilter(), raw)
+    assert spread(out[100:]) < spread(raw[100:]) / 3
+    assert sum(out[100:]) / 200 == pytest.approx(120.0, abs=1.0)
+
+
+def test_one_euro_lag_falls_with_beta():
+    values = ramp(100)
+    lags = []
+    for beta in (0.0, 0.05, 0.5):
+        out = run(OneEuroFilter(beta=beta), values)
+        lags.append(values[-1] - out[-1])
+    assert lags[0] > lags[1] > lags[2] > 0
+    assert lags[2] < 5.0
+
+
+def test_one_euro_dropouts():
+    stage = OneEuroFilter(beta=0.0, max_dropouts=1)
+    run(stage, [100.0] * 50)
+    assert stage.update(0.5, None) == None
+    # the state survived one dropout: a jump is smoothed
+    assert stage.update(0.51, 200.0) < 150.0
+    stage.update(0.52, None)
+    stage.update(0.53, None)
+    # two dropouts reset it: the first value passes through
+    assert stage.update(0.54, 200.0) == 200.0
+
+
+# ======
+# Kalman
+# ======
+
+def test_kalman_tracks_a_ramp_without_lag():
+    values = ramp(150)
+    stage = KalmanFilter()
+    out = run(stage, noisy(values, 1.0))
+    assert stage.velocity == pytest.approx(200.0, rel=0.1)
+    errors = [o - v for o, v in zip(out[100:], values[100:])]
+    assert abs(sum(errors) / len(errors)) < 1.0
+
+
+def test_kalman_smooths_jitter_at_rest():
+    raw = noisy([80.0] * 300, sigma=2.0)
+    out = run(KalmanFilter(process_noise=50.0), raw)
+    assert spread(out[100:]) < spread(raw[100:]) / 2
+
+
+def test_kalman_bridges_dropouts_by_extrapolating():
+    values = ramp(100)
+    stage = KalmanFilter(max_dropouts=3)
+    run(stage, values)
+    predicted = [stage.update(1.0 + i / RATE, None) for i in range(3)]
+    expected = ramp(103)[100:]
+    assert predicted == pytest.approx(expected, abs=1.0)
+    assert stage.update(1.03, None) == None
+    assert stage.velocity == 0.0
+    assert stage.update(1.04, 50.0) == 50.0
+
+
+def test_exponential_filter_converges():
+    out = run(ExponentialFilter(0.5), [0.0] + [100.0] * 20)
+    assert out[1] == 50.0
+    assert out[-1] == pytest.approx(100.0, abs=1e-3)
+    with pytest.raises(ValueError):
+        ExponentialFilter(0.0)
+
+
+def test_sample_filter_keeps_axes_apart():
+    smooth = SampleFilter(ExponentialFilter(0.5))
+    first = ZxSample(0.0, 1 << STATUS_DAV, gesture_type.NO_GESTURE, 0, 100, 40, 0, 0)
+    smooth.update(first)
+    out = smooth.update(first._replace(timestamp=0.01, x=200, z=None))
+    assert out.x == 150.0 and out.z == None
+    assert out.timestamp == 0.01
+
+
+def test_chain_feeds_stages_in_order():
+    chain = FilterChain(MedianFilter(3), ExponentialFilter(1.0))
+    assert [chain.update(t, v) for t, v in enumerate([5, 7, 6])] == [5, 6, 6]
+
+
+def test_chain_passes_dropouts_on():
+    chain = FilterChain(MedianFilter(3), KalmanFilter(max_dropouts=2))
+    run(chain, [100.0] * 10)
+    # the median drops out, the Kalman stage bridges it
+    assert chain.update(0.1, None) == pytest.approx(100.0)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+""" Host-side gesture detectors on synthetic tracks """
+
+# standard
+from __future__ import division, print_function
+# external
+import pytest
+# project
+from zxsensor.gestures import GestureRecognizer, SwipeDetector
+from zxsensor.i2c_registers import *
+from zxsensor.zx_sample import ZxSample
+
+RATE = 50.0
+
+
+def track(points, t0=0.0):
+    """ZxSamples at RATE for a list of (x, z) points, None for no object"""
+    samples = []
+    for i, point in enumerate(points):
+        x, z = point if point != None else (None, None)
+        samples.append(ZxSample(t0 + i / RATE, 1 << STATUS_DAV, gesture_type.NO_GESTURE,
+                                0, x, z, 0, 0))
+    return samples
+
+
+def line(start, end, seconds):
+    count = max(int(round(seconds * RATE)), 1)
+    return [(start[0] + (end[0] - start[0]) * i / count,
+             start[1] + (end[1] - start[1]) * i / count) for i in range(count + 1)]
+
+
+def hold(point, seconds):
+    return [point] * int(round(seconds * RATE))
+
+
+def gestures(points, detectors=None):
+    recognizer = GestureRecognizer(detectors)
+    return [found.gesture for found in recognizer.feed(track(points))]
+
+
+# ======
+# Swipes
+# ======
+
+@pytest.mark.parametrize('start, end, expected', [
+    ((70, 100), (170, 100), gesture_type.RIGHT_SWIPE),
+    ((170, 100), (70, 100), gesture_type.LEFT_SWIPE),
+    ((120, 60), (120, 160), gesture_type.UP_SWIPE),
+])
+def test_swipe_directions(start, end, expected):
+    assert gestures(line(start, end, 0.3), ['swipe']) == [expected]
+
+
+@pytest.mark.parametrize('rest', [0.0, 0.2, 0.4, 0.45, 0.5, 0.55, 0.6, 1.0, 1.3])
+def test_swipe_after_any_rest(rest):
+    points = hold((70, 100), rest) + line((70, 100), (170, 100), 0.3)
+    assert gestures(points, ['swipe']) == [gesture_type.RIGHT_SWIPE]
+
+
+def test_long_swipe_fires_once():
+    points = line((20, 100), (220, 100), 0.5) + hold((220, 100), 1.0) + \
+        line((220, 100), (20, 100), 0.5)
+    assert gestures(points, ['swipe']) == [gesture_type.RIGHT_SWIPE, gesture_type.LEFT_SWIPE]
+
+
+def test_slow_movement_is_not_a_swipe():
+    assert gestures(line((20, 100), (220, 100), 4.0), ['swipe']) == []
+
+
+def test_diagonal_movement_is_not_a_swipe():
+    assert gestures(line((70, 60), (170, 160), 0.3), ['swipe']) == []
+
+
+def test_swipe_reports_its_duration():
+    detector = SwipeDetector()
+    found = [detector.update(s.timestamp, s.x, s.z)
+             for s in track(hold((70, 100), 1.0) + line((70, 100), (170, 100), 0.3))]
+    found = [f for f in found if f != None]
+    assert len(found) == 1
+    assert found[0].duration == pytest.approx(0.8 * 0.3, abs=2 / RATE)
+
+
+def test_dropout_restarts_the_swipe():
+    points = line((70, 100), (110, 100), 0.15) + [None] + line((110, 100), (160, 100), 0.15)
+    assert gestures(points, ['swipe']) == []
+
+
+# =====
+# Hover
+# =====
+
+def test_hover_fires_once():
+    points = [(100 + (i % 3), 80) for i in range(int(2 * RATE))]
+    assert gestures(points, ['hover']) == [gesture_type.HOVER]
+
+
+def test_hover_then_move():
+    points = hold((100, 80), 0.8) + line((100, 80), (160, 80), 0.2)
+    assert gestures(points, ['hover_move']) == [gesture_type.HOVER_MOVE]
+
+
+# ==========
+# Tap / push
+# ==========
+
+def test_tap():
+    points = hold((120, 100), 0.5) + line((120, 100), (120, 70), 0.1) + \
+        line((120, 70), (120, 100), 0.1) + hold((120, 100), 0.5)
+    assert gestures(points, ['tap', 'push_pull']) == [gesture_type.TAP]
+
+
+def test_push_and_pull():
+    points = hold((120, 150), 0.5) + line((120, 150), (120, 70), 0.4) + \
+        hold((120, 70), 0.5) + line((120, 70), (120, 150), 0.4) + hold((120, 150), 0.5)
+    found = gestures(points, ['push_pull'])
+    assert found == [gesture_type.PUSH, gesture_type.PULL]
+
+
+def test_long_push_fires_once():
+    points = hold((120, 220), 0.2) + line((120, 220), (120, 20), 0.8) + hold((120, 20), 0.5)
+    assert gestures(points, ['push_pull']) == [gesture_type.PUSH]
+
+
+@pytest.mark.parametrize('depth, seconds', [(30, 0.1), (60, 0.1), (65, 0.3), (80, 0.06),
+                                           (80, 0.15), (85, 0.4), (100, 0.2)])
+def test_tap_and_push_are_exclusive(depth, seconds):
+    points = hold((120, 150), 0.5) + line((120, 150), (120, 150 - depth), seconds) + \
+        line((120, 150 - depth), (120, 150), seconds) + hold((120, 150), 0.5)
+    found = gestures(points, ['tap', 'push_pull'])
+    assert not (gesture_type.TAP in found and gesture_type.PUSH in found)
+    assert found[:1] == ([gesture_type.PUSH] if depth >= 60 else [gesture_type.TAP])
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
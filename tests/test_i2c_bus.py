@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+""" ZxBus with a stand-in SMBus handle """
+
+# standard
+from __future__ import division, print_function
+# project
+from zxsensor import ZxSensor
+from zxsensor.Adafruit_I2C import Adafruit_I2C
+from zxsensor.i2c_bus import ZxBus
+
+
+class FakeSMBus(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def read_byte_data(self, address, reg):
+        return 0
+
+    def read_i2c_block_data(self, address, reg, length):
+        return [0] * length
+
+    def close(self):
+        self.closed = True
+
+
+def make_sensor(handle):
+    i2c = Adafruit_I2C(0x10, busnum=1, bus=handle)
+    return ZxSensor(i2c=i2c, probe=False, configure=False)
+
+
+def test_attach_closes_the_sensors_own_handle():
+    own = FakeSMBus()
+    sensor = make_sensor(own)
+    bus = ZxBus(1, handle=FakeSMBus())
+    assert bus.attach(sensor) is sensor
+    assert own.closed
+    assert sensor.i2c.bus is bus.handle
+    assert sensor.lock is bus.lock
+    assert bus.sensors == [sensor]
+
+
+def test_attach_through_wrappers():
+    own = FakeSMBus()
+    sensor = make_sensor(own)
+    sensor.enable_metrics()
+    bus = ZxBus(1, handle=FakeSMBus())
+    bus.attach(sensor)
+    assert own.closed
+    assert sensor.i2c.transport.bus is bus.handle
+    assert 'bus' not in sensor.i2c.__dict__
+
+
+def test_moving_between_buses_leaves_the_shared_handle_open():
+    shared = FakeSMBus()
+    first = ZxBus(1, handle=shared)
+    sensor = first.attach(make_sensor(FakeSMBus()))
+    second = ZxBus(1, handle=FakeSMBus())
+    second.attach(sensor)
+    assert not shared.closed
+    assert sensor.i2c.bus is second.handle
+
+
+def test_attach_twice_keeps_one_entry():
+    bus = ZxBus(1, handle=FakeSMBus())
+    sensor = bus.attach(make_sensor(FakeSMBus()))
+    bus.attach(sensor)
+    assert bus.sensors == [sensor]
+    assert not bus.handle._handle.closed
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+""" I2cDevTransport with the bus device and the I2C_RDWR ioctl faked """
+
+# standard
+from __future__ import division, print_function
+import fcntl
+import os
+# external
+import pytest
+# project
+from zxsensor import i2c_dev
+from zxsensor.i2c_dev import I2C_M_RD, I2C_RDWR, MAX_BLOCK, I2cDevTransport
+
+FAKE_FD = 1000
+
+
+class FakeAdapter(object):
+    """ Answers I2C_RDWR ioctls from a register map and logs the messages """
+
+    def __init__(self):
+        self.regs = list(range(256))
+        self.calls = []
+        self.error = None
+
+    def ioctl(self, fd, request, data):
+        assert fd == FAKE_FD
+        assert request == I2C_RDWR
+        if (self.error != None):
+            raise self.error
+        msgs = []
+        reg = None
+        for i in range(data.nmsgs):
+            msg = data.msgs[i]
+            if (msg.flags & I2C_M_RD):
+                for k in range(msg.len):
+                    msg.buf[k] = self.regs[reg + k]
+                msgs.append((msg.addr, msg.flags, msg.len, None))
+            else:
+                written = [msg.buf[k] for k in range(msg.len)]
+                reg = written[0]
+                self.regs[reg:reg + len(written) - 1] = written[1:]
+                msgs.append((msg.addr, msg.flags, msg.len, written))
+        self.calls.append(msgs)
+        return 0
+
+
+@pytest.fixture
+def adapter(monkeypatch):
+    fake = FakeAdapter()
+    real_open, real_close, real_ioctl = os.open, os.close, fcntl.ioctl
+
+    def fake_open(path, flags, *args):
+        if (path == '/dev/i2c-1'):
+            return FAKE_FD
+        return real_open(path, flags, *args)
+
+    def fake_close(fd):
+        if (fd != FAKE_FD):
+            real_close(fd)
+
+    def fake_ioctl(fd, request, arg=0, *args):
+        if (fd == FAKE_FD):
+            return fake.ioctl(fd, request, arg)
+        return real_ioctl(fd, request, arg, *args)
+
+    monkeypatch.setattr(i2c_dev.os, 'open', fake_open)
+    monkeypatch.setattr(i2c_dev.os, 'close', fake_close)
+    monkeypatch.setattr(i2c_dev.fcntl, 'ioctl', fake_ioctl)
+    return fake
+
+
+@pytest.fixture
+def transport(adapter):
+    transport = I2cDevTransport(0x10, busnum=1)
+    yield transport
+    transport.close()
+
+
+def test_readinto_is_one_combined_transaction(adapter, transport):
+    buffer = bytearray(7)
+    assert transport.readinto(0x04, buffer) == 7
+    assert adapter.calls == [[(0x10, 0, 1, [0x04]), (0x10, I2C_M_RD, 7, None)]]
+    assert buffer == bytearray(range(4, 11))
+    # the data was copied out of the transport's own buffer
+    assert buffer is not transport._in
+    transport._in[0] = 99
+    assert buffer[0] == 4
+
+
+def test_readinto_a_view_and_read_list(adapter, transport):
+    buffer = bytearray(10)
+    assert transport.readinto(0x20, memoryview(buffer)[2:5]) == 3
+    assert buffer == bytearray([0, 0, 0x20, 0x21, 0x22, 0, 0, 0, 0, 0])
+    assert transport.readList(0x30, 3) == [0x30, 0x31, 0x32]
+    assert transport.readU8(0x41) == 0x41
+    assert [len(call) for call in adapter.calls] == [2, 2, 2]
+    with pytest.raises(ValueError):
+        transport.readinto(0, bytearray(MAX_BLOCK + 1))
+
+
+def test_writes_are_one_message(adapter, transport):
+    assert transport.writeList(0x04, [1, 2, 3]) == None
+    assert transport.write8(0x08, 0x1FF) == None
+    assert adapter.calls == [[(0x10, 0, 4, [0x04, 1, 2, 3])],
+                             [(0x10, 0, 2, [0x08, 0xFF])]]
+    assert transport.readList(0x04, 3) == [1, 2, 3]
+
+
+def test_signed_reads(adapter, transport):
+    adapter.regs[0x10:0x12] = [0x01, 0x80]
+    adapter.regs[0x12] = 0xFE
+    assert transport.readS16(0x10) == -32767
+    assert transport.readS16(0x10, little_endian=False) == 0x0180
+    assert transport.readS8(0x12) == -2
+    assert transport.readS8(0x13) == 0x13
+
+
+def test_errors_are_reported_adafruit_style(adapter, transport):
+    adapter.error = IOError(121, 'Remote I/O error')
+    assert transport.readU8(0) == -1
+    assert transport.readS8(0) == -1
+    assert transport.readS16(0) == -1
+    assert transport.readList(0, 4) == -1
+    assert transport.readinto(0, bytearray(4)) == -1
+    assert transport.write8(0, 1) == -1
+    assert transport.lastError is adapter.error
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+""" Host side X/Z from the range registers """
+
+# standard
+from __future__ import division, print_function
+import math
+# external
+import pytest
+# project
+from zxsensor.i2c_registers import *
+from zxsensor.position import PositionCalibration, PositionSolver, calibrate, solve_ranges
+from zxsensor.simulator import SimulatedZxSensor
+
+
+def simulated_points(step=8):
+    sim = SimulatedZxSensor(frame_rate=None)
+    for x in range(0, MAX_X + 1, step):
+        for z in range(1, MAX_Z + 1, step):
+            lrng, rrng = sim.ranges_for(x, z)
+            if (0 < lrng) and (0 < rrng):
+                yield lrng, rrng, x, z
+
+
+def test_solves_every_simulated_position():
+    solver = PositionSolver()
+    errors = []
+    for lrng, rrng, x, z in simulated_points():
+        solved = solver.solve(lrng, rrng)
+        assert solved != None
+        errors.append(math.hypot(solved[0] - x, solved[1] - z))
+    # near z=0 at the edges the geometry amplifies the quantisation
+    errors.sort()
+    assert errors[len(errors) // 2] < 1
+
+
+@pytest.mark.parametrize('lrng, rrng', [(200, 60), (60, 200), (240, 240)])
+def test_rejects_circles_that_do_not_meet(lrng, rrng):
+    cal = PositionCalibration()
+    assert solve_ranges(cal, lrng, rrng) == None
+    assert PositionSolver(cal).solve(lrng, rrng) == None
+
+
+def test_rejects_x_outside_the_field():
+    # circles that meet, but well left of the field
+    cal = PositionCalibration(left_emitter=60, right_emitter=180)
+    assert solve_ranges(cal, 100, 10) == None
+
+
+def test_no_object_and_unread_ranges():
+    solver = PositionSolver()
+    assert solver.solve(0, 120) == None
+    assert solver.solve(None, 120) == None
+
+
+def test_arrays_match_the_table():
+    np = pytest.importorskip('numpy')
+    solver = PositionSolver()
+    lrng, rrng = np.meshgrid(np.arange(256.0), np.arange(256.0), indexing='ij')
+    x, z = solver.solve_arrays(lrng.ravel(), rrng.ravel())
+    for index in range(0, 65536, 97):
+        solved = solve_ranges(solver.calibration, index >> 8, index & 0xFF)
+        if (solved == None):
+            assert np.isnan(x[index]) and np.isnan(z[index])
+        else:
+            assert (x[index], z[index]) == pytest.approx(solved)
+
+
+def test_calibrate_fits_a_linear_correction():
+    points = [(lrng, rrng, x * 0.9 + 5, z * 1.1) for lrng, rrng, x, z in simulated_points(24)]
+    cal = calibrate(points)
+    assert cal.x_scale == pytest.approx(0.9, abs=0.02)
+    assert cal.z_scale == pytest.approx(1.1, abs=0.03)
+
+
+def test_calibration_round_trip(tmp_path):
+    cal = PositionCalibration(x_scale=0.95, z_offset=2.0)
+    path = str(tmp_path / 'sub' / 'cal.json')
+    cal.save(path)
+    assert PositionCalibration.load(path) == cal
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
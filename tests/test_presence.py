@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+""" PresenceMonitor with a simulated sensor and DR pin """
+
+# standard
+from __future__ import division, print_function
+import time
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.presence import ACTIVE, IDLE, PresenceMonitor
+from zxsensor.simulator import SimulatedZxSensor, Frame, idle_frames
+from zxsensor.zx_events import SimulatedPin
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while (not condition()) and (time.monotonic() < deadline):
+        time.sleep(0.002)
+    return condition()
+
+
+@pytest.fixture
+def monitored():
+    pin = SimulatedPin()
+    sim = SimulatedZxSensor(frame_rate=None, pin=pin)
+    sensor = ZxSensor(i2c=sim)
+    monitor = sensor.start_presence_monitor(pin, rate_hz=200.0, idle_timeout=0.1,
+                                            min_active=0.3, max_sleep=0.05)
+    changes = []
+    monitor.on_state(lambda state, now: changes.append((state, now)))
+    assert wait_for(lambda: monitor.state == IDLE)
+    yield sim, monitor, changes
+    sensor.stop_streaming()
+
+
+def test_idle_costs_no_transactions(monitored):
+    sim, monitor, changes = monitored
+    before = sim.transactions
+    time.sleep(0.2)
+    assert sim.transactions == before
+    assert sim.regs[ZX_DRE] == (1 << DRE_RNG) | (1 << DRE_EDGE)
+    assert sim.regs[ZX_DRCFG] & (1 << DRCFG_EN)
+
+
+def test_enter_and_leave(monitored):
+    sim, monitor, changes = monitored
+    sim.load([Frame(120, 80)] + idle_frames(1))
+    sim.step()
+    assert wait_for(lambda: monitor.state == ACTIVE)
+    assert monitor.wakeups == 1
+    # DR is not needed while polling
+    assert not sim.regs[ZX_DRCFG] & (1 << DRCFG_EN)
+    time.sleep(0.4)
+    assert monitor.state == ACTIVE
+    assert monitor.latest().x == 120
+    sim.step()
+    assert wait_for(lambda: monitor.state == IDLE)
+    assert [state for state, now in changes] == [ACTIVE, IDLE]
+    assert monitor.transitions == 2
+    # the object stayed past min_active, so idle_timeout decided
+    entered, left = changes[0][1], changes[1][1]
+    assert left - entered >= 0.4 + 0.1
+
+
+def test_short_visit_stays_active_for_min_active(monitored):
+    sim, monitor, changes = monitored
+    sim.load([Frame(120, 80)] + idle_frames(1))
+    sim.step()
+    assert wait_for(lambda: monitor.state == ACTIVE)
+    sim.step()
+    assert wait_for(lambda: monitor.state == IDLE)
+    entered, left = changes[0][1], changes[1][1]
+    assert left - entered >= 0.3
+
+
+def test_edge_of_a_leaving_object_is_spurious(monitored):
+    sim, monitor, changes = monitored
+    # the pin fires but nothing is in range when the monitor looks
+    monitor.pin.release_pin()
+    monitor.pin.assert_pin()
+    assert wait_for(lambda: monitor.spurious_wakeups == 1)
+    assert monitor.state == IDLE
+    monitor.pin.release_pin()
+
+
+def test_report_while_running(monitored):
+    sim, monitor, changes = monitored
+    sim.load([Frame(120, 80)] + idle_frames(1))
+    sim.step()
+    assert wait_for(lambda: monitor.state == ACTIVE)
+    sim.step()
+    assert wait_for(lambda: monitor.state == IDLE)
+    time.sleep(0.2)
+    report = monitor.report()
+    assert report['state'] == IDLE
+    assert report['transitions'] == 2
+    assert report['time_active'] >= 0.3
+    assert report['elapsed'] == pytest.approx(report['time_idle'] + report['time_active'])
+    assert report['transactions'] == monitor.polls + monitor.config_writes
+    assert report['transactions'] < report['baseline_transactions']
+    assert 0.0 < report['bus_savings'] < 1.0
+
+
+# ==============
+# report() maths
+# ==============
+
+def stopped_monitor(time_idle, time_active, cpu_idle, cpu_active, polls, config_writes):
+    sim = SimulatedZxSensor(frame_rate=None)
+    monitor = PresenceMonitor(ZxSensor(i2c=sim), SimulatedPin(), rate_hz=100.0)
+    monitor.state_time = {IDLE: time_idle, ACTIVE: time_active}
+    monitor.state_cpu = {IDLE: cpu_idle, ACTIVE: cpu_active}
+    monitor.polls = polls
+    monitor.config_writes = config_writes
+    return monitor
+
+
+def test_report_savings():
+    report = stopped_monitor(9.0, 1.0, 0.01, 0.2, 100, 4).report()
+    assert report['elapsed'] == 10.0
+    assert report['duty_cycle'] == pytest.approx(0.1)
+    assert report['baseline_transactions'] == 1000
+    assert report['transactions'] == 104
+    assert report['bus_savings'] == pytest.approx(1.0 - 104 / 1000.0)
+    # 0.2s CPU for 100 active polls, 1000 polls at full rate
+    assert report['baseline_cpu_s'] == pytest.approx(2.0)
+    assert report['cpu_savings'] == pytest.approx(1.0 - 0.21 / 2.0)
+
+
+def test_report_without_enough_active_time():
+    report = stopped_monitor(5.0, 0.005, 0.01, 0.001, 1, 1).report()
+    assert report['baseline_cpu_s'] == None
+    assert report['cpu_savings'] == None
+    assert report['bus_savings'] == pytest.approx(1.0 - 2 / 500.5)
+
+
+def test_report_before_start():
+    report = stopped_monitor(0.0, 0.0, 0.0, 0.0, 0, 0).report()
+    assert report['elapsed'] == 0.0
+    assert report['duty_cycle'] == 0.0
+    assert report['bus_savings'] == 0.0
+    assert report['baseline_cpu_s'] == None
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
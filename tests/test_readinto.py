@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+""" The zero-allocation snapshot path through the transport wrappers """
+
+# standard
+from __future__ import division, print_function
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.recording import Recording
+from zxsensor.simulator import SimulatedZxSensor, Frame
+
+
+class ReadintoSimulator(SimulatedZxSensor):
+    """ Simulator with the readinto() of I2cDevTransport """
+
+    def __init__(self, *args, **kwargs):
+        super(ReadintoSimulator, self).__init__(*args, **kwargs)
+        self.readintos = 0
+
+    def readinto(self, reg, buffer):
+        regs = self.readList(reg, len(buffer))
+        if (not isinstance(regs, list)):
+            return -1
+        self.readintos += 1
+        buffer[:len(regs)] = bytearray(regs)
+        return len(regs)
+
+
+def make_sensor():
+    sim = ReadintoSimulator(frames=[Frame(100, 40)], frame_rate=None)
+    sim.step()
+    return sim, ZxSensor(i2c=sim)
+
+
+def test_snapshot_reads_into_the_preallocated_block():
+    sim, sensor = make_sensor()
+    sample = sensor.read_snapshot()
+    assert sim.readintos == 1
+    assert (sample.x, sample.z) == (100, 40)
+
+
+def test_wrappers_keep_the_readinto_path(tmp_path):
+    sim, sensor = make_sensor()
+    resilience = sensor.enable_resilience(retries=0)
+    metrics = sensor.enable_metrics()
+    trace = sensor.enable_trace()
+    recording = sensor.enable_recording(str(tmp_path / 'run.zxr'))
+
+    sample = sensor.read_snapshot()
+    assert sim.readintos == 1
+    assert (sample.x, sample.z) == (100, 40)
+    assert resilience.transactions == 1
+    assert metrics.operation_counts['readList'] == 1
+    record = trace.records[-1]
+    assert record.op == 'readList' and not record.failed()
+    assert record.result[ZX_XPOS] == 100
+    assert recording.samples == 1
+
+    sensor.disable_recording()
+    replay = Recording(recording.path)
+    try:
+        replayed, = list(replay)
+    finally:
+        replay.close()
+    assert (replayed.x, replayed.z) == (100, 40)
+
+
+def test_readinto_failures_are_recorded():
+    sim, sensor = make_sensor()
+    sensor.enable_resilience(retries=0, failure_threshold=100)
+    metrics = sensor.enable_metrics()
+    trace = sensor.enable_trace()
+    sim.error_rate = 1.0
+    assert sensor.read_snapshot() == None
+    assert metrics.errors == {'ZxBusError': 1}
+    assert trace.records[-1].failed()
+
+
+def test_transport_changes_are_picked_up():
+    sim = SimulatedZxSensor(frame_rate=None)
+    sensor = ZxSensor(i2c=sim)
+    assert sensor.read_snapshot() != None
+    inner = ReadintoSimulator(frame_rate=None)
+    sensor.i2c = inner
+    sensor.read_snapshot()
+    sensor.enable_trace()
+    sensor.read_snapshot()
+    assert inner.readintos == 2
+    sensor.disable_trace()
+    sensor.i2c = sim
+    assert sensor.read_snapshot() != None
+    assert inner.readintos == 2
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
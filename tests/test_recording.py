@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+""" Recordings: writing from ZxSensor, reading back, seeking and replay """
+
+# standard
+from __future__ import division, print_function
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.recording import Recording, RecordingWriter, ReplayTransport
+from zxsensor.simulator import move_frames, swipe_frames
+
+
+@pytest.fixture
+def recorded(sim, sensor, tmp_path):
+    """Records 100 snapshots in chunks of 16, returns (live samples, path)"""
+    sim.load(move_frames((20, 60), (220, 120), 50) + swipe_frames(gesture_type.LEFT_SWIPE) +
+             move_frames((220, 120), (20, 60), 50))
+    path = str(tmp_path / 'run.zxr')
+    writer = sensor.enable_recording(path, chunk_records=16)
+    live = []
+    for _ in range(100):
+        sim.step()
+        live.append(sensor.read_snapshot())
+    sensor.disable_recording()
+    assert writer.samples == 100
+    return live, path
+
+
+def test_round_trip(recorded):
+    live, path = recorded
+    recording = Recording(path)
+    try:
+        assert len(recording) == len(live)
+        assert list(recording) == live
+        assert recording.start_time == live[0].timestamp
+        assert recording.end_time == live[-1].timestamp
+    finally:
+        recording.close()
+
+
+def test_seek_finds_the_live_sample(recorded):
+    live, path = recorded
+    recording = Recording(path)
+    try:
+        for i, sample in enumerate(live):
+            assert recording.seek(sample.timestamp) == i
+        assert recording.seek(live[0].timestamp - 1.0) == 0
+        assert recording.seek(live[-1].timestamp + 1.0) == len(live)
+        window = list(recording.samples(live[30].timestamp, live[60].timestamp))
+        assert window == live[30:60]
+    finally:
+        recording.close()
+
+
+def test_trace_is_recorded(sim, sensor, tmp_path):
+    path = str(tmp_path / 'trace.zxr')
+    sensor.enable_recording(path, trace=True)
+    sensor.write_register(ZX_DRE, 0x3F)
+    sample = sensor.read_snapshot()
+    sensor.disable_recording()
+    recording = Recording(path)
+    try:
+        assert list(recording) == [sample]
+        ops = [(record.op, record.reg) for record in recording.trace()]
+        assert ops == [('write8', ZX_DRE), ('readList', ZX_SNAPSHOT_START)]
+    finally:
+        recording.close()
+
+
+def test_appended_runs_keep_their_timestamps(recorded):
+    live, path = recorded
+    # a second run after a reboot: monotonic time starts over
+    writer = RecordingWriter(path)
+    writer.append_sample(live[0]._replace(timestamp=0.5))
+    writer.close()
+    recording = Recording(path)
+    try:
+        assert len(recording) == 101
+        assert recording[100].timestamp == 0.5
+        assert recording[99] == live[-1]
+    finally:
+        recording.close()
+
+
+def test_replay_step_by_step(recorded):
+    live, path = recorded
+    recording = Recording(path)
+    try:
+        replay = ReplayTransport(recording, speed=None)
+        sensor = ZxSensor(i2c=replay)
+        replayed = [sensor.read_snapshot() for _ in range(len(live))]
+        assert replay.finished
+    finally:
+        recording.close()
+    assert [(s.x, s.z, s.gesture) for s in replayed] == [(s.x, s.z, s.gesture) for s in live]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'not a recording' * 4)
+    with pytest.raises(ValueError):
+        Recording(str(path))
+    with pytest.raises(ValueError):
+        RecordingWriter(str(path))
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+""" ResilientTransport, alone and under the metrics, trace and recording
+wrappers """
+
+# standard
+from __future__ import division, print_function
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.errors import ZxBusError, ZxCircuitOpenError
+from zxsensor.i2c_registers import *
+from zxsensor.recording import Recording
+from zxsensor.resilient import ResilientTransport, OPEN
+from zxsensor.simulator import SimulatedZxSensor, Frame
+
+
+def test_retries_until_success():
+    sim = SimulatedZxSensor(frame_rate=None, error_rate=0.5, seed=3)
+    transport = ResilientTransport(sim, retries=10, backoff=0, timeout=None, seed=3)
+    for _ in range(20):
+        assert transport.readU8(ZX_MODEL) == ZX_MODEL_VER
+    assert transport.retried > 0
+    assert transport.failed == 0
+
+
+def test_raises_and_opens_the_breaker():
+    sim = SimulatedZxSensor(frame_rate=None, error_rate=1.0)
+    transport = ResilientTransport(sim, retries=1, backoff=0, failure_threshold=2,
+                                   reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(ZxBusError):
+            transport.readU8(ZX_MODEL)
+    assert transport.state == OPEN
+    with pytest.raises(ZxCircuitOpenError):
+        transport.readU8(ZX_MODEL)
+    assert transport.report()['rejected'] == 1
+
+
+def test_stacked_wrappers_record_raised_failures(tmp_path):
+    sim = SimulatedZxSensor(frame_rate=None)
+    sensor = ZxSensor(i2c=sim)
+    sensor.enable_resilience(retries=1, backoff=0, failure_threshold=100)
+    metrics = sensor.enable_metrics()
+    trace = sensor.enable_trace()
+    recording = sensor.enable_recording(str(tmp_path / 'run.zxr'), trace=True)
+    sim.error_rate = 1.0
+
+    assert sensor.read_snapshot() == None
+    assert not sensor.enable_interrupts()
+    assert isinstance(sensor.last_error, ZxBusError)
+
+    snapshot = metrics.snapshot()
+    assert snapshot['operations']['readList'] == 1
+    assert snapshot['operations']['write8'] == 1
+    assert snapshot['errors'] == {'ZxBusError': 2}
+    records = list(trace.records)
+    assert [record.op for record in records] == ['readList', 'write8']
+    assert all(record.failed() for record in records)
+    assert 'ZxBusError' in trace.dump()[0]
+
+    sim.error_rate = 0.0
+    assert sensor.read_snapshot() != None
+    # the recovery check reads the config registers after the snapshot read
+    assert metrics.snapshot()['operations']['readList'] == 3
+    records = list(trace.records)[2:]
+    assert [(record.op, record.reg) for record in records] == \
+        [('readList', ZX_SNAPSHOT_START), ('readList', ZX_CONFIG_REGISTERS[0])]
+    assert not any(record.failed() for record in records)
+
+    sensor.disable_recording()
+    replay = Recording(recording.path)
+    try:
+        recorded = list(replay.trace())
+    finally:
+        replay.close()
+    assert [record.failed() for record in recorded] == [True, True, False, False]
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
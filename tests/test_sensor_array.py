@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+""" SensorFusion and ZxSensorArray over simulated sensors """
+
+# standard
+from __future__ import division, print_function
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.sensor_array import FIELD_CENTER, SensorFusion, ZxSensorArray
+from zxsensor.simulator import SimulatedZxSensor, Frame
+
+
+def local(position, offset):
+    """(x, z) seen by a sensor mounted at offset, None outside its field"""
+    x = position[0] - offset
+    if (0 <= x <= MAX_X):
+        return (x, position[1])
+    return None
+
+
+# =========
+# Weighting
+# =========
+
+def test_single_reading_is_moved_into_the_global_frame():
+    fusion = SensorFusion([(0, 0), (200, 15)])
+    fused = fusion.update_positions(1.0, [None, (40, 60)])
+    assert (fused.x, fused.z) == (pytest.approx(240.0), pytest.approx(75.0))
+    assert (fused.sensor, fused.count) == (1, 1)
+
+
+def test_readings_are_weighted_by_distance_from_the_edge():
+    fusion = SensorFusion([0, 120], min_weight=0.05)
+    # the middle of sensor 0's field against the very edge of sensor 1's
+    fused = fusion.update_positions(1.0, [(FIELD_CENTER, 50), (0, 80)])
+    assert fused.x == pytest.approx(120.0)
+    assert fused.z == pytest.approx((1.0 * 50 + 0.05 * 80) / 1.05)
+    assert fused.sensor == 0 and fused.count == 2
+    # equal weights blend evenly
+    fused = fusion.update_positions(2.0, [(180, 40), (60, 60)])
+    assert fused.z == pytest.approx(50.0)
+
+
+def test_nothing_in_range_drops_the_owner():
+    fusion = SensorFusion([0, 200])
+    fusion.update_positions(1.0, [(100, 50), None])
+    fused = fusion.update_positions(2.0, [None, None])
+    assert (fused.x, fused.z, fused.sensor, fused.count) == (None, None, None, 0)
+    assert fusion.owner == None
+
+
+# ========
+# Handoffs
+# ========
+
+def track(fusion, positions, offsets):
+    return [fusion.update_positions(float(i), [local(p, o) for o in offsets])
+            for i, p in enumerate(positions)]
+
+
+def test_moving_across_hands_off_once():
+    offsets = [0, 200]
+    fusion = SensorFusion(offsets, hysteresis=0.2)
+    fused = track(fusion, [(x, 60) for x in range(40, 400, 5)], offsets)
+    owners = [f.sensor for f in fused]
+    assert owners[0] == 0 and owners[-1] == 1
+    assert fusion.handoffs == 1
+    # the owner changes only once sensor 1 clearly beats sensor 0
+    switch = owners.index(1)
+    x = fused[switch].x
+    assert fusion._weight(x - 200) > fusion._weight(x) + 0.2
+
+
+def test_hysteresis_stops_flapping_in_the_overlap():
+    offsets = [0, 200]
+    middle = 220
+    jitter = [(middle + (6 if i % 2 else -6), 60) for i in range(50)]
+    fusion = SensorFusion(offsets, hysteresis=0.2)
+    track(fusion, jitter, offsets)
+    assert fusion.handoffs == 0
+    loose = SensorFusion(offsets, hysteresis=0.0)
+    track(loose, jitter, offsets)
+    assert loose.handoffs > 10
+
+
+def test_update_takes_zx_samples():
+    from zxsensor.zx_sample import ZxSample
+    fusion = SensorFusion([0, 200])
+    sample = ZxSample(1.0, 1 << STATUS_DAV, gesture_type.NO_GESTURE, 0, 100, 60, 0, 0)
+    invalid = sample._replace(x=None)
+    fused = fusion.update(1.0, [sample, invalid])
+    assert (fused.x, fused.z, fused.count) == (100.0, 60.0, 1)
+    assert fusion.update(2.0, [None, invalid]).x == None
+
+
+# ==========
+# fuse_batch
+# ==========
+
+def test_fuse_batch_agrees_with_incremental():
+    np = pytest.importorskip('numpy')
+    rng = np.random.RandomState(7)
+    offsets = [(0, 0), (180, 5), (360, -5)]
+    x = rng.uniform(0, MAX_X, (200, 3))
+    z = rng.uniform(0, MAX_Z, (200, 3))
+    x[rng.rand(200, 3) < 0.3] = np.nan
+    z[rng.rand(200, 3) < 0.1] = np.nan
+    x[10] = np.nan
+    fusion = SensorFusion(offsets)
+    fx, fz, best = fusion.fuse_batch(x, z)
+    for i in range(200):
+        readings = [None if np.isnan(x[i, j]) or np.isnan(z[i, j]) else (x[i, j], z[i, j])
+                    for j in range(3)]
+        fused = fusion.update_positions(float(i), readings)
+        if (fused.x == None):
+            assert np.isnan(fx[i]) and np.isnan(fz[i]) and best[i] == -1
+        else:
+            assert fx[i] == pytest.approx(fused.x)
+            assert fz[i] == pytest.approx(fused.z)
+            weights = [0.0 if r == None else fusion._weight(r[0]) for r in readings]
+            assert weights[best[i]] == max(weights)
+    assert best[10] == -1
+
+
+# =============
+# ZxSensorArray
+# =============
+
+def make_array(offsets, **kwargs):
+    sims = [SimulatedZxSensor(frame_rate=None) for _ in offsets]
+    array = ZxSensorArray([ZxSensor(i2c=sim) for sim in sims], offsets, **kwargs)
+    return sims, array
+
+
+def load_track(sims, offsets, positions):
+    for sim, offset in zip(sims, offsets):
+        frames = []
+        for position in positions:
+            seen = local(position, offset)
+            frames.append(Frame(*seen) if seen != None else Frame())
+        sim.load(frames)
+
+
+def test_sweep_reads_every_sensor_once():
+    offsets = [0, 200]
+    sims, array = make_array(offsets)
+    load_track(sims, offsets, [(220, 60)])
+    for sim in sims:
+        sim.step()
+        sim.counts['readList'] = 0
+    fused = array.sweep()
+    assert all(sim.counts['readList'] == 1 for sim in sims)
+    assert fused.count == 2
+    assert fused.x == pytest.approx(220.0)
+    assert array.latest() == fused
+    sims[1].error_rate = 1.0
+    fused = array.sweep()
+    assert array.errors == [0, 1]
+    assert fused.count == 1
+
+
+def test_swipe_across_sensors():
+    offsets = [0, 200]
+    sims, array = make_array(offsets, rate_hz=50.0)
+    gestures = []
+    handoffs = []
+    array.on_gesture(gestures.append)
+    array.on_handoff(lambda t, old, new: handoffs.append((old, new)))
+    positions = [(60 + 10 * i, 80) for i in range(31)]
+    load_track(sims, offsets, positions)
+    for _ in positions:
+        for sim in sims:
+            sim.step()
+        array.sweep()
+    assert handoffs == [(0, 1)]
+    assert array.handoffs == 1
+    assert [g.gesture for g in gestures] == [gesture_type.RIGHT_SWIPE]
+    assert len(array.drain()) == len(positions)
+
+
+def test_array_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        ZxSensorArray([ZxSensor(i2c=SimulatedZxSensor(frame_rate=None))], [0, 200])
+    with pytest.raises(ValueError):
+        make_array([0], rate_hz=0)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+""" SampleColumnStore and the vectorized analytics """
+
+# standard
+from __future__ import division, print_function
+import warnings
+# external
+import pytest
+np = pytest.importorskip('numpy')
+# project
+from zxsensor.i2c_registers import *
+from zxsensor.zx_array import *
+from zxsensor.zx_sample import ZxSample
+
+
+def make_samples(count, t0=0.0, rate=100.0):
+    samples = []
+    for i in range(count):
+        x = None if i % 7 == 3 else i % 200
+        samples.append(ZxSample(t0 + i / rate, 1 << STATUS_DAV, gesture_type.NO_GESTURE,
+                                i % 5, x, 40 + i % 100, i % 240, (i * 3) % 240))
+    return samples
+
+
+def test_record_size():
+    assert SAMPLE_DTYPE.itemsize == 15
+
+
+def test_append_and_extend_agree():
+    samples = make_samples(50)
+    one = SampleColumnStore(64)
+    for sample in samples:
+        one.append(sample)
+    batch = SampleColumnStore(64)
+    batch.extend(samples)
+    assert len(one) == len(batch) == 50
+    assert np.array_equal(one.to_array(), batch.to_array())
+    data = batch.to_array()
+    assert data['x'][3] == ZX_ERROR
+    assert data['timestamp'][10] == samples[10].timestamp
+    assert data['speed'][9] == 4
+
+
+@pytest.mark.parametrize('chunks', [[25], [7, 9, 9], [3, 40], [1] * 25])
+def test_wrapping_keeps_the_newest(chunks):
+    samples = make_samples(sum(chunks))
+    store = SampleColumnStore(10)
+    done = 0
+    for size in chunks:
+        store.extend(samples[done:done + size])
+        done += size
+    assert len(store) == 10
+    assert store.dropped == len(samples) - 10
+    expected = from_samples(samples[-10:])
+    assert np.array_equal(store.to_array(), expected)
+
+
+def test_extend_array_larger_than_the_store():
+    data = from_samples(make_samples(30))
+    store = SampleColumnStore(8)
+    store.extend(make_samples(3))
+    store.extend_array(data)
+    assert store.dropped == 25
+    assert np.array_equal(store.to_array(), data[-8:])
+
+
+def test_valid_mask_and_velocity():
+    data = from_samples(make_samples(20))
+    mask = valid_mask(data)
+    assert not mask[3] and not mask[10] and mask[4]
+    t, vx, vz = velocity(data)
+    assert len(t) == 19
+    assert np.isnan(vx[2]) and np.isnan(vx[3])
+    assert vx[0] == pytest.approx(100.0)
+    assert vz[0] == pytest.approx(100.0)
+
+
+def test_resample_fills_short_gaps():
+    data = from_samples(make_samples(20))
+    t, x, z = resample(data, 200.0)
+    assert t[0] == data['timestamp'][0]
+    assert np.all(np.diff(t) == pytest.approx(0.005))
+    assert not np.any(np.isnan(x))
+    assert x[6] == pytest.approx(3.0)
+
+
+def naive_stats(values, window):
+    rows = [values[i:i + window] for i in range(len(values) - window + 1)]
+    with warnings.catch_warnings():
+        # all-NaN windows
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {
+            'mean': np.array([np.nanmean(r) for r in rows]),
+            'std': np.array([np.nanstd(r) for r in rows]),
+            'min': np.array([np.nanmin(r) for r in rows]),
+            'max': np.array([np.nanmax(r) for r in rows]),
+        }
+
+
+@pytest.mark.parametrize('window, block', [(1, 65536), (5, 65536), (5, 7), (40, 3)])
+def test_windowed_stats_match_numpy(window, block):
+    rng = np.random.RandomState(4)
+    values = rng.uniform(0, 240, 300)
+    values[rng.rand(300) < 0.2] = np.nan
+    values[100:150] = np.nan
+    stats = windowed_stats(values, window, block)
+    expected = naive_stats(values, window)
+    for key in ('mean', 'std', 'min', 'max'):
+        assert np.allclose(stats[key], expected[key], equal_nan=True), key
+    assert np.isnan(stats['mean'][110]) and np.isnan(stats['std'][110])
+
+
+def test_windowed_std_is_centred():
+    # a tiny spread on a large offset cancels out in sums of squares
+    rng = np.random.RandomState(5)
+    values = 1e8 + rng.normal(0, 0.01, 2000)
+    stats = windowed_stats(values, 50)
+    expected = naive_stats(values, 50)
+    assert np.allclose(stats['std'], expected['std'], rtol=1e-6)
+
+
+def test_windowed_stats_rejects_bad_windows():
+    with pytest.raises(ValueError):
+        windowed_stats(np.zeros(5), 0)
+    with pytest.raises(ValueError):
+        windowed_stats(np.zeros(5), 6)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
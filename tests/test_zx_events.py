@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+""" Event decoding and ZxEventEngine against the simulated sensor and pin """
+
+# standard
+from __future__ import division, print_function
+import threading
+import time
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.simulator import SimulatedZxSensor, Frame, hover_frames, idle_frames, swipe_frames
+from zxsensor.zx_events import *
+from zxsensor.zx_events import _EVENT_TABLE
+from zxsensor.zx_sample import ZxSample
+
+
+class DeafPin(SimulatedPin):
+    """ A pin whose edges are all missed; only its level can be read """
+
+    def start(self, callback):
+        pass
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while (not condition()) and (time.monotonic() < deadline):
+        time.sleep(0.005)
+    return condition()
+
+
+def make_engine(pin, **kwargs):
+    sim = SimulatedZxSensor(frame_rate=None, pin=pin)
+    engine = ZxEventEngine(ZxSensor(i2c=sim), pin, **kwargs)
+    received = []
+    engine.subscribe(received.append)
+    return sim, engine, received
+
+
+# ========
+# Decoding
+# ========
+
+def sample_with(status):
+    return ZxSample(1.0, status, gesture_type.NO_GESTURE, 0, 10, 20, 0, 0)
+
+
+def test_event_table_matches_the_sources():
+    for status in range(256):
+        expected = [(1 << dre_bit, event_type)
+                    for dre_bit, status_bit, event_type in DRE_EVENT_SOURCES
+                    if status & (1 << status_bit)]
+        assert list(_EVENT_TABLE[status]) == expected
+
+
+def test_decode_events_types():
+    status = (1 << STATUS_DAV) | (1 << STATUS_SWP) | (1 << STATUS_EDGE)
+    events = decode_events(sample_with(status))
+    assert [type(e) for e in events] == [RangeEvent, PositionEvent, SwipeEvent, EdgeEvent]
+    assert all(e.timestamp == 1.0 and e.sample.status == status for e in events)
+
+
+def test_decode_events_skips_disabled_sources():
+    status = (1 << STATUS_DAV) | (1 << STATUS_HOVER) | (1 << STATUS_HVG)
+    dre = (1 << DRE_CRD) | (1 << DRE_HVG)
+    events = decode_events(sample_with(status), dre)
+    assert [type(e) for e in events] == [PositionEvent, HoverMoveEvent]
+    assert decode_events(sample_with(0)) == []
+
+
+# ======
+# Engine
+# ======
+
+@pytest.mark.parametrize('active_high', [True, False])
+def test_edge_dispatches_events(active_high):
+    pin = SimulatedPin(active_high)
+    sim, engine, received = make_engine(pin, poll_interval=None)
+    engine.start()
+    try:
+        polarity = bool(sim.regs[ZX_DRCFG] & (1 << DRCFG_POLARITY))
+        assert polarity == active_high
+        assert not pin.is_asserted()
+        sim.load(swipe_frames(gesture_type.RIGHT_SWIPE, count=1))
+        sim.step()
+        assert wait_for(lambda: received)
+    finally:
+        engine.stop()
+    assert [type(e) for e in received] == [SwipeEvent]
+    assert received[0].sample.gesture == gesture_type.RIGHT_SWIPE
+    assert engine.edges == 1 and engine.recovered == 0
+    # the burst read cleared STATUS, so DR was released
+    assert not pin.is_asserted()
+
+
+def test_subscribers_filter_by_type():
+    pin = SimulatedPin()
+    sim, engine, received = make_engine(pin, interrupts=interrupt_type.ALL_INTERRUPTS,
+                                        poll_interval=None)
+    swipes = []
+    failing = []
+
+    def broken(event):
+        failing.append(event)
+        raise ValueError('subscriber bug')
+
+    engine.subscribe(swipes.append, SwipeEvent)
+    engine.subscribe(broken, HoverEvent)
+    engine.start()
+    try:
+        sim.load(hover_frames(100, 60, 1) + swipe_frames(gesture_type.LEFT_SWIPE, count=1))
+        sim.step()
+        assert wait_for(lambda: failing)
+        sim.step()
+        assert wait_for(lambda: swipes)
+        engine.unsubscribe(swipes.append)
+        sim.load(swipe_frames(gesture_type.UP_SWIPE, count=1))
+        sim.step()
+        assert wait_for(lambda: any(e.sample.gesture == gesture_type.UP_SWIPE
+                                    for e in received if isinstance(e, SwipeEvent)))
+    finally:
+        engine.stop()
+    assert [e.sample.gesture for e in swipes] == [gesture_type.LEFT_SWIPE]
+    assert {type(e) for e in received} >= {PositionEvent, HoverEvent, EdgeEvent, SwipeEvent}
+
+
+def test_missed_edge_is_recovered_by_polling():
+    pin = DeafPin()
+    sim, engine, received = make_engine(pin, poll_interval=0.02)
+    engine.start()
+    try:
+        sim.load(swipe_frames(gesture_type.UP_SWIPE, count=1))
+        sim.step()
+        assert pin.is_asserted()
+        assert wait_for(lambda: received)
+    finally:
+        engine.stop()
+    assert [type(e) for e in received] == [SwipeEvent]
+    assert engine.edges == 0
+    assert engine.recovered >= 1
+    assert not pin.is_asserted()
+
+
+def test_no_polling_without_a_stuck_pin():
+    pin = SimulatedPin()
+    sim, engine, received = make_engine(pin, poll_interval=0.01)
+    engine.start()
+    before = sim.transactions
+    time.sleep(0.05)
+    engine.stop()
+    assert sim.transactions == before
+    assert engine.recovered == 0
+
+
+def test_latched_interrupt_is_read_on_start():
+    pin = SimulatedPin()
+    sim, engine, received = make_engine(pin, poll_interval=None)
+    engine.sensor.configure(interrupt_type.GESTURE_INTERRUPTS)
+    sim.load(swipe_frames(gesture_type.RIGHT_SWIPE, count=1))
+    sim.step()
+    assert pin.is_asserted()
+    engine.start()
+    try:
+        assert wait_for(lambda: received)
+    finally:
+        engine.stop()
+    assert not pin.is_asserted()
+
+
+def test_read_errors_and_queue_overflow_are_counted():
+    pin = SimulatedPin()
+    sim, engine, received = make_engine(pin, poll_interval=None, queue_size=1)
+    block = threading.Event()
+    engine.subscribe(lambda event: block.wait(1.0))
+    engine.start()
+    try:
+        sim.load([Frame(100, 60, gesture_type.RIGHT_SWIPE, 5, 1 << STATUS_SWP)] * 4 +
+                 idle_frames(1))
+        for _ in range(4):
+            sim.step()
+        sim.error_rate = 1.0
+        engine._on_edge()
+        sim.error_rate = 0.0
+        block.set()
+        # the queued event is still delivered
+        assert wait_for(lambda: len(received) + engine.dropped == 4)
+    finally:
+        block.set()
+        engine.stop()
+    assert engine.edges == 5
+    assert engine.read_errors == 1
+    assert engine.dropped >= 2
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+""" ZxSensor against the simulated sensor """
+
+# standard
+from __future__ import division, print_function
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.simulator import SimulatedZxSensor, Frame, swipe_frames, hover_frames
+from zxsensor.zx_sample import StatusFlags
+
+
+def reset_counts(sim):
+    for op in sim.counts:
+        sim.counts[op] = 0
+
+
+# ===========
+# STATUS read
+# ===========
+
+def test_status_flags_clear_on_read(sim, sensor):
+    sim.load([Frame(120, 60, gesture_type.RIGHT_SWIPE, 10, 1 << STATUS_SWP)])
+    sim.step()
+    assert sensor.gesture_available()
+    assert not sensor.gesture_available()
+
+
+def test_read_status_decodes_every_bit(sim, sensor):
+    sim.load(hover_frames(100, 50, 1))
+    sim.step()
+    flags = sensor.read_status()
+    assert isinstance(flags, StatusFlags)
+    assert flags.dav and flags.hover and flags.edge
+    assert not flags.swp
+    assert not sensor.read_status().dav
+
+
+def test_snapshot_sees_flags_cleared_by_status_read(sim, sensor):
+    sim.load(swipe_frames(gesture_type.LEFT_SWIPE, count=2))
+    sim.step(2)
+    assert sensor.read_snapshot().gesture_available
+    assert not sensor.read_snapshot().gesture_available
+
+
+# ============
+# Config cache
+# ============
+
+def test_config_writes_go_through_the_shadow_cache(sim, sensor):
+    reset_counts(sim)
+    assert sensor.set_interrupt_trigger(interrupt_type.GESTURE_INTERRUPTS)
+    assert sensor.enable_interrupts()
+    # the constructor filled the cache: only the two writes hit the bus
+    assert sim.counts['readU8'] == sim.counts['readList'] == 0
+    assert sim.counts['write8'] + sim.counts['writeList'] == 2
+    assert sim.regs[ZX_DRE] == (1 << DRE_SWP) | (1 << DRE_HOVER) | (1 << DRE_HVG)
+    assert sim.regs[ZX_DRCFG] & (1 << DRCFG_EN)
+    assert sensor.read_register(ZX_DRE) == sim.regs[ZX_DRE]
+
+
+def test_unchanged_bit_is_not_written(sim, sensor):
+    sensor.enable_interrupts()
+    reset_counts(sim)
+    assert sensor.enable_interrupts()
+    assert sim.transactions == 0
+
+
+def test_apply_config_is_one_block_write(sim, sensor):
+    config = sensor.read_config()
+    config.swipe_interrupt = True
+    config.edge_interrupt = True
+    config.enabled = True
+    config.active_high = False
+    reset_counts(sim)
+    assert sensor.apply_config(config)
+    assert sim.counts == {'readU8': 0, 'readList': 0, 'write8': 0, 'writeList': 1}
+    assert sensor.read_config() == config
+    assert sensor.apply_config(config)
+    assert sim.counts['writeList'] == 1
+
+
+def test_failed_write_drops_the_shadow_copy(sim, sensor):
+    sensor.read_register(ZX_DRCFG)
+    sim.error_rate = 1.0
+    assert not sensor.enable_interrupts()
+    sim.error_rate = 0.0
+    reset_counts(sim)
+    assert sensor.read_register(ZX_DRCFG) == sim.regs[ZX_DRCFG]
+    assert sim.counts['readU8'] == 1
+
+
+def test_replay_config_after_brownout(sim, sensor):
+    sensor.configure(interrupt_type.ALL_INTERRUPTS)
+    expected = sim.regs[ZX_DRE], sim.regs[ZX_DRCFG]
+    sim.reset()
+    assert sim.regs[ZX_DRE] == 0
+    assert sensor.verify_config()
+    assert (sim.regs[ZX_DRE], sim.regs[ZX_DRCFG]) == expected
+
+
+# ===============
+# Snapshot decode
+# ===============
+
+def test_snapshot_decodes_one_block(sim, sensor):
+    sim.load([Frame(100, 40, gesture_type.UP_SWIPE, 7, 1 << STATUS_SWP)])
+    sim.step()
+    reset_counts(sim)
+    sample = sensor.read_snapshot()
+    assert sim.counts['readList'] == 1 and sim.transactions == 1
+    assert (sample.x, sample.z) == (100, 40)
+    assert sample.gesture == gesture_type.UP_SWIPE
+    assert sample.speed == 7
+    assert (sample.lrng, sample.rrng) == sim.ranges_for(100, 40)
+    assert sample.position_available and sample.gesture_available
+    assert sensor.read_x(sample) == 100
+    assert sensor.read_z(sample) == 40
+    assert sensor.read_gesture(sample) == gesture_type.UP_SWIPE
+
+
+def test_snapshot_without_object(sim, sensor):
+    sim.load([Frame()])
+    sim.step()
+    sample = sensor.read_snapshot()
+    assert sample.x == None and sample.z == None
+    assert not sample.position_available
+    assert sensor.read_ranges(sample) == (0, 0)
+
+
+def test_snapshot_read_error_returns_none(sim, sensor):
+    sim.error_rate = 1.0
+    assert sensor.read_snapshot() == None
+
+
+# ========
+# Wrappers
+# ========
+
+def test_wrappers_stack_and_come_off_in_any_order(sim, sensor):
+    metrics = sensor.enable_metrics()
+    trace = sensor.enable_trace()
+    resilience = sensor.enable_resilience(retries=0)
+    assert sensor.read_snapshot() != None
+    assert metrics.operation_counts['readList'] == 1
+    assert len(trace.records) == 1
+    assert resilience.transactions == 1
+
+    sensor.disable_trace()
+    assert sensor.trace == None
+    assert sensor.i2c is resilience
+    assert resilience.transport.transport is sim
+    sensor.disable_resilience()
+    assert sensor.i2c.transport is sim
+    sensor.disable_metrics()
+    assert sensor.i2c is sim
+
+    sensor.read_snapshot()
+    assert metrics.operation_counts['readList'] == 1
+    assert len(trace.records) == 1
+
+
+def test_trace_keeps_a_copy_of_written_lists(sim, sensor):
+    trace = sensor.enable_trace()
+    values = [1, 2, 3]
+    sensor.i2c.writeList(ZX_DRE, values)
+    values[0] = 99
+    assert trace.records[-1].value == [1, 2, 3]
+
+
+def test_enabling_twice_wraps_once(sim, sensor):
+    sensor.enable_metrics()
+    sensor.enable_metrics()
+    assert sensor.i2c.transport is sim
+
+
+def test_removing_a_missing_wrapper_is_harmless(sim, sensor):
+    sensor.enable_trace()
+    sensor.disable_metrics()
+    sensor.disable_resilience()
+    assert sensor.i2c.transport is sim
+
+
+def test_constructor_configures_interrupts():
+    sim = SimulatedZxSensor(frame_rate=None)
+    ZxSensor(interrupts=interrupt_type.POSITION_INTERRUPTS, active_high=False, i2c=sim)
+    assert sim.regs[ZX_DRE] == 1 << DRE_CRD
+    assert sim.regs[ZX_DRCFG] & (1 << DRCFG_EN)
+    assert not sim.regs[ZX_DRCFG] & (1 << DRCFG_POLARITY)
+
+
+def test_constructor_probes_versions_by_default(caplog):
+    sim = SimulatedZxSensor(frame_rate=None)
+    with caplog.at_level('INFO', logger='ZxSensor'):
+        ZxSensor(i2c=sim)
+    assert sim.counts['readU8'] == 2
+    assert 'model version {}'.format(ZX_MODEL_VER) in caplog.text
+
+
+def test_constructor_without_probe_or_configure_is_silent():
+    sim = SimulatedZxSensor(frame_rate=None)
+    ZxSensor(i2c=sim, probe=False, configure=False)
+    assert sim.transactions == 0
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
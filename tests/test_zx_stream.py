@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+""" SampleRing and ZxStream """
+
+# standard
+from __future__ import division, print_function
+import time
+# external
+import pytest
+# project
+from zxsensor.simulator import SimulatedZxSensor, move_frames
+from zxsensor.zx_stream import SampleRing, ZxStream
+
+
+def test_ring_drains_in_order():
+    ring = SampleRing(4)
+    assert ring.latest() == None
+    for i in range(3):
+        ring.push(i)
+    assert len(ring) == 3
+    assert ring.latest() == 2
+    assert ring.drain() == [0, 1, 2]
+    assert ring.drain() == []
+    assert ring.overflows == 0
+
+
+def test_ring_keeps_the_newest_on_overflow():
+    ring = SampleRing(4)
+    for i in range(10):
+        ring.push(i)
+    assert ring.drain() == [6, 7, 8, 9]
+    assert ring.overflows == 6
+
+
+def test_ring_counts_overflows_without_drain():
+    ring = SampleRing(4)
+    for i in range(10):
+        ring.push(i)
+    assert ring.latest() == 9
+    assert ring.overflows == 6
+
+
+def test_ring_wait_times_out():
+    ring = SampleRing(2)
+    assert not ring.wait(0.01)
+    ring.push(1)
+    assert ring.wait(0.01)
+
+
+def test_ring_rejects_empty_capacity():
+    with pytest.raises(ValueError):
+        SampleRing(0)
+
+
+def test_stream_samples_in_the_background(sensor):
+    sensor.i2c.loop = True
+    sensor.i2c.load(move_frames((20, 60), (220, 60), 20))
+    stream = sensor.start_streaming(200.0, buffer_size=64)
+    try:
+        deadline = time.monotonic() + 2.0
+        while (len(stream.ring) < 10) and (time.monotonic() < deadline):
+            time.sleep(0.01)
+    finally:
+        sensor.stop_streaming()
+    assert not stream.running
+    samples = stream.drain()
+    assert len(samples) >= 10
+    assert all(a.timestamp < b.timestamp for a, b in zip(samples, samples[1:]))
+    assert stream.errors == 0
+
+
+def test_stream_counts_read_errors():
+    from zxsensor import ZxSensor
+    sim = SimulatedZxSensor(frame_rate=None)
+    sensor = ZxSensor(i2c=sim)
+    sim.error_rate = 1.0
+    stream = ZxStream(sensor, 500.0)
+    stream.start()
+    time.sleep(0.05)
+    stream.stop()
+    assert stream.errors > 0
+    assert stream.latest() == None
+
+
+def test_stream_iterator_ends_on_stop(sensor):
+    stream = sensor.start_streaming(500.0)
+    seen = []
+    for sample in stream:
+        seen.append(sample)
+        if (len(seen) == 5):
+            stream.stop()
+    assert len(seen) >= 5
+
+
+def test_stream_rejects_bad_rate(sensor):
+    with pytest.raises(ValueError):
+        ZxStream(sensor, 0)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+""" ZxSensorUart over a pty, compared with the I2C path """
+
+# standard
+from __future__ import division, print_function
+import os
+import pty
+import tty
+# external
+import pytest
+# project
+from zxsensor import ZxSensor
+from zxsensor.i2c_registers import *
+from zxsensor.simulator import SimulatedZxSensor, Frame
+from zxsensor.zx_uart import ZxSensorUart, ZxUartParser
+
+
+@pytest.fixture
+def uart():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    reader = ZxSensorUart(os.fdopen(slave, 'rb', buffering=0))
+    yield master, reader
+    reader.close()
+    os.close(master)
+
+
+def position_message(x, z, lrng, rrng):
+    return bytes([ZX_UART_RANGES, lrng, rrng, ZX_UART_X, x, ZX_UART_Z, z])
+
+
+def gesture_message(gesture, speed):
+    return bytes([ZX_UART_GESTURE, gesture.value, speed])
+
+
+def test_position_frame(uart):
+    master, reader = uart
+    os.write(master, position_message(100, 40, 120, 80))
+    sample, = reader.read_samples()
+    assert (sample.x, sample.z, sample.lrng, sample.rrng) == (100, 40, 120, 80)
+    assert sample.position_available and not sample.gesture_available
+
+
+def test_frame_split_across_reads(uart):
+    master, reader = uart
+    message = position_message(30, 90, 200, 10) + gesture_message(gesture_type.LEFT_SWIPE, 12)
+    os.write(master, message[:5])
+    assert reader.read_samples() == []
+    os.write(master, message[5:8])
+    position, = reader.read_samples()
+    assert (position.x, position.z) == (30, 90)
+    os.write(master, message[8:])
+    gesture, = reader.read_samples()
+    assert gesture.gesture is gesture_type.LEFT_SWIPE
+    assert gesture.speed == 12
+    assert reader.parser.resyncs == 0
+
+
+def test_payload_bytes_may_look_like_headers(uart):
+    master, reader = uart
+    message = (position_message(ZX_UART_ID, 20, ZX_UART_X, ZX_UART_END) +
+               gesture_message(gesture_type.RIGHT_SWIPE, ZX_UART_RANGES) +
+               bytes([ZX_UART_ID, ZX_UART_Z, ZX_UART_GESTURE, ZX_UART_END]))
+    os.write(master, message)
+    samples = []
+    while (len(samples) < 2):
+        samples.extend(reader.read_samples())
+    position, gesture = samples
+    assert (position.lrng, position.rrng) == (ZX_UART_X, ZX_UART_END)
+    assert position.x == None and position.z == 20
+    assert gesture.gesture is gesture_type.RIGHT_SWIPE
+    assert gesture.speed == ZX_UART_RANGES
+    assert wait_id(reader) == (ZX_UART_Z, ZX_UART_GESTURE, ZX_UART_END)
+    assert reader.parser.resyncs == 0 and reader.parser.skipped == 0
+
+
+def wait_id(reader):
+    while (reader.sensor_id == None):
+        reader.read_samples()
+    return reader.sensor_id
+
+
+def test_resync_on_corrupted_frame(uart):
+    master, reader = uart
+    # the ranges frame lost a byte and swallows the X header, then stray payload
+    corrupted = bytes([ZX_UART_RANGES, 50, ZX_UART_X, 60, ZX_UART_Z, 70, 3, 4])
+    os.write(master, corrupted + position_message(10, 20, 30, 40))
+    samples = []
+    while (len(samples) < 2):
+        samples.extend(reader.read_samples())
+    assert [(s.x, s.z) for s in samples] == [(None, 70), (10, 20)]
+    assert (samples[0].lrng, samples[0].rrng) == (50, ZX_UART_X)
+    assert reader.parser.resyncs == 2
+    assert reader.parser.skipped == 3
+    assert (samples[-1].lrng, samples[-1].rrng) == (30, 40)
+
+
+def test_sensor_id(uart):
+    master, reader = uart
+    os.write(master, bytes([ZX_UART_ID, 1, 2, 3]))
+    assert reader.read_samples() == []
+    assert reader.sensor_id == (1, 2, 3)
+
+
+def test_matches_the_i2c_path(uart):
+    master, reader = uart
+    sim = SimulatedZxSensor(frame_rate=None)
+    sensor = ZxSensor(i2c=sim)
+    sim.load([Frame(150, 70), Frame(150, 70, gesture_type.RIGHT_SWIPE, 9, 1 << STATUS_SWP)])
+
+    sim.step()
+    position = sensor.read_snapshot()
+    sim.step()
+    gesture = sensor.read_snapshot()
+
+    os.write(master, position_message(position.x, position.z, position.lrng, position.rrng) +
+             gesture_message(gesture.gesture, gesture.speed))
+    samples = []
+    while (len(samples) < 2):
+        samples.extend(reader.read_samples())
+
+    fields = ('gesture', 'speed', 'x', 'z', 'lrng', 'rrng')
+    for via_uart, via_i2c in zip(samples, (position, gesture)):
+        assert [getattr(via_uart, f) for f in fields] == [getattr(via_i2c, f) for f in fields]
+        assert type(via_uart) is type(via_i2c)
+    # a UART message carries either a position or a gesture
+    assert samples[0].position_available and position.position_available
+    assert samples[1].gesture_available and gesture.gesture_available
+    assert samples[1].gesture is gesture.gesture
+
+
+def test_parser_reports_invalid_position():
+    parser = ZxUartParser()
+    sample, = parser.feed(bytes([ZX_UART_X, 241, ZX_UART_Z, 20]))
+    assert sample.x == None and sample.z == 20
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
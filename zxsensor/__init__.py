@@ -1,5 +1,50 @@
 
-from Adafruit_I2C import Adafruit_I2C
+from .Adafruit_I2C import Adafruit_I2C
 # project
-from i2c_registers import *
-from zx_sensor import ZxSensor
+from .i2c_registers import *
+from .zx_sensor import ZxSensor
+from .zx_sample import ZxSample, StatusFlags, decode_status
+from .register_map import ZxConfig, Field, Register, REGISTERS
+from .zx_stream import SampleRing, ZxStream
+from .i2c_bus import ZxBus, RoundRobinScheduler, get_bus
+from .transport import ZxTransport
+
+# Everything else is imported on first access, so `import zxsensor` only
+# pays for what a plain ZxSensor needs
+_LAZY = {
+    'zx_events': ('ZxEventEngine', 'ZxEvent', 'RangeEvent', 'PositionEvent', 'SwipeEvent',
+                  'HoverEvent', 'HoverMoveEvent', 'EdgeEvent', 'RPiGPIOPin', 'GpiochipPin',
+                  'SimulatedPin'),
+    'simulator': ('SimulatedZxSensor', 'Frame'),
+    'zx_uart': ('ZxSensorUart', 'ZxUartParser'),
+    'metrics': ('BusMetrics', 'InstrumentedTransport'),
+    'trace': ('BusTrace', 'TracingTransport'),
+    'gestures': ('GestureRecognizer', 'GestureDetector', 'RecognizedGesture', 'register_detector'),
+    'filters': ('MedianFilter', 'ExponentialFilter', 'OneEuroFilter', 'KalmanFilter', 'FilterChain',
+                'SampleFilter'),
+    'adaptive': ('AdaptivePoller',),
+    'errors': ('ZxError', 'ZxBusError', 'ZxTimeoutError', 'ZxCircuitOpenError'),
+    'resilient': ('ResilientTransport',),
+    'recording': ('RecordingWriter', 'RecordingTransport', 'Recording', 'ReplayTransport'),
+    'i2c_dev': ('I2cDevTransport',),
+    'position': ('PositionCalibration', 'PositionSolver', 'calibrate'),
+    'sensor_array': ('ZxSensorArray', 'SensorFusion', 'FusedSample'),
+    'presence': ('PresenceMonitor',),
+}
+_LAZY_NAMES = dict((name, module) for module, names in _LAZY.items() for name in names)
+# `from zxsensor import *` still gets everything
+__all__ = [name for name in globals() if not name.startswith('_')] + sorted(_LAZY_NAMES)
+
+
+def __getattr__(name):
+    module = _LAZY_NAMES.get(name)
+    if (module == None):
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from importlib import import_module
+    value = getattr(import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
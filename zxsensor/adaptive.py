@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+""" Adaptive sampling that follows the sensor's data-ready cadence
+
+A fixed rate poller either misses frames or spends bus transactions on
+reads that return nothing new. AdaptivePoller reads a snapshot, looks at
+STATUS and schedules the next read from what it saw:
+
+* DAV set: the interval between data-ready frames is learned (EMA) and
+  reads happen `oversample` times per learned period, so no frame is
+  overwritten before it is read
+* nothing new for `idle_after` seconds: back off exponentially up to
+  `max_interval`; the first DAV after that ramps straight back up
+
+Only samples carrying new data (DAV, SWP, HOVER or HVG) are stored.
+"""
+
+# standard
+from __future__ import division, print_function
+import threading
+import time
+# project
+from .i2c_registers import *
+from .zx_stream import ZxStream
+
+# STATUS bits that mean the snapshot carries something new
+_DATA_MASK = (1 << STATUS_DAV) | (1 << STATUS_SWP) | (1 << STATUS_HOVER) | (1 << STATUS_HVG)
+
+
+class AdaptivePoller(ZxStream):
+    """ ZxStream whose read interval adapts to the STATUS flags
+    """
+
+    def __init__(self, sensor, target_latency=0.05, max_rate_hz=200.0,
+                 max_interval=0.25, idle_after=0.25, backoff=2.0,
+                 oversample=2.0, buffer_size=1024):
+        """
+        Args:
+            sensor(:obj:`ZxSensor`): the sensor to sample
+            target_latency(:obj:`float`, optional): longest interval in
+                seconds between reads while a hand is present, whatever
+                the learned cadence. Defaults to 0.05
+            max_rate_hz(:obj:`float`, optional): power budget; reads never
+                happen more often than this. Defaults to 200
+            max_interval(:obj:`float`, optional): longest interval between
+                reads when idle, i.e. how late an object entering range
+                may be noticed. Defaults to 0.25
+            idle_after(:obj:`float`, optional): seconds without data after
+                which the poller backs off. Defaults to 0.25
+            backoff(:obj:`float`, optional): interval growth per idle read.
+                Defaults to 2
+            oversample(:obj:`float`, optional): reads per learned frame
+                period while a hand is present. Defaults to 2
+            buffer_size(:obj:`int`, optional): ring buffer capacity in
+                samples. Defaults to 1024
+        """
+        super(AdaptivePoller, self).__init__(sensor, max_rate_hz, buffer_size)
+        self.target_latency = max(target_latency, self.period)
+        self.max_interval = max(max_interval, self.target_latency)
+        self.idle_after = idle_after
+        self.backoff = backoff
+        self.oversample = oversample
+        # learned data-ready period, None until two frames were seen
+        self.cadence = None
+        self.idle = True
+        self.interval = self.target_latency
+        self.polls = 0
+        self.useful = 0
+        self._started = None
+        self._stopped = None
+        self._last_data = None
+        self._wakeup = threading.Event()
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.period, interval))
+
+    def _schedule(self, sample, now):
+        """Returns the delay until the next read"""
+        last = self._last_data
+        if (sample != None) and (sample.status & _DATA_MASK):
+            self._last_data = now
+            if (self.idle):
+                # something entered: poll fast until the cadence is known again
+                self.idle = False
+                return self.period
+            if (sample.position_available) and (last != None):
+                period = now - last
+                if (self.cadence == None):
+                    self.cadence = period
+                elif (period < 2.5 * self.cadence):
+                    # oversampling puts consecutive frames 1 -/+ 1/oversample
+                    # periods apart, the EMA averages that out. Longer gaps
+                    # are frames without an object and tell nothing
+                    self.cadence += 0.2 * (period - self.cadence)
+        elif (last == None) or (now - last >= self.idle_after):
+            if (not self.idle):
+                self.idle = True
+                self.interval = self.target_latency
+            self.interval = self._clamp(self.interval * self.backoff)
+            return self.interval
+        if (self.cadence == None):
+            return self.period
+        return self._clamp(min(self.target_latency, self.cadence / self.oversample))
+
+    def start(self):
+        self._wakeup.clear()
+        super(AdaptivePoller, self).start()
+
+    def stop(self, timeout=None):
+        self._running.clear()
+        self._wakeup.set()
+        super(AdaptivePoller, self).stop(timeout)
+
+    def _run(self):
+        self._started = time.monotonic()
+        self._last_data = None
+        while (self._running.is_set()):
+            sample = self.sensor.read_snapshot()
+            now = time.monotonic()
+            self.polls += 1
+            if (sample == None):
+                self.errors += 1
+            elif (sample.status & _DATA_MASK):
+                self.useful += 1
+                self.ring.push(sample)
+            delay = self._schedule(sample, now)
+            # an Event wait so stop() does not have to sit out a long backoff
+            self._wakeup.wait(max(0.0, now + delay - time.monotonic()))
+        self._stopped = time.monotonic()
+        self.logger.debug("adaptive poller stopped, %d polls, %d useful", self.polls, self.useful)
+
+    def report(self):
+        """Achieved rate versus bus transactions spent
+
+        Returns:
+            a dict with the polls (one bus transaction each), useful and
+            wasted polls, their rates, the learned cadence and errors
+        """
+        end = self._stopped or time.monotonic()
+        elapsed = end - self._started if self._started != None else 0.0
+        return {
+            'elapsed': elapsed,
+            'polls': self.polls,
+            'useful': self.useful,
+            'wasted': self.polls - self.useful - self.errors,
+            'errors': self.errors,
+            'poll_hz': self.polls / elapsed if elapsed else 0.0,
+            'sample_hz': self.useful / elapsed if elapsed else 0.0,
+            'efficiency': self.useful / self.polls if self.polls else 0.0,
+            'cadence_hz': 1.0 / self.cadence if self.cadence else None,
+            'idle': self.idle,
+        }
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
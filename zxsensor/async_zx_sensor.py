@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+""" asyncio interface for the zx_sensor
+
+All bus I/O runs in a single-threaded executor per I2C bus, so transactions
+on one bus are serialised while sensors on different buses, and the event
+loop itself, never wait for each other.
+"""
+
+# standard
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# project
+from .i2c_registers import *
+
+_bus_executors = {}
+_bus_executors_lock = threading.Lock()
+
+
+def bus_executor(busnum):
+    """Returns the executor that serialises all I/O on an I2C bus
+
+    Args:
+        busnum: the bus number, or any hashable key identifying the bus
+
+    Returns:
+        a ThreadPoolExecutor with a single worker, shared by every caller
+        asking for the same bus
+    """
+    with _bus_executors_lock:
+        executor = _bus_executors.get(busnum)
+        if (executor == None):
+            executor = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix='zx-i2c-{}'.format(busnum))
+            _bus_executors[busnum] = executor
+        return executor
+
+
+class AsyncZxSensor(object):
+    """ Awaitable wrapper around a ZxSensor
+    """
+
+    def __init__(self, sensor, executor=None, dr_channel=None, active_high=True, pin=None):
+        """
+        Args:
+            sensor(:obj:`ZxSensor`): the sensor to wrap
+            executor(:obj:`Executor`, optional): executor for bus I/O.
+                Defaults to the shared single-threaded executor of the
+                sensor's bus
+            dr_channel(:obj:`int`, optional): BCM GPIO number the DR pin is
+                wired to, read through RPiGPIOPin. If None and no pin is
+                given, wait_data_ready() polls STATUS instead
+            active_high(bool, optional): DR polarity as configured on the
+                sensor. Defaults to True
+            pin(:obj:`DrPin`, optional): backend for the DR pin, see
+                zx_events. Takes precedence over dr_channel
+        """
+        self.logger = logging.getLogger('AsyncZxSensor')
+        self.sensor = sensor
+        if (executor == None):
+            executor = bus_executor(getattr(sensor.i2c, 'busnum', id(sensor.i2c)))
+        self.executor = executor
+        self.dr_channel = dr_channel
+        self.active_high = active_high
+        if (pin == None) and (dr_channel != None):
+            from .zx_events import RPiGPIOPin
+            pin = RPiGPIOPin(dr_channel, active_high)
+        self.pin = pin
+        # set from the pin's thread on every edge
+        self._edge = None
+        self._edge_loop = None
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def read_snapshot(self):
+        """Awaitable ZxSensor.read_snapshot()"""
+        return await self._call(self.sensor.read_snapshot)
+
+    async def read_x(self):
+        """Awaitable ZxSensor.read_x()"""
+        return await self._call(self.sensor.read_x)
+
+    async def read_z(self):
+        """Awaitable ZxSensor.read_z()"""
+        return await self._call(self.sensor.read_z)
+
+    async def read_gesture(self):
+        """Awaitable ZxSensor.read_gesture()"""
+        return await self._call(self.sensor.read_gesture)
+
+    async def read_gesture_speed(self):
+        """Awaitable ZxSensor.read_gesture_speed()"""
+        return await self._call(self.sensor.read_gesture_speed)
+
+    async def clear_interrupts(self):
+        """Awaitable ZxSensor.clear_interrupts()"""
+        return await self._call(self.sensor.clear_interrupts)
+
+    async def wait_data_ready(self, timeout=None, poll_interval=0.01):
+        """Waits until the sensor signals new data
+
+        Blocks on a DR edge if a DR pin was given, otherwise polls the
+        STATUS register every poll_interval seconds. Polling reads STATUS,
+        which clears its gesture flags; use gestures() or read_snapshot()
+        to see them.
+
+        Args:
+            timeout(:obj:`float`, optional): seconds to wait. Forever if None
+            poll_interval(:obj:`float`, optional): STATUS poll period when no
+                DR pin is configured. Defaults to 0.01
+
+        Returns:
+            True if data is ready. False on timeout.
+        """
+        if (self.pin != None):
+            return await self._wait_dr_edge(timeout)
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout == None else loop.time() + timeout
+        while (True):
+            flags = await self._call(self._read_status)
+            if (flags != None) and (flags.dav or flags.swp or flags.hover or flags.hvg):
+                return True
+            if (deadline != None) and (loop.time() >= deadline):
+                return False
+            await asyncio.sleep(poll_interval)
+
+    def _read_status(self):
+        # under the sensor lock, so a poll never lands inside another
+        # thread's multi-transaction sequence
+        with self.sensor.lock:
+            return self.sensor.read_status()
+
+    def _start_pin(self, loop):
+        # the pin callback runs on the backend's thread
+        if (self._edge_loop is loop):
+            return
+        if (self._edge_loop != None):
+            self.pin.stop()
+        self._edge = asyncio.Event()
+        self._edge_loop = loop
+        edge = self._edge
+        self.pin.start(lambda: loop.call_soon_threadsafe(edge.set))
+        if (self.pin.is_asserted()):
+            # latched before we started listening, no edge will come
+            edge.set()
+
+    async def _wait_dr_edge(self, timeout):
+        self._start_pin(asyncio.get_running_loop())
+        try:
+            await asyncio.wait_for(self._edge.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._edge.clear()
+        return True
+
+    async def gestures(self, poll_interval=0.02):
+        """Asynchronously yields detected gestures
+
+        Each gesture is delivered as the ZxSample it was read in, so the
+        gesture type and speed come from the same sensor frame.
+
+        Without a DR pin the sensor is polled with read_snapshot() rather
+        than wait_data_ready(), whose STATUS read would clear the gesture
+        flags before the snapshot sees them.
+
+        Args:
+            poll_interval(:obj:`float`, optional): seconds between polls
+                when no DR pin is configured. Defaults to 0.02
+        """
+        while (True):
+            if (self.pin != None):
+                await self._wait_dr_edge(None)
+            sample = await self.read_snapshot()
+            if (sample == None) or (not sample.gesture_available):
+                if (self.pin == None):
+                    await asyncio.sleep(poll_interval)
+                continue
+            if (sample.gesture != gesture_type.NO_GESTURE):
+                yield sample
+
+    def close(self):
+        """Stops edge detection on the DR pin. The shared bus executor is
+        left running for other sensors on the bus.
+        """
+        if (self._edge_loop != None):
+            self.pin.stop()
+            self._edge = None
+            self._edge_loop = None
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks for the ZxSensor API against a simulated bus
+
+Run with:
+
+    python -m zxsensor.bench --latency 200 --iterations 2000 -o bench.json
+
+Every benchmark reports throughput, p50/p99 latency and the exact number of
+bus transactions per call. Results are emitted as JSON so runs can be
+compared across commits.
+"""
+
+# standard
+from __future__ import division, print_function
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+# project
+from .i2c_registers import *
+from .filters import MedianFilter, ExponentialFilter, OneEuroFilter, KalmanFilter
+from .simulator import SimulatedZxSensor, Frame, idle_frames, move_frames
+from .zx_sensor import ZxSensor
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if (not sorted_values):
+        return 0.0
+    return sorted_values[int(round(q * (len(sorted_values) - 1)))]
+
+
+def summarize(name, durations, transactions, calls, **extra):
+    """Builds the result record of one benchmark
+
+    Args:
+        name(:obj:`str`): benchmark name
+        durations(list): per-call durations in seconds
+        transactions(:obj:`int`): bus transactions spent on all calls
+        calls(:obj:`int`): number of API calls measured
+        **extra: additional fields for the record
+    """
+    durations = sorted(durations)
+    total = sum(durations)
+    result = {
+        'name': name,
+        'calls': calls,
+        'ops_per_sec': calls / total if total else 0.0,
+        'mean_us': total / len(durations) * 1e6 if durations else 0.0,
+        'p50_us': percentile(durations, 0.50) * 1e6,
+        'p99_us': percentile(durations, 0.99) * 1e6,
+        'transactions_per_call': transactions / calls if calls else 0.0,
+    }
+    result.update(extra)
+    return result
+
+
+def bench_call(name, sim, func, iterations):
+    """Times `func(i)` for i in range(iterations) and counts the bus
+    transactions it causes on `sim`
+    """
+    clock = time.perf_counter
+    durations = [0.0] * iterations
+    before = sim.transactions
+    for i in range(iterations):
+        start = clock()
+        func(i)
+        durations[i] = clock() - start
+    return summarize(name, durations, sim.transactions - before, iterations)
+
+
+def make_sensor(latency):
+    """Returns a (ZxSensor, SimulatedZxSensor) pair with a hand hovering in
+    front of the sensor
+    """
+    sim = SimulatedZxSensor(frames=[Frame(120, 60)], frame_rate=None, latency=latency)
+    sim.step()
+    return ZxSensor(i2c=sim), sim
+
+
+def call_benchmarks(latency, iterations):
+    """Per-call benchmarks of the public API"""
+    sensor, sim = make_sensor(latency)
+    results = []
+
+    def per_field_sample(i):
+        if (sensor.position_available()):
+            sensor.read_x()
+            sensor.read_z()
+        sensor.read_gesture()
+        sensor.read_gesture_speed()
+
+    def snapshot_sample(i):
+        snapshot = sensor.read_snapshot()
+        if (sensor.position_available(snapshot)):
+            sensor.read_x(snapshot)
+            sensor.read_z(snapshot)
+        sensor.read_gesture(snapshot)
+        sensor.read_gesture_speed(snapshot)
+
+    def toggle_bit(i):
+        if (i % 2):
+            sensor.clear_register_bit(ZX_DRCFG, DRCFG_FORCE)
+        else:
+            sensor.set_register_bit(ZX_DRCFG, DRCFG_FORCE)
+
+    def uncached_bit(i):
+        sensor.invalidate_register_cache()
+        toggle_bit(i)
+
+    cases = [
+        ('constructor', lambda i: ZxSensor(i2c=sim)),
+        ('read_x', lambda i: sensor.read_x()),
+        ('read_z', lambda i: sensor.read_z()),
+        ('read_gesture', lambda i: sensor.read_gesture()),
+        ('read_gesture_speed', lambda i: sensor.read_gesture_speed()),
+        ('position_available', lambda i: sensor.position_available()),
+        ('set_register_bit', toggle_bit),
+        ('set_register_bit_uncached', uncached_bit),
+        ('read_snapshot', lambda i: sensor.read_snapshot()),
+        ('sample_per_field', per_field_sample),
+        ('sample_snapshot', snapshot_sample),
+    ]
+    for name, func in cases:
+        results.append(bench_call(name, sim, func, iterations))
+    return results
+
+
+def streaming_benchmark(latency, duration, rate_hz=10000):
+    """Runs start_streaming() flat out and reports the achieved rate and
+    the sample-to-sample interval distribution
+    """
+    sensor, sim = make_sensor(latency)
+    before = sim.transactions
+    stream = sensor.start_streaming(rate_hz, buffer_size=int(rate_hz * duration) + 1)
+    time.sleep(duration)
+    sensor.stop_streaming()
+    transactions = sim.transactions - before
+    samples = stream.drain()
+    intervals = [b.timestamp - a.timestamp for a, b in zip(samples, samples[1:])]
+    result = summarize('streaming', intervals, transactions, len(samples),
+                       target_hz=rate_hz, overflows=stream.overflows,
+                       errors=stream.errors)
+    # for a stream the throughput is samples per wall clock second
+    result['ops_per_sec'] = len(samples) / duration
+    return result
+
+
+def adaptive_benchmark(latency, duration, frame_rate=50.0, fixed_hz=100.0):
+    """Fixed rate streaming against the AdaptivePoller on a scripted hand
+    that is present for the middle half of the run
+
+    Reports frames delivered against bus transactions spent for both.
+    """
+    count = int(frame_rate * duration)
+    frames = idle_frames(count // 4) + move_frames((20, 60), (220, 60), count // 2) + \
+        idle_frames(count - count // 4 - count // 2)
+    results = []
+    for name in ('sampling_fixed', 'sampling_adaptive'):
+        sim = SimulatedZxSensor(frame_rate=frame_rate, latency=latency)
+        sensor = ZxSensor(i2c=sim)
+        sim.load(frames)
+        before = sim.transactions
+        if (name == 'sampling_fixed'):
+            stream = sensor.start_streaming(fixed_hz)
+        else:
+            stream = sensor.start_adaptive_streaming()
+        time.sleep(duration)
+        sensor.stop_streaming()
+        transactions = sim.transactions - before
+        delivered = len([s for s in stream.drain() if s.position_available])
+        result = summarize(name, [], transactions, max(1, delivered),
+                           frames_available=count // 2, frames_delivered=delivered)
+        result['ops_per_sec'] = delivered / duration
+        if (name == 'sampling_adaptive'):
+            result['cadence_hz'] = stream.report()['cadence_hz']
+        results.append(result)
+    return results
+
+
+_IMPORT_SCRIPT = ("import time; start = time.perf_counter(); import zxsensor; "
+                  "print(time.perf_counter() - start)")
+
+
+def startup_benchmarks(latency, iterations, imports=10):
+    """Import time of the package in a fresh interpreter, and the cost of
+    constructing a ZxSensor with the full, the default and a deferred
+    handshake on a freshly powered (simulated) device
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    durations = []
+    for i in range(imports):
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT], cwd=root)
+        durations.append(float(output.decode().strip()))
+    results = [summarize('import', durations, 0, imports)]
+
+    clock = time.perf_counter
+    cases = [
+        ('construct', dict()),
+        ('construct_no_probe', dict(probe=False)),
+        ('construct_deferred', dict(probe=False, configure=False)),
+    ]
+    for name, kwargs in cases:
+        durations = [0.0] * iterations
+        transactions = 0
+        for i in range(iterations):
+            sim = SimulatedZxSensor(frames=[Frame(120, 60)], frame_rate=None, latency=latency)
+            start = clock()
+            ZxSensor(interrupts=interrupt_type.GESTURE_INTERRUPTS, i2c=sim, **kwargs)
+            durations[i] = clock() - start
+            transactions += sim.transactions
+        results.append(summarize(name, durations, transactions, iterations))
+    return results
+
+
+def fault_benchmark(latency, iterations, error_rate=0.05):
+    """Snapshot reads on a bus that fails `error_rate` of all transactions,
+    with and without enable_resilience()
+    """
+    results = []
+    for name in ('faults_plain', 'faults_resilient'):
+        sim = SimulatedZxSensor(frames=[Frame(120, 60)], frame_rate=None,
+                                latency=latency, seed=1)
+        sim.step()
+        sensor = ZxSensor(i2c=sim)
+        resilience = sensor.enable_resilience(seed=1) if name == 'faults_resilient' else None
+        sim.error_rate = error_rate
+        failed = [0]
+
+        def read(i):
+            if (sensor.read_snapshot() == None):
+                failed[0] += 1
+
+        # the logger would dominate the timings
+        level = sensor.logger.level
+        sensor.logger.setLevel(logging.CRITICAL)
+        result = bench_call(name, sim, read, iterations)
+        sensor.logger.setLevel(level)
+        result['error_rate'] = error_rate
+        result['failed_reads'] = failed[0]
+        if (resilience != None):
+            result['resilience'] = resilience.report()
+        results.append(result)
+    return results
+
+
+def filter_lag(stage, rate_hz=100.0, speed=100.0, count=200):
+    """Steady state lag of a filter stage on a ramp input
+
+    Feeds a position moving at `speed` units per second and converts the
+    final distance between input and output into seconds.
+    """
+    stage.reset()
+    dt = 1.0 / rate_hz
+    output = None
+    for i in range(count):
+        output = stage.update(i * dt, speed * i * dt)
+    return (speed * (count - 1) * dt - output) / speed
+
+
+def filter_benchmarks(iterations, rate_hz=100.0):
+    """Per-sample cost and added signal lag of every filter stage"""
+    stages = [
+        ('filter_median5', MedianFilter(5)),
+        ('filter_exponential', ExponentialFilter(0.5)),
+        ('filter_one_euro', OneEuroFilter()),
+        ('filter_kalman', KalmanFilter()),
+    ]
+    clock = time.perf_counter
+    dt = 1.0 / rate_hz
+    results = []
+    for name, stage in stages:
+        stage.reset()
+        durations = [0.0] * iterations
+        for i in range(iterations):
+            # a jittery hand at rest
+            value = 120 + (i * 7) % 5
+            start = clock()
+            stage.update(i * dt, value)
+            durations[i] = clock() - start
+        results.append(summarize(name, durations, 0, iterations,
+                                 lag_ms=filter_lag(stage, rate_hz) * 1e3,
+                                 sample_rate_hz=rate_hz))
+    return results
+
+
+def run(latency=0.0, iterations=1000, duration=1.0):
+    """Runs all benchmarks
+
+    Args:
+        latency(:obj:`float`, optional): simulated seconds per bus
+            transaction. Defaults to 0
+        iterations(:obj:`int`, optional): calls per API benchmark
+        duration(:obj:`float`, optional): seconds per streaming benchmark
+
+    Returns:
+        a JSON serialisable dict
+    """
+    results = startup_benchmarks(latency, iterations)
+    results.extend(call_benchmarks(latency, iterations))
+    results.append(streaming_benchmark(latency, duration))
+    results.extend(adaptive_benchmark(latency, max(duration, 2.0)))
+    results.extend(fault_benchmark(latency, iterations))
+    results.extend(filter_benchmarks(iterations))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'latency_us': latency * 1e6,
+            'iterations': iterations,
+            'time': time.time(),
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zxsensor.bench',
+                                     description=__doc__.splitlines()[0].strip())
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated bus latency per transaction in microseconds')
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='calls per API benchmark')
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help='seconds per streaming benchmark')
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    report = run(args.latency / 1e6, args.iterations, args.duration)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if (args.output):
+        with open(args.output, 'w') as outfile:
+            outfile.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+""" Sensor daemon sharing one zx_sensor with many local processes
+
+The daemon owns the bus and is the only process reading the sensor. It
+publishes every sample into a shared memory ring and every gesture as a
+JSON line on a Unix domain socket:
+
+    python -m zxsensor.daemon --rate 100 --name zxsensor --socket /tmp/zxsensor.sock
+
+Consumers attach with ZxSampleReader (samples) and ZxGestureClient
+(gestures); adding consumers adds no bus traffic.
+
+Shared memory layout, little endian: a 64 byte header (magic, version,
+capacity, slot size, number of samples written) followed by `capacity`
+slots. Every slot is a seqlock sequence number followed by one sample.
+The writer makes the sequence odd, writes the sample and makes it even
+again; a reader copies the slot and accepts it if the sequence was the
+same even number before and after. Reading is struct.unpack_from on the
+mapped buffer, without syscalls or locks.
+"""
+
+# standard
+from __future__ import division, print_function
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+# project
+from .i2c_registers import *
+from .zx_sample import ZxSample, decode_gesture, decode_position
+
+SHM_MAGIC = b'ZXSM'
+SHM_VERSION = 1
+# magic, version, capacity, slot size, samples written
+_HEADER = struct.Struct('<4sIIIQ')
+_HEADER_SIZE = 64
+_WRITTEN_OFFSET = 16
+_SEQ = struct.Struct('<Q')
+# timestamp, status, gesture, speed, x, z, lrng, rrng, padding
+_SAMPLE = struct.Struct('<dBBBBBBBx')
+_SLOT_SIZE = _SEQ.size + _SAMPLE.size
+
+_GESTURE_MASK = (1 << STATUS_SWP) | (1 << STATUS_HOVER) | (1 << STATUS_HVG)
+
+DEFAULT_NAME = 'zxsensor'
+DEFAULT_SOCKET = '/tmp/zxsensor.sock'
+
+
+def _attach(name):
+    """Opens an existing segment without handing it to the resource
+    tracker, which would unlink it when this process exits
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+# ==================
+# Shared memory ring
+# ==================
+
+class SharedSampleRing(object):
+    """ Single writer, many reader sample ring in shared memory
+    """
+
+    def __init__(self, name=DEFAULT_NAME, capacity=4096, create=False):
+        """
+        Args:
+            name(:obj:`str`, optional): shared memory segment name
+            capacity(:obj:`int`, optional): number of slots when creating.
+                Defaults to 4096
+            create(bool, optional): create the segment (the daemon) instead
+                of attaching to it (clients). Defaults to False
+        """
+        self.name = name
+        self.owner = create
+        if (create):
+            if (capacity < 1):
+                raise ValueError("capacity must be at least 1")
+            size = _HEADER_SIZE + capacity * _SLOT_SIZE
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # left behind by a daemon that was killed
+                stale = _attach(name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.buf = self.shm.buf
+            _HEADER.pack_into(self.buf, 0, SHM_MAGIC, SHM_VERSION, capacity, _SLOT_SIZE, 0)
+        else:
+            self.shm = _attach(name)
+            self.buf = self.shm.buf
+            magic, version, capacity, slot_size, _ = _HEADER.unpack_from(self.buf, 0)
+            if (magic != SHM_MAGIC) or (version != SHM_VERSION) or (slot_size != _SLOT_SIZE):
+                self.close()
+                raise ValueError("{} is not a zxsensor sample ring".format(name))
+        self.capacity = capacity
+
+    @property
+    def written(self):
+        """Number of samples published so far"""
+        return _SEQ.unpack_from(self.buf, _WRITTEN_OFFSET)[0]
+
+    def publish(self, sample):
+        """Writes a ZxSample into the next slot. Daemon only."""
+        buf = self.buf
+        n = _SEQ.unpack_from(buf, _WRITTEN_OFFSET)[0]
+        offset = _HEADER_SIZE + (n % self.capacity) * _SLOT_SIZE
+        _SEQ.pack_into(buf, offset, 2 * n + 1)
+        _SAMPLE.pack_into(buf, offset + _SEQ.size, sample.timestamp, sample.status,
+                          sample.gesture.value, sample.speed,
+                          ZX_ERROR if sample.x == None else int(sample.x),
+                          ZX_ERROR if sample.z == None else int(sample.z),
+                          sample.lrng, sample.rrng)
+        _SEQ.pack_into(buf, offset, 2 * n + 2)
+        _SEQ.pack_into(buf, _WRITTEN_OFFSET, n + 1)
+
+    def read(self, n):
+        """Reads sample number n
+
+        Returns:
+            the ZxSample, None if it has been overwritten or is not written
+            yet
+        """
+        buf = self.buf
+        offset = _HEADER_SIZE + (n % self.capacity) * _SLOT_SIZE
+        expected = 2 * n + 2
+        if (_SEQ.unpack_from(buf, offset)[0] != expected):
+            return None
+        fields = _SAMPLE.unpack_from(buf, offset + _SEQ.size)
+        if (_SEQ.unpack_from(buf, offset)[0] != expected):
+            # the writer lapped us while copying
+            return None
+        timestamp, status, gesture, speed, x, z, lrng, rrng = fields
+        return ZxSample(timestamp, status, decode_gesture(gesture), speed,
+                        decode_position(x, MAX_X), decode_position(z, MAX_Z), lrng, rrng)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if (self.owner):
+            self.shm.unlink()
+
+
+class ZxSampleReader(object):
+    """ Client side of the shared memory ring
+
+    Every reader keeps its own cursor, so any number of processes can
+    consume the same samples independently.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, from_start=False):
+        """
+        Args:
+            name(:obj:`str`, optional): shared memory segment name
+            from_start(bool, optional): also return the samples already in
+                the ring. Defaults to False, only new samples
+        """
+        self.ring = SharedSampleRing(name)
+        written = self.ring.written
+        self._cursor = max(0, written - self.ring.capacity) if from_start else written
+        # samples overwritten before this reader got to them
+        self.missed = 0
+
+    def latest(self):
+        """Returns the most recent sample, None if there is none"""
+        written = self.ring.written
+        while (written > 0):
+            sample = self.ring.read(written - 1)
+            if (sample != None):
+                return sample
+            # being rewritten right now, the next one is complete
+            written = self.ring.written
+        return None
+
+    def read_new(self):
+        """Returns all samples published since the previous call, oldest
+        first
+        """
+        ring = self.ring
+        written = ring.written
+        start = self._cursor
+        if (written - start > ring.capacity):
+            self.missed += written - start - ring.capacity
+            start = written - ring.capacity
+        samples = []
+        for n in range(start, written):
+            sample = ring.read(n)
+            if (sample == None):
+                self.missed += 1
+            else:
+                samples.append(sample)
+        self._cursor = written
+        return samples
+
+    def samples(self, poll_interval=0.005):
+        """Yields new samples forever, polling the ring
+
+        Args:
+            poll_interval(:obj:`float`, optional): sleep in seconds when
+                nothing new was published. Defaults to 0.005
+        """
+        while (True):
+            samples = self.read_new()
+            if (not samples):
+                time.sleep(poll_interval)
+            for sample in samples:
+                yield sample
+
+    def __iter__(self):
+        return self.samples()
+
+    def close(self):
+        self.ring.close()
+
+
+# ===============
+# Gesture channel
+# ===============
+
+def gesture_message(timestamp, gesture, x, z, source, **extra):
+    """Encodes a gesture as one JSON line
+
+    Args:
+        timestamp(float): time of the sample carrying the gesture
+        gesture(gesture_type): the gesture
+        x(int): X position, None if unknown
+        z(int): Z position, None if unknown
+        source(:obj:`str`): 'sensor' or 'host'
+        **extra: e.g. speed or duration
+    """
+    message = {'timestamp': timestamp, 'gesture': gesture.name, 'x': x, 'z': z, 'source': source}
+    message.update(extra)
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+class GestureBroadcaster(object):
+    """ Unix domain socket server sending every gesture to all clients
+
+    Clients that do not keep up are disconnected rather than slowing the
+    daemon down.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.logger = logging.getLogger('ZxDaemon')
+        self.path = path
+        if (os.path.exists(path)):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(8)
+        self.clients = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._accept, name='ZxDaemon.accept')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _accept(self):
+        while (True):
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                # server socket closed
+                return
+            client.setblocking(False)
+            with self._lock:
+                self.clients.append(client)
+            self.logger.info("gesture client connected, %d total", len(self.clients))
+
+    def send(self, message):
+        with self._lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(message)
+                except (OSError, socket.error):
+                    self.clients.remove(client)
+                    client.close()
+                    self.logger.info("gesture client dropped, %d left", len(self.clients))
+
+    def close(self):
+        self.server.close()
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+        if (os.path.exists(self.path)):
+            os.unlink(self.path)
+
+
+class ZxGestureClient(object):
+    """ Receives the daemon's gesture messages
+
+    Iterating yields one dict per gesture with the keys timestamp, gesture
+    (a gesture_type name), x, z, source ('sensor' or 'host') and speed
+    (sensor swipes) or duration (host gestures).
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.sock.settimeout(timeout)
+        self._file = self.sock.makefile('rb')
+
+    def __iter__(self):
+        for line in self._file:
+            yield json.loads(line.decode('utf-8'))
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+
+# ======
+# Daemon
+# ======
+
+class ZxDaemon(object):
+    """ Reads one sensor and publishes its samples and gestures
+    """
+
+    def __init__(self, sensor, name=DEFAULT_NAME, socket_path=DEFAULT_SOCKET,
+                 capacity=4096, rate_hz=None, recognizer=None):
+        """
+        Args:
+            sensor(:obj:`ZxSensor`): the sensor to own
+            name(:obj:`str`, optional): shared memory segment name
+            socket_path(:obj:`str`, optional): gesture socket path
+            capacity(:obj:`int`, optional): samples in the shared ring
+            rate_hz(:obj:`float`, optional): fixed sample rate. Defaults to
+                None, adaptive sampling
+            recognizer(:obj:`GestureRecognizer`, optional): also publish
+                host detected gestures
+        """
+        self.logger = logging.getLogger('ZxDaemon')
+        self.sensor = sensor
+        self.rate_hz = rate_hz
+        self.recognizer = recognizer
+        self.ring = SharedSampleRing(name, capacity, create=True)
+        self.broadcaster = GestureBroadcaster(socket_path)
+        self.published = 0
+        self.gestures = 0
+        self._stream = None
+        self._running = False
+
+    def _send(self, message):
+        self.broadcaster.send(message)
+        self.gestures += 1
+
+    def _publish(self, sample):
+        self.ring.publish(sample)
+        self.published += 1
+        status = sample.status
+        if (status & _GESTURE_MASK):
+            # GESTURE keeps the last swipe, it is only new with SWP
+            if (status & (1 << STATUS_SWP)) and (sample.gesture != gesture_type.NO_GESTURE):
+                self._send(gesture_message(sample.timestamp, sample.gesture, sample.x,
+                                           sample.z, 'sensor', speed=sample.speed))
+            if (status & (1 << STATUS_HOVER)):
+                self._send(gesture_message(sample.timestamp, gesture_type.HOVER,
+                                           sample.x, sample.z, 'sensor'))
+            if (status & (1 << STATUS_HVG)):
+                self._send(gesture_message(sample.timestamp, gesture_type.HOVER_MOVE,
+                                           sample.x, sample.z, 'sensor'))
+        if (self.recognizer != None):
+            for gesture in self.recognizer.update(sample):
+                self._send(gesture_message(gesture.timestamp, gesture.gesture, gesture.x,
+                                           gesture.z, 'host', duration=gesture.duration))
+
+    def serve_forever(self):
+        """Publishes samples until stop() is called"""
+        if (self.rate_hz == None):
+            self._stream = self.sensor.start_adaptive_streaming()
+        else:
+            self._stream = self.sensor.start_streaming(self.rate_hz)
+        self._running = True
+        self.logger.info("publishing to shared memory %s and socket %s",
+                         self.ring.name, self.broadcaster.path)
+        try:
+            for sample in self._stream:
+                self._publish(sample)
+                if (not self._running):
+                    break
+        finally:
+            self.sensor.stop_streaming()
+
+    def stop(self):
+        self._running = False
+        if (self._stream != None):
+            self._stream.stop()
+
+    def close(self):
+        self.stop()
+        self.broadcaster.close()
+        self.ring.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zxsensor.daemon',
+                                     description=__doc__.splitlines()[0].strip())
+    parser.add_argument('--address', type=lambda v: int(v, 0), default=0x10,
+                        help='i2c address of the sensor')
+    parser.add_argument('--bus', type=int, default=-1, help='i2c bus number')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='fixed sample rate in Hz, adaptive if omitted')
+    parser.add_argument('--name', default=DEFAULT_NAME, help='shared memory name')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='gesture socket path')
+    parser.add_argument('--capacity', type=int, default=4096, help='samples kept in shared memory')
+    parser.add_argument('--host-gestures', action='store_true',
+                        help='also publish gestures detected on the host')
+    parser.add_argument('--i2c-dev', action='store_true',
+                        help='talk to /dev/i2c-N through ioctls instead of smbus')
+    parser.add_argument('--simulate', action='store_true',
+                        help='use a simulated sensor instead of the bus')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    # project (imported here to keep the client side light)
+    from .zx_sensor import ZxSensor
+    if (args.simulate):
+        from .simulator import SimulatedZxSensor, idle_frames, swipe_frames, hover_frames
+        frames = idle_frames(25) + swipe_frames(gesture_type.RIGHT_SWIPE) + \
+            hover_frames(120, 80, 50) + swipe_frames(gesture_type.LEFT_SWIPE)
+        i2c = SimulatedZxSensor(args.address, frames, loop=True)
+    elif (args.i2c_dev):
+        from .i2c_dev import I2cDevTransport
+        i2c = I2cDevTransport(args.address, args.bus)
+    else:
+        from .i2c_bus import get_bus
+        i2c = get_bus(args.bus).device(args.address)
+    sensor = ZxSensor(args.address, i2c=i2c)
+    recognizer = None
+    if (args.host_gestures):
+        from .gestures import GestureRecognizer
+        recognizer = GestureRecognizer()
+
+    daemon = ZxDaemon(sensor, args.name, args.socket, args.capacity, args.rate, recognizer)
+
+    def shutdown(signum, frame):
+        daemon.stop()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+""" Exceptions raised by the resilient transport layer
+
+All of them derive from IOError, so code catching the IOErrors of smbus
+keeps working.
+"""
+
+# standard
+from __future__ import division, print_function
+
+
+class ZxError(IOError):
+    """ Base class of all zxsensor bus errors
+    """
+
+
+class ZxBusError(ZxError):
+    """ A transaction still failed after all retries
+
+    Attributes:
+        op(str): transport method, e.g. 'readU8'
+        reg(int): first register of the transaction
+        attempts(int): number of attempts made
+        cause: the last error reported by the transport, if any
+    """
+
+    def __init__(self, op, reg, attempts, cause=None):
+        super(ZxBusError, self).__init__(
+            "{} of register 0x{:02X} failed after {} attempt(s): {}".format(op, reg, attempts, cause))
+        self.op = op
+        self.reg = reg
+        self.attempts = attempts
+        self.cause = cause
+
+
+class ZxTimeoutError(ZxBusError):
+    """ The retries of a transaction ran out of their time budget
+    """
+
+
+class ZxCircuitOpenError(ZxError):
+    """ The device failed too often; transactions are refused until the
+    circuit breaker lets a trial through again
+
+    Attributes:
+        retry_in(float): seconds until the next trial transaction
+    """
+
+    def __init__(self, address, retry_in):
+        super(ZxCircuitOpenError, self).__init__(
+            "circuit open for device 0x{:02X}, retry in {:.3f}s".format(address or 0, retry_in))
+        self.retry_in = retry_in
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
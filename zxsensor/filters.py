@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+""" Streaming filter stages for smoothing X/Z positions
+
+Every stage works on one axis: update(t, value) takes the sample time in
+seconds and the position, and returns the filtered position. A dropout (no
+object in range or a failed read) is passed as None instead of the ZX_ERROR
+sentinel. Stages return None for a dropout, except KalmanFilter which keeps
+predicting for up to `max_dropouts` samples. After more than `max_dropouts`
+consecutive dropouts every stage starts over, so a hand entering again is
+not smoothed against where the last one left.
+
+All state is allocated in the constructor and the work per sample is
+constant. Stages are chained with FilterChain; SampleFilter runs one chain
+per axis over ZxSamples.
+"""
+
+# standard
+from __future__ import division, print_function
+from bisect import bisect_left, insort
+import copy
+import math
+
+
+class Filter(object):
+    """ Base class of the single axis filter stages
+    """
+
+    def __init__(self, max_dropouts=0):
+        """
+        Args:
+            max_dropouts(:obj:`int`, optional): consecutive dropouts the
+                state survives. Defaults to 0
+        """
+        self.max_dropouts = max_dropouts
+        self._dropouts = 0
+
+    def reset(self):
+        self._dropouts = 0
+
+    def update(self, t, value):
+        """Filters one value
+
+        Args:
+            t(:obj:`float`): sample time in seconds
+            value(:obj:`float`): the raw value, None for a dropout
+
+        Returns:
+            the filtered value, None if there is none
+        """
+        if (value == None):
+            self._dropouts += 1
+            if (self._dropouts > self.max_dropouts):
+                self.reset()
+                return None
+            return self._missing(t)
+        self._dropouts = 0
+        return self._filter(t, value)
+
+    def _missing(self, t):
+        return None
+
+    def _filter(self, t, value):
+        raise NotImplementedError
+
+
+class MedianFilter(Filter):
+    """ Median of the last `size` values; removes single sample spikes
+    """
+
+    def __init__(self, size=5, max_dropouts=0):
+        """
+        Args:
+            size(:obj:`int`, optional): window length. Defaults to 5
+            max_dropouts(:obj:`int`, optional): see Filter
+        """
+        super(MedianFilter, self).__init__(max_dropouts)
+        if (size < 1):
+            raise ValueError("size must be at least 1")
+        self.size = size
+        # arrival order, to know which value leaves the window
+        self._window = [0.0] * size
+        # the values in the window, kept sorted in place
+        self._sorted = []
+        self.reset()
+
+    def reset(self):
+        super(MedianFilter, self).reset()
+        self._count = 0
+        self._index = 0
+        del self._sorted[:]
+
+    def _filter(self, t, value):
+        ordered = self._sorted
+        if (self._count == self.size):
+            del ordered[bisect_left(ordered, self._window[self._index])]
+        else:
+            self._count += 1
+        insort(ordered, value)
+        self._window[self._index] = value
+        self._index = (self._index + 1) % self.size
+        count = self._count
+        if (count % 2):
+            return ordered[count // 2]
+        return (ordered[count // 2 - 1] + ordered[count // 2]) / 2
+
+
+class ExponentialFilter(Filter):
+    """ Single pole low pass: y += alpha * (x - y)
+    """
+
+    def __init__(self, alpha=0.5, max_dropouts=0):
+        """
+        Args:
+            alpha(:obj:`float`, optional): weight of the newest value, 0-1.
+                Defaults to 0.5
+            max_dropouts(:obj:`int`, optional): see Filter
+        """
+        super(ExponentialFilter, self).__init__(max_dropouts)
+        if (not 0 < alpha <= 1):
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        super(ExponentialFilter, self).reset()
+        self._value = None
+
+    def _filter(self, t, value):
+        if (self._value == None):
+            self._value = float(value)
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+
+def _smoothing_factor(dt, cutoff):
+    r = 2 * math.pi * cutoff * dt
+    return r / (r + 1)
+
+
+class OneEuroFilter(Filter):
+    """ Speed adaptive low pass (Casiez et al., CHI 2012)
+
+    Slow movements are smoothed hard to remove jitter, fast movements
+    raise the cutoff to keep the lag low.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.05, d_cutoff=1.0, max_dropouts=0):
+        """
+        Args:
+            min_cutoff(:obj:`float`, optional): cutoff in Hz at rest.
+                Defaults to 1.0
+            beta(:obj:`float`, optional): cutoff increase per unit/s of
+                speed. Defaults to 0.05
+            d_cutoff(:obj:`float`, optional): cutoff in Hz of the speed
+                estimate. Defaults to 1.0
+            max_dropouts(:obj:`int`, optional): see Filter
+        """
+        super(OneEuroFilter, self).__init__(max_dropouts)
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        super(OneEuroFilter, self).reset()
+        self._t = None
+        self._value = None
+        self._speed = 0.0
+
+    def _filter(self, t, value):
+        if (self._t == None) or (t <= self._t):
+            if (self._t == None):
+                self._value = float(value)
+            self._t = t
+            return self._value
+        dt = t - self._t
+        self._t = t
+        speed = (value - self._value) / dt
+        self._speed += _smoothing_factor(dt, self.d_cutoff) * (speed - self._speed)
+        cutoff = self.min_cutoff + self.beta * abs(self._speed)
+        self._value += _smoothing_factor(dt, cutoff) * (value - self._value)
+        return self._value
+
+
+class KalmanFilter(Filter):
+    """ Constant velocity Kalman filter
+
+    The state is position and velocity; only the position is measured.
+    During dropouts the position is extrapolated with the last velocity.
+    """
+
+    def __init__(self, process_noise=500.0, measurement_noise=4.0, max_dropouts=3):
+        """
+        Args:
+            process_noise(:obj:`float`, optional): acceleration variance in
+                (units/s^2)^2 per second. Defaults to 500
+            measurement_noise(:obj:`float`, optional): variance of a raw
+                reading in units^2. Defaults to 4
+            max_dropouts(:obj:`int`, optional): dropouts bridged by
+                prediction. Defaults to 3
+        """
+        super(KalmanFilter, self).__init__(max_dropouts)
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def reset(self):
+        super(KalmanFilter, self).reset()
+        self._t = None
+        self._x = 0.0
+        self._v = 0.0
+        # covariance [[p00, p01], [p01, p11]]
+        self._p00 = self._p01 = self._p11 = 0.0
+
+    @property
+    def velocity(self):
+        """Current velocity estimate in units per second"""
+        return self._v
+
+    def _predict(self, t):
+        dt = t - self._t
+        if (dt <= 0):
+            return
+        self._t = t
+        q = self.process_noise
+        self._x += self._v * dt
+        p00, p01, p11 = self._p00, self._p01, self._p11
+        # P = F P F' + Q for F = [[1, dt], [0, 1]], white noise acceleration
+        self._p00 = p00 + dt * (2 * p01 + dt * p11) + q * dt ** 3 / 3
+        self._p01 = p01 + dt * p11 + q * dt ** 2 / 2
+        self._p11 = p11 + q * dt
+
+    def _missing(self, t):
+        if (self._t == None):
+            return None
+        self._predict(t)
+        return self._x
+
+    def _filter(self, t, value):
+        if (self._t == None):
+            self._t = t
+            self._x = float(value)
+            self._v = 0.0
+            self._p00 = self.measurement_noise
+            self._p01 = 0.0
+            self._p11 = self.process_noise
+            return self._x
+        self._predict(t)
+        s = self._p00 + self.measurement_noise
+        k0 = self._p00 / s
+        k1 = self._p01 / s
+        residual = value - self._x
+        self._x += k0 * residual
+        self._v += k1 * residual
+        p00, p01, p11 = self._p00, self._p01, self._p11
+        self._p00 = (1 - k0) * p00
+        self._p01 = (1 - k0) * p01
+        self._p11 = p11 - k1 * p01
+        return self._x
+
+
+class FilterChain(Filter):
+    """ Runs values through several stages in order
+
+    A dropout returned by one stage is passed on as a dropout to the next.
+    """
+
+    def __init__(self, *stages):
+        super(FilterChain, self).__init__()
+        self.stages = list(stages)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def update(self, t, value):
+        for stage in self.stages:
+            value = stage.update(t, value)
+        return value
+
+
+class SampleFilter(object):
+    """ Filters the X and Z of ZxSamples with one chain per axis
+
+    Example:
+        smooth = SampleFilter(MedianFilter(3), OneEuroFilter())
+        for sample in stream:
+            sample = smooth.update(sample)
+    """
+
+    def __init__(self, *stages):
+        """
+        Args:
+            *stages: filter stages for X; Z gets a copy of each
+        """
+        self.x = FilterChain(*stages)
+        self.z = FilterChain(*copy.deepcopy(stages))
+
+    def reset(self):
+        self.x.reset()
+        self.z.reset()
+
+    def update(self, sample):
+        """Returns a copy of `sample` with filtered (float) x and z"""
+        t = sample.timestamp
+        return sample._replace(x=self.x.update(t, sample.x),
+                               z=self.z.update(t, sample.z))
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
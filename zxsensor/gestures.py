@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+""" Host-side gesture recognition from the X/Z position stream
+
+The sensor firmware only reports three swipes. GestureRecognizer feeds
+every position sample through a set of small incremental detectors
+(swipes, hover, hover-move, tap, push/pull in Z). Each detector keeps a
+handful of scalars, or the extremes of a short sliding window in
+monotonic deques, as state, so the cost per sample is O(1) amortized.
+
+Detectors are registered by name in GESTURE_DETECTORS; new ones can be
+added with the register_detector decorator and configured through the
+recognizer without touching this module.
+"""
+
+# standard
+from __future__ import division, print_function
+from collections import deque, namedtuple
+import math
+# project
+from .i2c_registers import *
+
+
+class RecognizedGesture(namedtuple('RecognizedGesture', ['timestamp', 'gesture', 'x', 'z', 'duration'])):
+    """ A gesture found by a host-side detector
+
+    Attributes:
+        timestamp(float): timestamp of the sample that completed the gesture
+        gesture(gesture_type): what was detected
+        x(int): X position when the gesture completed
+        z(int): Z position when the gesture completed
+        duration(float): seconds from the start of the gesture
+    """
+    __slots__ = ()
+
+
+GESTURE_DETECTORS = {}
+
+
+def _slide(window, sample, index, sign, cutoff):
+    """Adds a (t, x, z) sample to a monotonic deque and returns the extreme
+    (minimum of sign * sample[index]) of the samples newer than cutoff
+    """
+    # drop samples the new one dominates, then the ones too old
+    value = sign * sample[index]
+    while (window) and (sign * window[-1][index] >= value):
+        window.pop()
+    window.append(sample)
+    while (window[0][0] < cutoff):
+        window.popleft()
+    return window[0]
+
+
+def register_detector(name):
+    """Class decorator adding a detector to GESTURE_DETECTORS"""
+    def decorator(cls):
+        cls.name = name
+        GESTURE_DETECTORS[name] = cls
+        return cls
+    return decorator
+
+
+class GestureDetector(object):
+    """ Base class of the incremental detectors
+
+    update() is called with every sample; x and z are None while nothing is
+    in range. It returns a RecognizedGesture or None.
+    """
+
+    name = None
+
+    def reset(self):
+        pass
+
+    def update(self, t, x, z):
+        raise NotImplementedError
+
+
+@register_detector('swipe')
+class SwipeDetector(GestureDetector):
+    """ Fast horizontal (left/right) or upward (growing Z) movement
+
+    The travel is measured from the extreme X (or Z) within the last
+    max_duration seconds, so a swipe is found however long the hand rested
+    before it. The extremes are kept in monotonic deques, O(1) amortized
+    per sample. A swipe fires once, however far the movement goes on.
+    """
+
+    def __init__(self, min_distance=80, max_duration=0.6, max_cross=40):
+        """
+        Args:
+            min_distance(:obj:`int`, optional): travel along the swipe axis
+            max_duration(:obj:`float`, optional): seconds the travel may take
+            max_cross(:obj:`int`, optional): allowed travel across the axis
+        """
+        self.min_distance = min_distance
+        self.max_duration = max_duration
+        self.max_cross = max_cross
+        self.reset()
+
+    def reset(self):
+        # (t, x, z) samples of the window with increasing X, decreasing X
+        # and increasing Z; the front of each is the window's extreme
+        self._min_x = deque()
+        self._max_x = deque()
+        self._min_z = deque()
+        # the gesture whose travel condition held at the previous sample
+        self._held = None
+
+    def update(self, t, x, z):
+        if (x == None):
+            self.reset()
+            return None
+        sample = (t, x, z)
+        cutoff = t - self.max_duration
+        left = _slide(self._min_x, sample, 1, 1, cutoff)
+        right = _slide(self._max_x, sample, 1, -1, cutoff)
+        low = _slide(self._min_z, sample, 2, 1, cutoff)
+        start = gesture = None
+        if (x - left[1] >= self.min_distance) and (abs(z - left[2]) <= self.max_cross):
+            start, gesture = left, gesture_type.RIGHT_SWIPE
+        elif (right[1] - x >= self.min_distance) and (abs(z - right[2]) <= self.max_cross):
+            start, gesture = right, gesture_type.LEFT_SWIPE
+        elif (z - low[2] >= self.min_distance) and (abs(x - low[1]) <= self.max_cross):
+            start, gesture = low, gesture_type.UP_SWIPE
+        if (gesture == self._held):
+            # nothing, or the movement that already fired going on
+            return None
+        self._held = gesture
+        if (gesture == None):
+            return None
+        return RecognizedGesture(t, gesture, x, z, t - start[0])
+
+
+@register_detector('hover')
+class HoverDetector(GestureDetector):
+    """ Hand held still; fires once per hover
+    """
+
+    def __init__(self, radius=10, hold_time=0.5):
+        """
+        Args:
+            radius(:obj:`int`, optional): how far the hand may drift
+            hold_time(:obj:`float`, optional): seconds it has to stay
+        """
+        self.radius = radius
+        self.hold_time = hold_time
+        self.reset()
+
+    def reset(self):
+        self._anchor = None
+        self.hovering = False
+
+    def update(self, t, x, z):
+        if (x == None):
+            self.reset()
+            return None
+        anchor = self._anchor
+        if (anchor == None) or (math.hypot(x - anchor[1], z - anchor[2]) > self.radius):
+            self._anchor = (t, x, z)
+            self.hovering = False
+            return None
+        if (not self.hovering) and (t - anchor[0] >= self.hold_time):
+            self.hovering = True
+            return RecognizedGesture(t, gesture_type.HOVER, x, z, t - anchor[0])
+        return None
+
+
+@register_detector('hover_move')
+class HoverMoveDetector(GestureDetector):
+    """ Hover followed by a deliberate move away from the hover point
+    """
+
+    def __init__(self, radius=10, hold_time=0.5, move_distance=40):
+        """
+        Args:
+            radius(:obj:`int`, optional): hover drift radius
+            hold_time(:obj:`float`, optional): hover time
+            move_distance(:obj:`int`, optional): travel after the hover
+        """
+        self.move_distance = move_distance
+        self._hover = HoverDetector(radius, hold_time)
+        self.reset()
+
+    def reset(self):
+        self._hover.reset()
+        self._origin = None
+
+    def update(self, t, x, z):
+        if (x == None):
+            self.reset()
+            return None
+        hovered = self._hover.update(t, x, z)
+        if (hovered != None):
+            self._origin = (t, x, z)
+            return None
+        origin = self._origin
+        if (origin != None) and (math.hypot(x - origin[1], z - origin[2]) >= self.move_distance):
+            self._origin = None
+            return RecognizedGesture(t, gesture_type.HOVER_MOVE, x, z, t - origin[0])
+        return None
+
+
+@register_detector('tap')
+class TapDetector(GestureDetector):
+    """ Short dip towards the sensor (smaller Z) and back
+    """
+
+    def __init__(self, depth=20, max_duration=0.4, smoothing=0.2, max_depth=60, push_time=1.0):
+        """
+        Args:
+            depth(:obj:`int`, optional): Z dip below the resting height
+            max_duration(:obj:`float`, optional): seconds for the full tap
+            smoothing(:obj:`float`, optional): EMA weight for tracking the
+                resting height
+            max_depth(:obj:`int`, optional): a dip this far below the
+                highest Z of the last push_time seconds is a push, not a
+                tap. Together with push_time it should match the push_pull
+                min_distance and max_duration, so one movement is never both
+            push_time(:obj:`float`, optional): see max_depth
+        """
+        self.depth = depth
+        self.max_duration = max_duration
+        self.smoothing = smoothing
+        self.max_depth = max_depth
+        self.push_time = push_time
+        self.reset()
+
+    def reset(self):
+        self._baseline = None
+        self._pressed = None
+        self._max_z = deque()
+        # lowest Z of a push in progress
+        self._pushed = None
+
+    def update(self, t, x, z):
+        if (z == None):
+            self.reset()
+            return None
+        top = _slide(self._max_z, (t, x, z), 2, -1, t - self.push_time)[2]
+        if (self._baseline == None):
+            self._baseline = float(z)
+            return None
+        if (self._pushed != None):
+            # wait for the hand to come back up before looking for taps
+            if (z >= self._pushed + self.depth):
+                self._pushed = None
+                self._baseline = float(z)
+            else:
+                self._pushed = min(self._pushed, z)
+            return None
+        baseline = self._baseline
+        if (self._pressed == None):
+            if (z <= baseline - self.depth):
+                self._pressed = t
+            else:
+                self._baseline = baseline + self.smoothing * (z - baseline)
+            return None
+        if (t - self._pressed > self.max_duration) or (z <= top - self.max_depth):
+            # held down too long or too deep, that is a push
+            self._pressed = None
+            self._pushed = z
+            return None
+        if (z >= baseline - self.depth / 2):
+            pressed = self._pressed
+            self._pressed = None
+            return RecognizedGesture(t, gesture_type.TAP, x, z, t - pressed)
+        return None
+
+
+@register_detector('push_pull')
+class PushPullDetector(GestureDetector):
+    """ Sustained movement towards (push) or away from (pull) the sensor
+
+    Like the swipes, the travel is measured from the extreme Z within the
+    last max_duration seconds, and each movement fires once.
+    """
+
+    def __init__(self, min_distance=60, max_duration=1.0, max_cross=30):
+        """
+        Args:
+            min_distance(:obj:`int`, optional): Z travel
+            max_duration(:obj:`float`, optional): seconds the travel may take
+            max_cross(:obj:`int`, optional): allowed X travel
+        """
+        self.min_distance = min_distance
+        self.max_duration = max_duration
+        self.max_cross = max_cross
+        self.reset()
+
+    def reset(self):
+        self._min_z = deque()
+        self._max_z = deque()
+        self._held = None
+
+    def update(self, t, x, z):
+        if (z == None) or (x == None):
+            self.reset()
+            return None
+        sample = (t, x, z)
+        cutoff = t - self.max_duration
+        low = _slide(self._min_z, sample, 2, 1, cutoff)
+        high = _slide(self._max_z, sample, 2, -1, cutoff)
+        start = gesture = None
+        if (high[2] - z >= self.min_distance) and (abs(x - high[1]) <= self.max_cross):
+            start, gesture = high, gesture_type.PUSH
+        elif (z - low[2] >= self.min_distance) and (abs(x - low[1]) <= self.max_cross):
+            start, gesture = low, gesture_type.PULL
+        if (gesture == self._held):
+            return None
+        self._held = gesture
+        if (gesture == None):
+            return None
+        return RecognizedGesture(t, gesture, x, z, t - start[0])
+
+
+class GestureRecognizer(object):
+    """ Runs a set of detectors over a stream of ZxSamples
+    """
+
+    def __init__(self, detectors=None, config=None):
+        """
+        Args:
+            detectors(list, optional): names from GESTURE_DETECTORS to
+                enable. Defaults to all registered detectors
+            config(dict, optional): per-detector constructor arguments,
+                e.g. {'swipe': {'min_distance': 100}}
+        """
+        config = config or {}
+        if (detectors == None):
+            detectors = sorted(GESTURE_DETECTORS)
+        self.detectors = []
+        for name in detectors:
+            self.add(GESTURE_DETECTORS[name](**config.get(name, {})))
+
+    def add(self, detector):
+        """Adds a detector instance"""
+        self.detectors.append(detector)
+        return detector
+
+    def remove(self, name):
+        """Removes all detectors with a name"""
+        self.detectors = [d for d in self.detectors if d.name != name]
+
+    def reset(self):
+        for detector in self.detectors:
+            detector.reset()
+
+    def update(self, sample):
+        """Feeds one ZxSample to every detector
+
+        Returns:
+            a list of RecognizedGestures, usually empty
+        """
+        t = sample.timestamp
+        x = sample.x
+        z = sample.z
+        if (x == None) or (z == None):
+            x = z = None
+        found = []
+        for detector in self.detectors:
+            result = detector.update(t, x, z)
+            if (result != None):
+                found.append(result)
+        return found
+
+    def feed(self, samples):
+        """Feeds many samples
+
+        Returns:
+            all RecognizedGestures in order
+        """
+        found = []
+        for sample in samples:
+            found.extend(self.update(sample))
+        return found
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
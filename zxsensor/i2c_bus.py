@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+""" Shared I2C bus handles for running several zx_sensors on one bus
+"""
+
+# standard
+from __future__ import division, print_function
+import logging
+import threading
+import time
+# external
+from .Adafruit_I2C import Adafruit_I2C
+# project
+from .zx_sensor import ZxSensor
+from .zx_stream import SampleRing
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(busnum=-1):
+    """Returns the shared ZxBus for a bus number, opening it on first use
+
+    Args:
+        busnum(:obj:`int`, optional): the /dev/i2c-N bus number. Defaults to
+            -1, which auto-detects the bus once per process
+
+    Returns:
+        the ZxBus for that bus number
+    """
+    if (busnum < 0):
+        busnum = Adafruit_I2C.getPiI2CBusNumber()
+    with _buses_lock:
+        bus = _buses.get(busnum)
+        if (bus == None):
+            bus = ZxBus(busnum)
+            _buses[busnum] = bus
+        return bus
+
+
+class LockedSMBus(object):
+    """ Proxy for an smbus.SMBus handle that holds the bus lock for the
+    duration of every call, so transactions from different devices or
+    threads never interleave.
+    """
+
+    def __init__(self, handle, lock):
+        self._handle = handle
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attr = getattr(self._handle, name)
+        if (not callable(attr)):
+            return attr
+        lock = self._lock
+
+        def locked(*args, **kwargs):
+            with lock:
+                return attr(*args, **kwargs)
+        # cache the wrapper so the lookup cost is only paid once
+        setattr(self, name, locked)
+        return locked
+
+
+class ZxBus(object):
+    """ One open SMBus handle and one lock for an I2C bus, shared by every
+    ZxSensor attached to it
+    """
+
+    def __init__(self, busnum, handle=None):
+        """
+        Args:
+            busnum(:obj:`int`): the /dev/i2c-N bus number
+            handle(:obj:`smbus.SMBus`, optional): an already open handle.
+                Defaults to opening /dev/i2c-<busnum>
+        """
+        self.logger = logging.getLogger('ZxBus')
+        self.busnum = busnum
+        self.lock = threading.RLock()
+        if (handle == None):
+            import smbus
+            handle = smbus.SMBus(busnum)
+        self.handle = LockedSMBus(handle, self.lock)
+        self.sensors = []
+
+    def device(self, address):
+        """Creates an Adafruit_I2C device that uses the shared handle
+
+        Args:
+            address(:obj:`int`): the i2c address of the device
+
+        Returns:
+            an Adafruit_I2C bound to this bus
+        """
+        i2c = Adafruit_I2C(address, busnum=self.busnum, bus=self.handle)
+        i2c.lock = self.lock
+        return i2c
+
+    def attach(self, sensor, **kwargs):
+        """Attaches a sensor to the bus
+
+        Args:
+            sensor: an i2c address to create a new ZxSensor for, or an
+                existing ZxSensor which is moved onto the shared handle.
+                The handle the sensor opened itself is closed
+            **kwargs: passed to the ZxSensor constructor when an address
+                is given
+
+        Returns:
+            the attached ZxSensor
+        """
+        if (isinstance(sensor, ZxSensor)):
+            # the device under any metrics/trace/... wrappers
+            i2c = sensor.i2c
+            while ('transport' in getattr(i2c, '__dict__', ())):
+                i2c = i2c.transport
+            old = getattr(i2c, 'bus', None)
+            if (old != None) and (old is not self.handle):
+                # handles of other ZxBuses are shared, only close our own
+                if (not isinstance(old, LockedSMBus)) and (hasattr(old, 'close')):
+                    old.close()
+                i2c.bus = self.handle
+            i2c.busnum = self.busnum
+            i2c.lock = self.lock
+            sensor.lock = self.lock
+        else:
+            with self.lock:
+                sensor = ZxSensor(sensor, i2c=self.device(sensor), **kwargs)
+        if (sensor not in self.sensors):
+            self.sensors.append(sensor)
+        return sensor
+
+    def detach(self, sensor):
+        """Removes a sensor from the round-robin set"""
+        if (sensor in self.sensors):
+            self.sensors.remove(sensor)
+
+    def scheduler(self, rate_hz, buffer_size=1024):
+        """Creates a RoundRobinScheduler over the attached sensors
+
+        Args:
+            rate_hz(:obj:`float`): aggregate sample rate across all sensors
+            buffer_size(:obj:`int`, optional): ring buffer capacity per
+                sensor. Defaults to 1024
+
+        Returns:
+            a RoundRobinScheduler, not yet started
+        """
+        return RoundRobinScheduler(self.sensors, rate_hz, buffer_size)
+
+
+class RoundRobinScheduler(object):
+    """ Samples a set of sensors in turn from one thread at a target
+    aggregate rate. Each sensor gets its own SampleRing.
+    """
+
+    def __init__(self, sensors, rate_hz, buffer_size=1024):
+        """
+        Args:
+            sensors(list): the ZxSensors to sample
+            rate_hz(:obj:`float`): aggregate sample rate across all sensors
+            buffer_size(:obj:`int`, optional): ring buffer capacity per
+                sensor. Defaults to 1024
+        """
+        if (rate_hz <= 0):
+            raise ValueError("rate_hz must be positive")
+        self.logger = logging.getLogger('RoundRobinScheduler')
+        self.sensors = list(sensors)
+        self.period = 1.0 / rate_hz
+        self.rings = [SampleRing(buffer_size) for _ in self.sensors]
+        self.samples = [0] * len(self.sensors)
+        self.errors = [0] * len(self.sensors)
+        self._started = None
+        self._stopped = None
+        self._running = threading.Event()
+        self._thread = None
+
+    def ring(self, sensor):
+        """Returns the SampleRing holding the samples of a sensor"""
+        return self.rings[self.sensors.index(sensor)]
+
+    def start(self):
+        """Starts the sampling thread"""
+        if (self._running.is_set()):
+            return
+        self._running.set()
+        self._started = time.monotonic()
+        self._stopped = None
+        self._thread = threading.Thread(target=self._run, name='RoundRobinScheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the sampling thread and waits for it to exit"""
+        self._running.clear()
+        if (self._thread != None):
+            self._thread.join(timeout)
+            self._thread = None
+        self._stopped = time.monotonic()
+        for ring in self.rings:
+            ring.wake()
+
+    def rates(self):
+        """Reports the achieved per-sensor sample rates
+
+        Returns:
+            a list of (sensor, samples per second) tuples, in sensor order
+        """
+        if (self._started == None):
+            return [(sensor, 0.0) for sensor in self.sensors]
+        end = self._stopped if self._stopped != None else time.monotonic()
+        elapsed = max(end - self._started, 1e-9)
+        return [(sensor, count / elapsed) for sensor, count in zip(self.sensors, self.samples)]
+
+    def _run(self):
+        period = self.period
+        count = len(self.sensors)
+        index = 0
+        deadline = time.monotonic()
+        while (self._running.is_set() and count):
+            sample = self.sensors[index].read_snapshot()
+            if (sample == None):
+                self.errors[index] += 1
+            else:
+                self.rings[index].push(sample)
+                self.samples[index] += 1
+            index = (index + 1) % count
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if (delay > 0):
+                time.sleep(delay)
+            elif (delay < -period):
+                deadline = time.monotonic()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+""" I2C transport on the Linux /dev/i2c-N character device
+
+Every transaction is a single I2C_RDWR ioctl. A register read is one
+combined transaction: the register address is written and the data read
+back after a repeated start, atomically with respect to other users of
+the adapter. The message descriptors and data buffers are allocated once,
+so readinto() allocates nothing per read.
+
+The method surface is the one of Adafruit_I2C, errors are reported the
+same way (-1 from reads, non-None from writes), so the transport can be
+passed to ZxSensor(i2c=...) as is:
+
+    sensor = ZxSensor(i2c=I2cDevTransport(0x10))
+"""
+
+# standard
+from __future__ import division, print_function
+import ctypes
+import fcntl
+import logging
+import os
+import threading
+# external
+from .Adafruit_I2C import Adafruit_I2C
+# project
+from .transport import ZxTransport
+
+# from linux/i2c-dev.h and linux/i2c.h
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+
+# largest block transfer, the SMBus block limit Adafruit_I2C is bound to
+MAX_BLOCK = 32
+
+
+class _I2cMsg(ctypes.Structure):
+    _fields_ = [('addr', ctypes.c_uint16),
+                ('flags', ctypes.c_uint16),
+                ('len', ctypes.c_uint16),
+                ('buf', ctypes.POINTER(ctypes.c_uint8))]
+
+
+class _I2cRdwrData(ctypes.Structure):
+    _fields_ = [('msgs', ctypes.POINTER(_I2cMsg)),
+                ('nmsgs', ctypes.c_uint32)]
+
+
+class I2cDevTransport(ZxTransport):
+    """ Adafruit_I2C compatible transport built on I2C_RDWR ioctls
+    """
+
+    def __init__(self, address, busnum=-1, lock=None, debug=False):
+        """
+        Args:
+            address(:obj:`int`): the i2c address of the device
+            busnum(:obj:`int`, optional): the /dev/i2c-N bus number.
+                Defaults to -1, which auto-detects the bus
+            lock(optional): lock held around each transaction, e.g. the one
+                of a ZxBus. Defaults to a lock of this transport
+            debug(bool, optional): log every transaction. Defaults to False
+        """
+        self.address = address
+        self.busnum = busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber()
+        self.lock = lock or threading.RLock()
+        self.debug = debug
+        self.lastError = None
+        self.logger = logging.getLogger('I2cDevTransport')
+        self.fd = os.open('/dev/i2c-{}'.format(self.busnum), os.O_RDWR)
+        # register address plus payload, and the read buffer
+        self._out = (ctypes.c_uint8 * (MAX_BLOCK + 1))()
+        self._in = (ctypes.c_uint8 * MAX_BLOCK)()
+        self._in_view = memoryview(self._in).cast('B')
+        self._msgs = (_I2cMsg * 2)()
+        self._msgs[0].addr = address
+        self._msgs[0].flags = 0
+        self._msgs[0].buf = ctypes.cast(self._out, ctypes.POINTER(ctypes.c_uint8))
+        self._msgs[1].addr = address
+        self._msgs[1].flags = I2C_M_RD
+        self._msgs[1].buf = ctypes.cast(self._in, ctypes.POINTER(ctypes.c_uint8))
+        # write only uses the first message, write-then-read both
+        self._write_data = _I2cRdwrData(self._msgs, 1)
+        self._read_data = _I2cRdwrData(self._msgs, 2)
+
+    def close(self):
+        """Closes the bus device"""
+        if (self.fd != None):
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def errMsg(self, err=None):
+        self.lastError = err
+        self.logger.error("Error accessing 0x%02X: Check your I2C address (%s)", self.address, err)
+        return -1
+
+    # ============
+    # Transactions
+    # ============
+
+    def _transfer(self, reg, length):
+        # combined write of the register address and read of `length` bytes
+        # into self._in; the caller holds self.lock
+        self._out[0] = reg
+        self._msgs[0].len = 1
+        self._msgs[1].len = length
+        fcntl.ioctl(self.fd, I2C_RDWR, self._read_data)
+
+    def _send(self, reg, data):
+        # caller holds self.lock
+        if (len(data) > MAX_BLOCK):
+            raise ValueError("at most {} bytes per transfer".format(MAX_BLOCK))
+        self._out[0] = reg
+        for i, value in enumerate(data):
+            self._out[i + 1] = value
+        self._msgs[0].len = len(data) + 1
+        fcntl.ioctl(self.fd, I2C_RDWR, self._write_data)
+
+    def readinto(self, reg, buffer):
+        """Reads len(buffer) consecutive registers into a writable buffer,
+        e.g. a preallocated bytearray
+
+        Returns:
+            the number of bytes read. -1 on error.
+        """
+        length = len(buffer)
+        if (length > MAX_BLOCK):
+            raise ValueError("at most {} bytes per transfer".format(MAX_BLOCK))
+        try:
+            with self.lock:
+                self._transfer(reg, length)
+                buffer[:length] = self._in_view[:length]
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Device 0x%02X returned the following from reg 0x%02X: %s",
+                              self.address, reg, list(buffer))
+        return length
+
+    def readList(self, reg, length):
+        "Read a list of bytes from the I2C device"
+        length = min(length, MAX_BLOCK)
+        try:
+            with self.lock:
+                self._transfer(reg, length)
+                results = self._in[:length]
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Device 0x%02X returned the following from reg 0x%02X: %s",
+                              self.address, reg, results)
+        return results
+
+    def readU8(self, reg):
+        "Read an unsigned byte from the I2C device"
+        try:
+            with self.lock:
+                self._transfer(reg, 1)
+                result = self._in[0]
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X",
+                              self.address, result, reg)
+        return result
+
+    def readS8(self, reg):
+        "Reads a signed byte from the I2C device"
+        result = self.readU8(reg)
+        if (result < 0):
+            # the -1 of errMsg, not a reading
+            return result
+        if (result > 127):
+            result -= 256
+        return result
+
+    def readU16(self, reg, little_endian=True):
+        "Reads an unsigned 16-bit value from the I2C device"
+        try:
+            with self.lock:
+                self._transfer(reg, 2)
+                low, high = self._in[0], self._in[1]
+        except IOError as err:
+            return self.errMsg(err)
+        if (not little_endian):
+            low, high = high, low
+        return (high << 8) | low
+
+    def readS16(self, reg, little_endian=True):
+        "Reads a signed 16-bit value from the I2C device"
+        result = self.readU16(reg, little_endian)
+        if (result < 0):
+            return result
+        if (result > 32767):
+            result -= 65536
+        return result
+
+    def write8(self, reg, value):
+        "Writes an 8-bit value to the specified register/address"
+        try:
+            with self.lock:
+                self._send(reg, (value & 0xFF,))
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Wrote 0x%02X to register 0x%02X", value, reg)
+
+    def write16(self, reg, value):
+        "Writes a 16-bit value to the specified register/address pair"
+        try:
+            with self.lock:
+                self._send(reg, (value & 0xFF, (value >> 8) & 0xFF))
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Wrote 0x%02X to register pair 0x%02X,0x%02X",
+                              value, reg, reg + 1)
+
+    def writeRaw8(self, value):
+        "Writes an 8-bit value on the bus"
+        try:
+            with self.lock:
+                self._out[0] = value & 0xFF
+                self._msgs[0].len = 1
+                fcntl.ioctl(self.fd, I2C_RDWR, self._write_data)
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Wrote 0x%02X", value)
+
+    def writeList(self, reg, list):
+        "Writes an array of bytes using I2C format"
+        try:
+            with self.lock:
+                self._send(reg, list)
+        except IOError as err:
+            return self.errMsg(err)
+        if (self.debug):
+            self.logger.debug("I2C: Writing list to register 0x%02X: %s", reg, list)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -37,6 +37,13 @@ DRCFG_POLARITY = 0
 DRCFG_EDGE = 1
 DRCFG_FORCE = 6
 DRCFG_EN = 7
+STATUS_DAV = 0
+STATUS_OVF = 1
+STATUS_SWP = 2
+STATUS_HOVER = 3
+STATUS_HVG = 4
+STATUS_EDGE = 5
+STATUS_HB = 7
 
 # ZX Sensor UART message headers
 ZX_UART_END = 0xFF
@@ -52,12 +59,26 @@ MAX_X = 240
 MAX_Z = 240
 SET_ALL_DRE = 0b00111111
 
+# Contiguous register block (STATUS..RRNG) fetched by a single burst read
+ZX_SNAPSHOT_START = ZX_STATUS
+ZX_SNAPSHOT_LENGTH = ZX_RRNG - ZX_STATUS + 1
+
+# Writable configuration registers, mirrored in the ZxSensor shadow cache.
+# They are contiguous, so the whole set can be resynced with one block read.
+ZX_CONFIG_REGISTERS = (ZX_DRE, ZX_DRCFG)
+
 # Enumeration for possible gestures
 class gesture_type(Enum):
     RIGHT_SWIPE = 0x01
     LEFT_SWIPE = 0x02
     UP_SWIPE = 0x08
     NO_GESTURE = 0x00
+    # only detected on the host, see gestures.py; never read from GESTURE
+    HOVER = 0x20
+    HOVER_MOVE = 0x21
+    TAP = 0x22
+    PUSH = 0x23
+    PULL = 0x24
 
 # Enumeration for possible interrupt enables
 class interrupt_type(Enum):
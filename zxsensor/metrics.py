@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+""" Opt-in bus metrics: transaction and error counters and latency
+histograms
+
+Metrics are collected by wrapping a transport in InstrumentedTransport,
+which ZxSensor.enable_metrics() does. An uninstrumented sensor keeps
+calling its transport directly, so disabled metrics cost nothing.
+Counters live in preallocated lists; recording a transaction does not
+allocate. Updates are not locked, so counts from concurrent threads may
+be off by a few under contention.
+"""
+
+# standard
+from __future__ import division, print_function
+from bisect import bisect_left
+import json
+import time
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 50e-3)
+
+OPERATIONS = ('readU8', 'readList', 'write8', 'writeList')
+
+
+class BusMetrics(object):
+    """ Counters and histograms for one device
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, labels=None):
+        """
+        Args:
+            buckets(tuple, optional): ascending latency bucket bounds in
+                seconds. A final +Inf bucket is always added
+            labels(dict, optional): extra labels for the exporters, e.g.
+                {'address': '0x10'}
+        """
+        self.buckets = tuple(buckets)
+        self.labels = dict(labels or {})
+        self.reset()
+
+    def reset(self):
+        """Zeroes all counters"""
+        nbuckets = len(self.buckets) + 1
+        # transactions by start register
+        self.register_counts = [0] * 256
+        self.operation_counts = dict((op, 0) for op in OPERATIONS)
+        self.latency_histograms = dict((op, [0] * nbuckets) for op in OPERATIONS)
+        self.latency_sums = dict((op, 0.0) for op in OPERATIONS)
+        # failed transactions by exception type name
+        self.errors = {}
+        # sensor level events, e.g. invalid positions
+        self.events = {}
+        self.since = time.time()
+
+    def record(self, op, reg, seconds, error=None):
+        """Records one transaction
+
+        Args:
+            op(:obj:`str`): one of OPERATIONS
+            reg(:obj:`int`): first register of the transaction
+            seconds(:obj:`float`): duration of the transaction
+            error(:obj:`str`, optional): exception type name if it failed
+        """
+        self.register_counts[reg & 0xFF] += 1
+        self.operation_counts[op] += 1
+        self.latency_histograms[op][bisect_left(self.buckets, seconds)] += 1
+        self.latency_sums[op] += seconds
+        if (error != None):
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def count(self, event):
+        """Increments a sensor level event counter"""
+        self.events[event] = self.events.get(event, 0) + 1
+
+    def snapshot(self):
+        """Returns a JSON serialisable copy of all counters"""
+        return {
+            'since': self.since,
+            'labels': dict(self.labels),
+            'buckets': list(self.buckets),
+            'registers': dict(('0x{:02X}'.format(reg), count)
+                              for reg, count in enumerate(self.register_counts) if count),
+            'operations': dict(self.operation_counts),
+            'latency_histograms': dict((op, list(h)) for op, h in self.latency_histograms.items()),
+            'latency_sums': dict(self.latency_sums),
+            'errors': dict(self.errors),
+            'events': dict(self.events),
+        }
+
+    def to_json(self, **kwargs):
+        """Exports the snapshot as a JSON string"""
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix='zxsensor'):
+        """Exports the counters in the Prometheus text exposition format"""
+        base = ''.join(',{}="{}"'.format(k, v) for k, v in sorted(self.labels.items()))
+
+        def labels(**extra):
+            text = ','.join('{}="{}"'.format(k, v) for k, v in extra.items()) + base
+            return '{' + text.lstrip(',') + '}' if text else ''
+
+        lines = ['# TYPE {}_i2c_transactions_total counter'.format(prefix)]
+        for op in OPERATIONS:
+            lines.append('{}_i2c_transactions_total{} {}'.format(prefix, labels(op=op), self.operation_counts[op]))
+        lines.append('# TYPE {}_i2c_register_transactions_total counter'.format(prefix))
+        for reg, count in enumerate(self.register_counts):
+            if (count):
+                lines.append('{}_i2c_register_transactions_total{} {}'.format(
+                    prefix, labels(reg='0x{:02X}'.format(reg)), count))
+        lines.append('# TYPE {}_i2c_errors_total counter'.format(prefix))
+        for error, count in sorted(self.errors.items()):
+            lines.append('{}_i2c_errors_total{} {}'.format(prefix, labels(type=error), count))
+        lines.append('# TYPE {}_i2c_latency_seconds histogram'.format(prefix))
+        for op in OPERATIONS:
+            cumulative = 0
+            histogram = self.latency_histograms[op]
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                lines.append('{}_i2c_latency_seconds_bucket{} {}'.format(prefix, labels(op=op, le=bound), cumulative))
+            lines.append('{}_i2c_latency_seconds_sum{} {}'.format(prefix, labels(op=op), self.latency_sums[op]))
+            lines.append('{}_i2c_latency_seconds_count{} {}'.format(prefix, labels(op=op), cumulative))
+        lines.append('# TYPE {}_sensor_events_total counter'.format(prefix))
+        for event, count in sorted(self.events.items()):
+            lines.append('{}_sensor_events_total{} {}'.format(prefix, labels(event=event), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _error_name(transport):
+    error = getattr(transport, 'lastError', None)
+    return type(error).__name__ if error != None else 'IOError'
+
+
+class InstrumentedTransport(object):
+    """ Transport wrapper that records every transaction into a BusMetrics
+    """
+
+    def __init__(self, transport, metrics):
+        self.transport = transport
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        # everything else (address, busnum, lock, ...) comes from the wrapped
+        # transport
+        return getattr(self.transport, name)
+
+    def _raised(self, op, reg, start, err):
+        # e.g. a ZxBusError from a ResilientTransport underneath; recorded
+        # here, the caller re-raises
+        self.metrics.record(op, reg, time.perf_counter() - start, type(err).__name__)
+
+    def readU8(self, reg):
+        start = time.perf_counter()
+        try:
+            val = self.transport.readU8(reg)
+        except IOError as err:
+            self._raised('readU8', reg, start, err)
+            raise
+        failed = (val == None) or (val < 0)
+        self.metrics.record('readU8', reg, time.perf_counter() - start,
+                            _error_name(self.transport) if failed else None)
+        return val
+
+    def readList(self, reg, length):
+        start = time.perf_counter()
+        try:
+            val = self.transport.readList(reg, length)
+        except IOError as err:
+            self._raised('readList', reg, start, err)
+            raise
+        failed = not isinstance(val, list)
+        self.metrics.record('readList', reg, time.perf_counter() - start,
+                            _error_name(self.transport) if failed else None)
+        return val
+
+    def readinto(self, reg, buffer):
+        # a block read like readList, counted as one
+        start = time.perf_counter()
+        try:
+            val = self.transport.readinto(reg, buffer)
+        except IOError as err:
+            self._raised('readList', reg, start, err)
+            raise
+        failed = (val == None) or (val < 0)
+        self.metrics.record('readList', reg, time.perf_counter() - start,
+                            _error_name(self.transport) if failed else None)
+        return val
+
+    def write8(self, reg, value):
+        start = time.perf_counter()
+        try:
+            val = self.transport.write8(reg, value)
+        except IOError as err:
+            self._raised('write8', reg, start, err)
+            raise
+        self.metrics.record('write8', reg, time.perf_counter() - start,
+                            _error_name(self.transport) if val != None else None)
+        return val
+
+    def writeList(self, reg, list):
+        start = time.perf_counter()
+        try:
+            val = self.transport.writeList(reg, list)
+        except IOError as err:
+            self._raised('writeList', reg, start, err)
+            raise
+        self.metrics.record('writeList', reg, time.perf_counter() - start,
+                            _error_name(self.transport) if val != None else None)
+        return val
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
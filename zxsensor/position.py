@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+""" Host side X/Z from the left and right range registers
+
+The firmware reports X and Z quantised to whole units. Both ranges come
+with every snapshot, so the position can be worked out on the host
+instead: a range is the distance to an emitter, counted down from
+`range_full`, and the hand sits where the two circles around the emitters
+intersect:
+
+    d_l = (range_full - LRNG) * range_scale
+    x = (d_l^2 - d_r^2) / (2 * (right - left)) + (left + right) / 2
+    z = sqrt(d_l^2 - (x - left)^2)
+
+followed by a linear correction of x and z. Range pairs whose circles
+miss each other, or that put x outside the field, by more than the range
+quantisation explains are bad readings and give no position rather than
+one clamped to the edge. PositionSolver evaluates this once for every
+pair of range bytes and keeps the results in a 64K entry
+lookup table, so solving a sample is two array lookups.
+
+A PositionCalibration holds the geometry and correction of one unit; it is
+saved as JSON and loaded at startup, see ZxSensor.load_calibration().
+"""
+
+# standard
+from __future__ import division, print_function
+from array import array
+from collections import namedtuple
+import json
+import math
+import os
+# external
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# project
+from .i2c_registers import *
+
+NAN = float('nan')
+
+
+def default_calibration_path(address=0x10):
+    """Where the calibration of the sensor at `address` is kept unless a
+    path is given: $ZXSENSOR_CALIBRATION_DIR, else ~/.config/zxsensor
+    """
+    folder = os.environ.get('ZXSENSOR_CALIBRATION_DIR') or \
+        os.path.join(os.path.expanduser('~'), '.config', 'zxsensor')
+    return os.path.join(folder, 'calibration-0x{:02x}.json'.format(address))
+
+
+class PositionCalibration(namedtuple('PositionCalibration', [
+        'left_emitter', 'right_emitter', 'range_full', 'range_scale',
+        'x_scale', 'x_offset', 'z_scale', 'z_offset'])):
+    """ Geometry and linear correction of one sensor unit
+
+    Attributes:
+        left_emitter(float): X of the left emitter
+        right_emitter(float): X of the right emitter
+        range_full(float): range register value at zero distance
+        range_scale(float): distance per range register step
+        x_scale, x_offset(float): x = x_scale * geometric x + x_offset
+        z_scale, z_offset(float): z = z_scale * geometric z + z_offset
+    """
+    __slots__ = ()
+
+    def __new__(cls, left_emitter=60.0, right_emitter=180.0, range_full=240.0, range_scale=1.0,
+                x_scale=1.0, x_offset=0.0, z_scale=1.0, z_offset=0.0):
+        if (right_emitter <= left_emitter):
+            raise ValueError("right_emitter must be right of left_emitter")
+        if (range_scale <= 0):
+            raise ValueError("range_scale must be positive")
+        return super(PositionCalibration, cls).__new__(
+            cls, float(left_emitter), float(right_emitter), float(range_full), float(range_scale),
+            float(x_scale), float(x_offset), float(z_scale), float(z_offset))
+
+    def save(self, path):
+        """Writes the calibration as JSON, creating the folder if needed"""
+        folder = os.path.dirname(path)
+        if (folder) and (not os.path.isdir(folder)):
+            os.makedirs(folder)
+        with open(path, 'w') as outfile:
+            json.dump(self._asdict(), outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+
+    @classmethod
+    def load(cls, path):
+        """Reads a calibration written by save()
+
+        Raises:
+            IOError: the file cannot be read
+            ValueError: the file is not a calibration
+        """
+        with open(path, 'r') as infile:
+            values = json.load(infile)
+        unknown = set(values) - set(cls._fields)
+        if (unknown):
+            raise ValueError("{}: unknown calibration fields {}".format(path, sorted(unknown)))
+        return cls(**values)
+
+
+def calibrate(points, base=None):
+    """Fits the linear x and z correction of a calibration to reference
+    positions, by least squares on the geometric positions
+
+    Args:
+        points(iterable): (lrng, rrng, x, z) tuples: the ranges read with a
+            target at the known position x, z
+        base(:obj:`PositionCalibration`, optional): the geometry to fit the
+            correction for. Defaults to the nominal one
+
+    Returns:
+        a new PositionCalibration
+
+    Raises:
+        ValueError: fewer than two usable points, or all at one position
+    """
+    base = base or PositionCalibration()
+    geometry = base._replace(x_scale=1.0, x_offset=0.0, z_scale=1.0, z_offset=0.0)
+    pairs = []
+    for lrng, rrng, x, z in points:
+        solved = solve_ranges(geometry, lrng, rrng)
+        if (solved != None):
+            pairs.append((solved, (x, z)))
+    if (len(pairs) < 2):
+        raise ValueError("need at least two points with an object in range")
+
+    def fit(axis):
+        n = len(pairs)
+        measured = [solved[axis] for solved, reference in pairs]
+        wanted = [reference[axis] for solved, reference in pairs]
+        mean_m = sum(measured) / n
+        mean_w = sum(wanted) / n
+        var = sum((m - mean_m) ** 2 for m in measured)
+        if (var == 0):
+            raise ValueError("the points do not spread along {}".format('xz'[axis]))
+        scale = sum((m - mean_m) * (w - mean_w) for m, w in zip(measured, wanted)) / var
+        return scale, mean_w - scale * mean_m
+
+    x_scale, x_offset = fit(0)
+    z_scale, z_offset = fit(1)
+    return base._replace(x_scale=x_scale, x_offset=x_offset, z_scale=z_scale, z_offset=z_offset)
+
+
+def solve_ranges(calibration, lrng, rrng):
+    """Computes the position for one pair of ranges without a table
+
+    Returns:
+        (x, z) as floats, None if either range reports no object or the
+        ranges do not describe a point in the field
+    """
+    if (not 0 < lrng <= calibration.range_full) or (not 0 < rrng <= calibration.range_full):
+        return None
+    left = calibration.left_emitter
+    right = calibration.right_emitter
+    span = right - left
+    step = calibration.range_scale
+    d_l = (calibration.range_full - lrng) * step
+    d_r = (calibration.range_full - rrng) * step
+    # ranges are whole steps, so the circles may miss each other by up to
+    # one step and x may be off by up to half a step on each range
+    if (d_l + d_r < span - step) or (abs(d_l - d_r) > span + step):
+        return None
+    x = (d_l * d_l - d_r * d_r) / (2 * span) + (left + right) / 2
+    margin = step * (d_l + d_r) / (2 * span)
+    if (not -margin <= x <= MAX_X + margin):
+        return None
+    # within that slack the circles touch at z=0
+    z = math.sqrt(max(0.0, d_l * d_l - (x - left) ** 2))
+    x = min(float(MAX_X), max(0.0, calibration.x_scale * x + calibration.x_offset))
+    z = min(float(MAX_Z), max(0.0, calibration.z_scale * z + calibration.z_offset))
+    return x, z
+
+
+class PositionSolver(object):
+    """ Range pair -> X/Z lookup table for one calibration
+    """
+
+    def __init__(self, calibration=None):
+        """
+        Args:
+            calibration(:obj:`PositionCalibration`, optional): Defaults to
+                the nominal geometry
+        """
+        self.calibration = calibration or PositionCalibration()
+        # flat (lrng << 8 | rrng) tables, NaN where there is no object
+        self._x = None
+        self._z = None
+
+    def _build(self):
+        if (np != None):
+            lrng, rrng = np.meshgrid(np.arange(256, dtype=np.float64),
+                                     np.arange(256, dtype=np.float64), indexing='ij')
+            x, z = self.solve_arrays(lrng.ravel(), rrng.ravel())
+            self._x = array('d', x.tolist())
+            self._z = array('d', z.tolist())
+            return
+        xs = array('d', [NAN]) * 65536
+        zs = array('d', [NAN]) * 65536
+        for lrng in range(256):
+            for rrng in range(256):
+                solved = solve_ranges(self.calibration, lrng, rrng)
+                if (solved != None):
+                    xs[(lrng << 8) | rrng], zs[(lrng << 8) | rrng] = solved
+        self._x = xs
+        self._z = zs
+
+    def solve(self, lrng, rrng):
+        """Looks up the position for a pair of range register values
+
+        Returns:
+            (x, z) as floats, None if either range reports no object or
+            was not read
+        """
+        if (lrng == None) or (rrng == None):
+            return None
+        if (self._x == None):
+            self._build()
+        index = ((lrng & 0xFF) << 8) | (rrng & 0xFF)
+        x = self._x[index]
+        if (x != x):
+            return None
+        return x, self._z[index]
+
+    def solve_sample(self, sample):
+        """The position of a ZxSample, from its ranges"""
+        return self.solve(sample.lrng, sample.rrng)
+
+    def solve_arrays(self, lrng, rrng):
+        """Vectorized geometry for arrays of ranges, e.g. the lrng and rrng
+        columns of a zx_array.SampleColumnStore
+
+        Returns:
+            x and z float arrays, NaN where there is no object
+        """
+        if (np == None):
+            raise ImportError("PositionSolver.solve_arrays needs numpy (pip install numpy)")
+        cal = self.calibration
+        span = cal.right_emitter - cal.left_emitter
+        step = cal.range_scale
+        lrng = np.asarray(lrng, dtype=np.float64)
+        rrng = np.asarray(rrng, dtype=np.float64)
+        valid = (lrng > 0) & (lrng <= cal.range_full) & (rrng > 0) & (rrng <= cal.range_full)
+        d_l = (cal.range_full - lrng) * step
+        d_r = (cal.range_full - rrng) * step
+        # the same slack for quantised ranges as solve_ranges()
+        valid &= (d_l + d_r >= span - step) & (np.abs(d_l - d_r) <= span + step)
+        x = (d_l * d_l - d_r * d_r) / (2 * span) + (cal.left_emitter + cal.right_emitter) / 2
+        margin = step * (d_l + d_r) / (2 * span)
+        valid &= (x >= -margin) & (x <= MAX_X + margin)
+        z = np.sqrt(np.maximum(0.0, d_l * d_l - (x - cal.left_emitter) ** 2))
+        x = np.clip(cal.x_scale * x + cal.x_offset, 0.0, MAX_X)
+        z = np.clip(cal.z_scale * z + cal.z_offset, 0.0, MAX_Z)
+        return np.where(valid, x, np.nan), np.where(valid, z, np.nan)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+""" Presence triggered sampling: sleep on the DR pin until something is in
+range, stream at full rate while it stays
+
+PresenceMonitor switches between two states:
+
+* IDLE: only the range (DRE_RNG) and edge (DRE_EDGE) sources are enabled
+  and the host thread sleeps until the DR pin fires. No bus transactions
+  happen while nothing is in range. A missed edge is caught by checking
+  the pin level every `max_sleep` seconds, which costs no bus transaction
+* ACTIVE: DR is disabled and the sensor is read at `rate_hz` like a
+  ZxStream. Once nothing has been in range for `idle_timeout` seconds,
+  and the monitor has been active for at least `min_active` seconds, it
+  goes back to IDLE. The two timeouts are the hysteresis that keeps a hand
+  at the edge of the field from toggling the state on every frame
+
+Switching state is one config write, see ZxSensor.apply_config(). report()
+gives the time and CPU time spent in each state and the bus transactions
+and CPU time saved against polling at `rate_hz` all the time.
+"""
+
+# standard
+from __future__ import division, print_function
+import threading
+import time
+# project
+from .i2c_registers import *
+from .zx_stream import ZxStream
+
+IDLE = 'idle'
+ACTIVE = 'active'
+
+
+class PresenceMonitor(ZxStream):
+    """ ZxStream that only samples while an object is in range
+    """
+
+    def __init__(self, sensor, pin, rate_hz=100.0, idle_timeout=2.0, min_active=0.5,
+                 max_sleep=1.0, range_threshold=0, buffer_size=1024):
+        """
+        Args:
+            sensor(:obj:`ZxSensor`): the sensor to sample
+            pin(:obj:`DrPin`): backend for the DR pin, see zx_events
+            rate_hz(:obj:`float`, optional): sample rate while active.
+                Defaults to 100
+            idle_timeout(:obj:`float`, optional): seconds without an object
+                in range before going idle. Defaults to 2
+            min_active(:obj:`float`, optional): shortest time in seconds
+                spent active once woken. Defaults to 0.5
+            max_sleep(:obj:`float`, optional): seconds between checks of
+                the pin level while idle. Defaults to 1
+            range_threshold(:obj:`int`, optional): a range register above
+                this counts as an object in range. Defaults to 0
+            buffer_size(:obj:`int`, optional): ring buffer capacity in
+                samples. Defaults to 1024
+        """
+        super(PresenceMonitor, self).__init__(sensor, rate_hz, buffer_size)
+        self.pin = pin
+        self.idle_timeout = idle_timeout
+        self.min_active = min_active
+        self.max_sleep = max_sleep
+        self.range_threshold = range_threshold
+        self.state = None
+        self._wakeup = threading.Event()
+        self._listeners = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zeroes the counters and state times"""
+        self.transitions = 0
+        self.wakeups = 0
+        self.spurious_wakeups = 0
+        self.polls = 0
+        self.config_writes = 0
+        self.state_time = {IDLE: 0.0, ACTIVE: 0.0}
+        self.state_cpu = {IDLE: 0.0, ACTIVE: 0.0}
+        self._since = None
+        self._cpu_since = None
+
+    def on_state(self, callback):
+        """Registers `callback(state, timestamp)`, called from the monitor
+        thread on every change between IDLE and ACTIVE
+        """
+        self._listeners.append(callback)
+
+    def present(self, sample):
+        """Whether a sample shows an object in range"""
+        return (sample.x != None and sample.position_available) or \
+            max(sample.lrng, sample.rrng) > self.range_threshold
+
+    # ===========
+    # State flips
+    # ===========
+
+    def _account(self, now):
+        # charge the time since the last flip to the current state
+        cpu = time.thread_time()
+        if (self.state != None):
+            self.state_time[self.state] += now - self._since
+            self.state_cpu[self.state] += cpu - self._cpu_since
+        self._since = now
+        self._cpu_since = cpu
+
+    def _enter(self, state, now):
+        self._account(now)
+        config = self.sensor.read_config()
+        if (config != None):
+            before = config.copy()
+            if (state == IDLE):
+                for field in ('position_interrupt', 'swipe_interrupt', 'hover_interrupt',
+                              'hover_move_interrupt'):
+                    setattr(config, field, False)
+                config.range_interrupt = True
+                config.edge_interrupt = True
+                config.active_high = self.pin.active_high
+                config.pulse = False
+                config.enabled = True
+            else:
+                # the pin is not needed while polling
+                config.enabled = False
+            if (config != before):
+                self.config_writes += 1
+            if (not self.sensor.apply_config(config)):
+                self.logger.error("Could not configure the sensor for %s", state)
+        if (self.state != None):
+            self.transitions += 1
+        self.logger.debug("presence %s -> %s", self.state, state)
+        self.state = state
+        for callback in list(self._listeners):
+            callback(state, now)
+
+    # ====
+    # Loop
+    # ====
+
+    def _on_edge(self):
+        self._wakeup.set()
+
+    def start(self):
+        self._wakeup.clear()
+        super(PresenceMonitor, self).start()
+
+    def stop(self, timeout=None):
+        self._running.clear()
+        self._wakeup.set()
+        super(PresenceMonitor, self).stop(timeout)
+
+    def _read(self):
+        self.polls += 1
+        sample = self.sensor.read_snapshot()
+        if (sample == None):
+            self.errors += 1
+        return sample
+
+    def _run(self):
+        self.pin.start(self._on_edge)
+        try:
+            self._loop()
+        finally:
+            self.pin.stop()
+            self._account(time.monotonic())
+            self.logger.debug("presence monitor stopped, %d transitions", self.transitions)
+
+    def _loop(self):
+        now = time.monotonic()
+        self._enter(IDLE, now)
+        # something may already be in range, and reading clears STATUS
+        sample = self._read()
+        if (sample != None) and (self.present(sample)):
+            self._enter(ACTIVE, now)
+        entered = last_seen = now
+        deadline = now
+        while (self._running.is_set()):
+            if (self.state == IDLE):
+                fired = self._wakeup.wait(self.max_sleep)
+                self._wakeup.clear()
+                if (not self._running.is_set()):
+                    break
+                if (not fired) and (not self.pin.is_asserted()):
+                    continue
+                self.wakeups += 1
+                sample = self._read()
+                now = time.monotonic()
+                if (sample == None) or (not self.present(sample)):
+                    # e.g. the edge of something leaving
+                    self.spurious_wakeups += 1
+                    continue
+                self.ring.push(sample)
+                self._enter(ACTIVE, now)
+                entered = last_seen = deadline = now
+                continue
+
+            sample = self._read()
+            now = time.monotonic()
+            if (sample != None):
+                self.ring.push(sample)
+                if (self.present(sample)):
+                    last_seen = now
+            if (now - last_seen >= self.idle_timeout) and (now - entered >= self.min_active):
+                self._enter(IDLE, now)
+                # an object arriving during the switch latched STATUS;
+                # this read sees it and clears DR for the next edge
+                sample = self._read()
+                if (sample != None) and (self.present(sample)):
+                    self._enter(ACTIVE, time.monotonic())
+                    entered = last_seen = deadline = time.monotonic()
+                continue
+
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if (delay > 0):
+                time.sleep(delay)
+            elif (delay < -self.period):
+                self.late_ticks += 1
+                deadline = time.monotonic()
+
+    def report(self):
+        """Time in each state and the savings against full rate polling
+
+        Returns:
+            a JSON serialisable dict. Bus transactions count snapshot reads
+            and config writes; the baseline polls at rate_hz throughout.
+            CPU times are of the monitor thread.
+        """
+        state_time = dict(self.state_time)
+        state_cpu = dict(self.state_cpu)
+        if (self.state != None) and (self._running.is_set()):
+            # include the current state up to now
+            state_time[self.state] += time.monotonic() - self._since
+        elapsed = state_time[IDLE] + state_time[ACTIVE]
+        transactions = self.polls + self.config_writes
+        baseline = elapsed / self.period
+        # CPU per poll while active, scaled to polling all the time
+        active_polls = state_time[ACTIVE] / self.period
+        cpu = state_cpu[IDLE] + state_cpu[ACTIVE]
+        baseline_cpu = state_cpu[ACTIVE] / active_polls * baseline if active_polls >= 1 else None
+        return {
+            'state': self.state,
+            'elapsed': elapsed,
+            'time_idle': state_time[IDLE],
+            'time_active': state_time[ACTIVE],
+            'duty_cycle': state_time[ACTIVE] / elapsed if elapsed else 0.0,
+            'transitions': self.transitions,
+            'wakeups': self.wakeups,
+            'spurious_wakeups': self.spurious_wakeups,
+            'transactions': transactions,
+            'baseline_transactions': int(baseline),
+            'bus_savings': 1.0 - transactions / baseline if baseline >= 1 else 0.0,
+            'cpu_idle_s': state_cpu[IDLE],
+            'cpu_active_s': state_cpu[ACTIVE],
+            'baseline_cpu_s': baseline_cpu,
+            'cpu_savings': 1.0 - cpu / baseline_cpu if baseline_cpu else None,
+            'errors': self.errors,
+        }
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+""" Append-only binary recordings of sensor sessions and their replay
+
+File layout, little endian:
+
+* a 32 byte file header: magic, version, sample and trace record sizes
+  and the wall clock time the file was created
+* any number of chunks. A chunk header holds the chunk type (b'S'
+  samples, b'T' trace), the record count and the first and last
+  timestamp, followed by that many fixed size records
+
+A sample record is the timestamp of the ZxSample and the raw register
+block read by read_snapshot() (ZX_SNAPSHOT_LENGTH registers from
+ZX_SNAPSHOT_START), so a replayed sample equals the live one. A trace
+record is one bus transaction. Records are collected in a preallocated
+chunk buffer and written one chunk at a time; an interrupted recording
+loses at most the last unwritten chunk.
+
+Recordings are read through mmap. The chunk index is built on open, and
+seek() bisects it by time without reading any records.
+
+Timestamps are time.monotonic() values, which start over when the host
+reboots. Appending to a file after a reboot starts a run whose timestamps
+may be smaller than those before it; seek(), samples(start, end) and
+replay assume timestamps that never decrease, so they are only meaningful
+within one run. Record each boot to its own file, `created` in the file
+header is the wall clock time the file was started.
+"""
+
+# standard
+from __future__ import division, print_function
+from bisect import bisect_right
+import mmap
+import os
+import struct
+import threading
+import time
+# project
+from .i2c_registers import *
+from .transport import ZxTransport
+from .trace import TraceRecord
+from .zx_sample import ZxSample
+
+RECORDING_MAGIC = b'ZXREC\x00'
+RECORDING_VERSION = 1
+OPERATIONS = ('readU8', 'readList', 'write8', 'writeList')
+
+# magic, version, sample record size, trace record size, created
+_FILE_HEADER = struct.Struct('<6sHHHd12x')
+# type, record count, first and last timestamp
+_CHUNK_HEADER = struct.Struct('<c3xIdd')
+# timestamp and the snapshot register block
+_SAMPLE_RECORD = struct.Struct('<d{}Bx'.format(ZX_SNAPSHOT_LENGTH))
+# timestamp, operation, register, data length, failed, data
+_TRACE_RECORD = struct.Struct('<dBBBB16s4x')
+_SAMPLE_CHUNK = b'S'
+_TRACE_CHUNK = b'T'
+
+
+def registers_from_sample(sample):
+    """Rebuilds the snapshot register block of a ZxSample, e.g. one read
+    from the UART. Registers a ZxSample does not carry are 0.
+    """
+    regs = [0] * ZX_SNAPSHOT_LENGTH
+    regs[ZX_STATUS] = sample.status
+    regs[ZX_GESTURE] = sample.gesture.value
+    regs[ZX_GSPEED] = sample.speed
+    regs[ZX_XPOS] = ZX_ERROR if sample.x == None else int(sample.x)
+    regs[ZX_ZPOS] = ZX_ERROR if sample.z == None else int(sample.z)
+    regs[ZX_LRNG] = sample.lrng
+    regs[ZX_RRNG] = sample.rrng
+    return regs
+
+
+class _ChunkBuffer(object):
+    # one preallocated chunk of fixed size records
+
+    def __init__(self, kind, record, capacity):
+        self.kind = kind
+        self.record = record
+        self.capacity = capacity
+        self.data = bytearray(_CHUNK_HEADER.size + capacity * record.size)
+        self.count = 0
+        self.first = 0.0
+        self.last = 0.0
+
+    def append(self, timestamp, *fields):
+        if (self.count == 0):
+            self.first = timestamp
+        self.last = timestamp
+        self.record.pack_into(self.data, _CHUNK_HEADER.size + self.count * self.record.size,
+                              timestamp, *fields)
+        self.count += 1
+        return self.count == self.capacity
+
+    def write(self, outfile):
+        if (self.count == 0):
+            return
+        _CHUNK_HEADER.pack_into(self.data, 0, self.kind, self.count, self.first, self.last)
+        view = memoryview(self.data)
+        outfile.write(view[:_CHUNK_HEADER.size + self.count * self.record.size])
+        self.count = 0
+
+
+class RecordingWriter(object):
+    """ Appends samples and, optionally, bus transactions to a recording
+    """
+
+    def __init__(self, path, chunk_records=512, trace=False):
+        """
+        Args:
+            path(:obj:`str`): file to append to; created if missing
+            chunk_records(:obj:`int`, optional): records per chunk.
+                Defaults to 512
+            trace(bool, optional): also accept transactions through
+                append_transaction(). Defaults to False
+        """
+        self.path = path
+        self.trace = trace
+        self.samples = 0
+        self.transactions = 0
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if (not new):
+            with open(path, 'rb') as infile:
+                _check_header(infile.read(_FILE_HEADER.size), path)
+        self._file = open(path, 'ab')
+        if (new):
+            self._file.write(_FILE_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION,
+                                               _SAMPLE_RECORD.size, _TRACE_RECORD.size,
+                                               time.time()))
+        self._samples = _ChunkBuffer(_SAMPLE_CHUNK, _SAMPLE_RECORD, chunk_records)
+        self._trace = _ChunkBuffer(_TRACE_CHUNK, _TRACE_RECORD, chunk_records) if trace else None
+
+    def append_registers(self, timestamp, regs):
+        """Records one snapshot register block"""
+        with self._lock:
+            self.samples += 1
+            if (self._samples.append(timestamp, *regs)):
+                self._samples.write(self._file)
+
+    def append_sample(self, sample):
+        """Records a ZxSample, see registers_from_sample()"""
+        self.append_registers(sample.timestamp, registers_from_sample(sample))
+
+    def extend(self, samples):
+        """Records a list of ZxSamples, e.g. from ZxStream.drain()"""
+        for sample in samples:
+            self.append_sample(sample)
+
+    def append_transaction(self, timestamp, op, reg, data, failed):
+        """Records one bus transaction
+
+        Args:
+            timestamp(float): time the transaction completed
+            op(:obj:`str`): one of OPERATIONS
+            reg(:obj:`int`): first register
+            data(list): bytes written or read, at most 16 are kept
+            failed(bool): whether the transport reported an error
+        """
+        if (self._trace == None):
+            return
+        data = bytes(bytearray(data[:16]))
+        with self._lock:
+            self.transactions += 1
+            if (self._trace.append(timestamp, OPERATIONS.index(op), reg, len(data),
+                                   1 if failed else 0, data)):
+                self._trace.write(self._file)
+
+    def flush(self):
+        """Writes the partially filled chunks"""
+        with self._lock:
+            self._samples.write(self._file)
+            if (self._trace != None):
+                self._trace.write(self._file)
+            self._file.flush()
+
+    def close(self):
+        if (self._file.closed):
+            return
+        self.flush()
+        self._file.close()
+
+
+def _check_header(data, path):
+    if (len(data) < _FILE_HEADER.size):
+        raise ValueError("{} is not a zxsensor recording".format(path))
+    magic, version, sample_size, trace_size, created = _FILE_HEADER.unpack_from(data, 0)
+    if (magic != RECORDING_MAGIC) or (version != RECORDING_VERSION) or \
+            (sample_size != _SAMPLE_RECORD.size) or (trace_size != _TRACE_RECORD.size):
+        raise ValueError("{} is not a zxsensor recording of version {}".format(path, RECORDING_VERSION))
+    return created
+
+
+class RecordingTransport(object):
+    """ Transport wrapper recording every transaction to a tracing
+    RecordingWriter. Samples are recorded by ZxSensor.read_snapshot()
+    """
+
+    def __init__(self, transport, writer):
+        self.transport = transport
+        self.writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def _raised(self, op, reg):
+        # the transaction raised, e.g. a ZxBusError; the caller re-raises
+        self.writer.append_transaction(time.monotonic(), op, reg, [], True)
+
+    def readU8(self, reg):
+        try:
+            val = self.transport.readU8(reg)
+        except IOError:
+            self._raised('readU8', reg)
+            raise
+        failed = val == None or val < 0
+        self.writer.append_transaction(time.monotonic(), 'readU8', reg,
+                                       [] if failed else [val], failed)
+        return val
+
+    def readList(self, reg, length):
+        try:
+            regs = self.transport.readList(reg, length)
+        except IOError:
+            self._raised('readList', reg)
+            raise
+        ok = isinstance(regs, list)
+        self.writer.append_transaction(time.monotonic(), 'readList', reg,
+                                       regs if ok else [], not ok)
+        return regs
+
+    def readinto(self, reg, buffer):
+        try:
+            count = self.transport.readinto(reg, buffer)
+        except IOError:
+            self._raised('readList', reg)
+            raise
+        ok = (count != None) and (count >= 0)
+        self.writer.append_transaction(time.monotonic(), 'readList', reg,
+                                       buffer[:count] if ok else [], not ok)
+        return count
+
+    def write8(self, reg, value):
+        try:
+            retval = self.transport.write8(reg, value)
+        except IOError:
+            self._raised('write8', reg)
+            raise
+        self.writer.append_transaction(time.monotonic(), 'write8', reg, [value], retval != None)
+        return retval
+
+    def writeList(self, reg, list):
+        try:
+            retval = self.transport.writeList(reg, list)
+        except IOError:
+            self._raised('writeList', reg)
+            raise
+        self.writer.append_transaction(time.monotonic(), 'writeList', reg, list, retval != None)
+        return retval
+
+
+# =======
+# Reading
+# =======
+
+class Recording(object):
+    """ Memory mapped, read-only view of a recording
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path(:obj:`str`): the recording to open
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if (size < _FILE_HEADER.size):
+            self._file.close()
+            raise ValueError("{} is not a zxsensor recording".format(path))
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.created = _check_header(self._map, path)
+        # per chunk: offset of the first record, record count, first timestamp
+        self._sample_chunks = []
+        self._trace_chunks = []
+        self._index(size)
+        # samples before each chunk, for mapping record numbers to chunks
+        self._starts = []
+        total = 0
+        for offset, count, first in self._sample_chunks:
+            self._starts.append(total)
+            total += count
+        self._count = total
+        self._first_times = [first for offset, count, first in self._sample_chunks]
+
+    def _index(self, size):
+        offset = _FILE_HEADER.size
+        while (offset + _CHUNK_HEADER.size <= size):
+            kind, count, first, last = _CHUNK_HEADER.unpack_from(self._map, offset)
+            record = _SAMPLE_RECORD if kind == _SAMPLE_CHUNK else _TRACE_RECORD
+            end = offset + _CHUNK_HEADER.size + count * record.size
+            if (kind not in (_SAMPLE_CHUNK, _TRACE_CHUNK)) or (end > size):
+                # torn write at the end of an interrupted recording
+                break
+            chunks = self._sample_chunks if kind == _SAMPLE_CHUNK else self._trace_chunks
+            chunks.append((offset + _CHUNK_HEADER.size, count, first))
+            offset = end
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def start_time(self):
+        return self.timestamp(0) if self._count else None
+
+    @property
+    def end_time(self):
+        return self.timestamp(self._count - 1) if self._count else None
+
+    def _locate(self, i):
+        if (i < 0):
+            i += self._count
+        if (not 0 <= i < self._count):
+            raise IndexError("sample index out of range")
+        chunk = bisect_right(self._starts, i) - 1
+        offset = self._sample_chunks[chunk][0]
+        return offset + (i - self._starts[chunk]) * _SAMPLE_RECORD.size
+
+    def timestamp(self, i):
+        """Timestamp of sample number i"""
+        return struct.unpack_from('<d', self._map, self._locate(i))[0]
+
+    def registers(self, i):
+        """Returns (timestamp, register block) of sample number i"""
+        fields = _SAMPLE_RECORD.unpack_from(self._map, self._locate(i))
+        return fields[0], fields[1:]
+
+    def sample(self, i):
+        """Returns sample number i as a ZxSample"""
+        timestamp, regs = self.registers(i)
+        return ZxSample.from_registers(regs, timestamp)
+
+    def __getitem__(self, i):
+        return self.sample(i)
+
+    def seek(self, timestamp):
+        """Index of the first sample at or after `timestamp`, len(self) if
+        there is none
+        """
+        chunk = bisect_right(self._first_times, timestamp) - 1
+        if (chunk < 0):
+            return 0
+        offset, count, first = self._sample_chunks[chunk]
+        # bisect within the chunk on the mapped timestamps
+        lo, hi = 0, count
+        while (lo < hi):
+            mid = (lo + hi) // 2
+            if (struct.unpack_from('<d', self._map, offset + mid * _SAMPLE_RECORD.size)[0] < timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return self._starts[chunk] + lo
+
+    def samples(self, start=None, end=None):
+        """Yields the ZxSamples recorded in [start, end) seconds
+
+        Args:
+            start(:obj:`float`, optional): first timestamp. Defaults to the
+                beginning
+            end(:obj:`float`, optional): end timestamp. Defaults to the end
+        """
+        first = 0 if start == None else self.seek(start)
+        last = self._count if end == None else self.seek(end)
+        for i in range(first, last):
+            yield self.sample(i)
+
+    def __iter__(self):
+        return self.samples()
+
+    def trace(self):
+        """Yields the recorded transactions as TraceRecords"""
+        for offset, count, first in self._trace_chunks:
+            for i in range(count):
+                timestamp, op, reg, length, failed, data = _TRACE_RECORD.unpack_from(
+                    self._map, offset + i * _TRACE_RECORD.size)
+                op = OPERATIONS[op]
+                data = list(bytearray(data[:length]))
+                if (op in ('write8', 'writeList')):
+                    value = data[0] if op == 'write8' and data else data
+                    result = -1 if failed else None
+                else:
+                    value = length if op == 'readList' else None
+                    result = -1 if failed else (data[0] if op == 'readU8' else data)
+                yield TraceRecord(timestamp, None, op, reg, value, result)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class ReplayTransport(ZxTransport):
+    """ Feeds a recording to ZxSensor as if it came from the bus
+
+    Snapshot reads return the sample that was current at the replay time.
+    STATUS flags are cleared once read, like on the device. Writes are
+    accepted and kept, but do not change the recorded data.
+    """
+
+    def __init__(self, recording, speed=1.0, loop=False, address=0x10):
+        """
+        Args:
+            recording(:obj:`Recording`): what to replay
+            speed(:obj:`float`, optional): replay speed factor, 1 for the
+                recorded speed. None steps one sample per snapshot read, as
+                fast as the reader goes. Defaults to 1
+            loop(bool, optional): start over at the end. Defaults to False
+            address(:obj:`int`, optional): reported i2c address
+        """
+        self.recording = recording
+        self.speed = speed
+        self.loop = loop
+        self.address = address
+        self.busnum = 'replay'
+        self.lastError = None
+        self.regs = bytearray(256)
+        self.regs[ZX_MODEL] = ZX_MODEL_VER
+        self.regs[ZX_REGVER] = ZX_REG_MAP_VER
+        self.regs[ZX_XPOS] = ZX_ERROR
+        self.regs[ZX_ZPOS] = ZX_ERROR
+        self.position = 0
+        self._origin = None
+        self._lock = threading.RLock()
+
+    @property
+    def finished(self):
+        """True once every sample has been replayed"""
+        return self.position >= len(self.recording) and not self.loop
+
+    def rewind(self, timestamp=None):
+        """Restarts the replay, optionally at a recorded timestamp"""
+        with self._lock:
+            self.position = 0 if timestamp == None else self.recording.seek(timestamp)
+            self._origin = None
+
+    def _load(self, i):
+        timestamp, regs = self.recording.registers(i)
+        for offset, value in enumerate(regs):
+            reg = ZX_SNAPSHOT_START + offset
+            if (reg == ZX_STATUS):
+                # unread flags accumulate like on the device
+                value |= self.regs[ZX_STATUS] & ~(1 << STATUS_HB)
+            if (reg not in ZX_CONFIG_REGISTERS):
+                self.regs[reg] = value
+
+    def _advance(self, snapshot):
+        count = len(self.recording)
+        if (count == 0):
+            return
+        if (self.position >= count):
+            if (not self.loop):
+                return
+            self.position = 0
+            self._origin = None
+        if (self.speed == None):
+            if (snapshot):
+                self._load(self.position)
+                self.position += 1
+            return
+        now = time.monotonic()
+        if (self._origin == None):
+            self._origin = (now, self.recording.timestamp(self.position))
+        target = self._origin[1] + (now - self._origin[0]) * self.speed
+        due = self.recording.seek(target + 1e-9)
+        while (self.position < due):
+            self._load(self.position)
+            self.position += 1
+
+    def _read(self, reg):
+        val = self.regs[reg]
+        if (reg == ZX_STATUS):
+            # flags clear on read until the next recorded sample
+            self.regs[ZX_STATUS] = val & (1 << STATUS_HB)
+        return val
+
+    def readU8(self, reg):
+        with self._lock:
+            self._advance(False)
+            return self._read(reg)
+
+    def readList(self, reg, length):
+        with self._lock:
+            self._advance(reg == ZX_SNAPSHOT_START)
+            return [self._read((reg + i) & 0xFF) for i in range(min(length, 32))]
+
+    def write8(self, reg, value):
+        with self._lock:
+            self.regs[reg] = value
+
+    def writeList(self, reg, list):
+        with self._lock:
+            for i, value in enumerate(list[:32]):
+                self.regs[(reg + i) & 0xFF] = value
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+""" Declarative model of the zx_sensor registers
+
+Every register is a Register holding its Fields; a Field knows its
+register, bit position and width and precomputes its mask. ZxConfig is the
+whole writable configuration of a device (DRE and DRCFG) as one value:
+fields are set by name and validated on assignment, and changes() works
+out the minimal set of contiguous block writes that turn the known device
+state into the configuration.
+
+    config = sensor.read_config()
+    config.swipe_interrupt = True
+    config.enabled = True
+    sensor.apply_config(config)   # one write, or none if nothing changed
+
+The flat constants in i2c_registers stay the reference for the bit
+numbers; this module is built from them.
+"""
+
+# standard
+from __future__ import division, print_function
+from collections import OrderedDict
+# project
+from .i2c_registers import *
+
+
+class Field(object):
+    """ A bitfield of one register, usable as a descriptor on ZxConfig
+
+    Attributes:
+        name(str): field name
+        register(int): register address
+        shift(int): position of the lowest bit
+        width(int): number of bits
+        mask(int): the field's bits within the register
+        readonly(bool): whether the field may be set
+    """
+
+    def __init__(self, name, register, shift, width=1, readonly=False, doc=None):
+        self.name = name
+        self.register = register
+        self.shift = shift
+        self.width = width
+        self.readonly = readonly
+        self.limit = (1 << width) - 1
+        self.mask = self.limit << shift
+        self.__doc__ = doc
+
+    def decode(self, value):
+        """Extracts the field from a register value; bool for single bits"""
+        field = (value & self.mask) >> self.shift
+        return bool(field) if self.width == 1 else field
+
+    def encode(self, value, field):
+        """Returns the register value with the field replaced
+
+        Raises:
+            ValueError: the field value does not fit the field
+        """
+        field = int(field)
+        if (not 0 <= field <= self.limit):
+            raise ValueError("{} takes 0-{}, got {}".format(self.name, self.limit, field))
+        return (value & ~self.mask) | (field << self.shift)
+
+    def __get__(self, config, owner):
+        if (config == None):
+            return self
+        return self.decode(config[self.register])
+
+    def __set__(self, config, field):
+        if (self.readonly):
+            raise AttributeError("{} is read-only".format(self.name))
+        config[self.register] = self.encode(config[self.register], field)
+
+    def __repr__(self):
+        return "Field({!r}, 0x{:02X}, {}, {})".format(self.name, self.register, self.shift, self.width)
+
+
+class Register(object):
+    """ A register and its fields
+
+    Attributes:
+        name(str): register name
+        address(int): register address
+        fields(tuple): the Fields, lowest bit first
+        writable(bool): whether the host may write the register
+    """
+
+    def __init__(self, name, address, fields=(), writable=False):
+        self.name = name
+        self.address = address
+        self.fields = tuple(fields)
+        self.writable = writable
+        # all bits covered by a field
+        self.mask = 0
+        for field in self.fields:
+            self.mask |= field.mask
+
+    def decode(self, value):
+        """Returns an OrderedDict of the field values of a register value"""
+        return OrderedDict((field.name, field.decode(value)) for field in self.fields)
+
+    def __repr__(self):
+        return "Register({!r}, 0x{:02X})".format(self.name, self.address)
+
+
+def _bits(register, names):
+    # one single bit field per (name, bit) pair
+    return [Field(name, register, bit, readonly=True) for name, bit in names]
+
+
+DRE_FIELDS = (
+    Field('range_interrupt', ZX_DRE, DRE_RNG, doc="DR asserts on new ranges"),
+    Field('position_interrupt', ZX_DRE, DRE_CRD, doc="DR asserts on new X/Z"),
+    Field('swipe_interrupt', ZX_DRE, DRE_SWP, doc="DR asserts on swipes"),
+    Field('hover_interrupt', ZX_DRE, DRE_HOVER, doc="DR asserts on hovers"),
+    Field('hover_move_interrupt', ZX_DRE, DRE_HVG, doc="DR asserts on hover-moves"),
+    Field('edge_interrupt', ZX_DRE, DRE_EDGE, doc="DR asserts on entering or leaving"),
+)
+DRCFG_FIELDS = (
+    Field('active_high', ZX_DRCFG, DRCFG_POLARITY, doc="DR is active-high"),
+    Field('pulse', ZX_DRCFG, DRCFG_EDGE, doc="DR pulses instead of staying asserted until STATUS is read"),
+    Field('force', ZX_DRCFG, DRCFG_FORCE, doc="forces DR to assert"),
+    Field('enabled', ZX_DRCFG, DRCFG_EN, doc="DR asserts at all"),
+)
+
+REGISTERS = OrderedDict((register.address, register) for register in (
+    Register('STATUS', ZX_STATUS, _bits(ZX_STATUS, (
+        ('dav', STATUS_DAV), ('ovf', STATUS_OVF), ('swp', STATUS_SWP), ('hover', STATUS_HOVER),
+        ('hvg', STATUS_HVG), ('edge', STATUS_EDGE), ('heartbeat', STATUS_HB)))),
+    Register('DRE', ZX_DRE, DRE_FIELDS, writable=True),
+    Register('DRCFG', ZX_DRCFG, DRCFG_FIELDS, writable=True),
+    Register('GESTURE', ZX_GESTURE, [Field('gesture', ZX_GESTURE, 0, 8, readonly=True)]),
+    Register('GSPEED', ZX_GSPEED, [Field('speed', ZX_GSPEED, 0, 8, readonly=True)]),
+    Register('DCM', ZX_DCM),
+    Register('XPOS', ZX_XPOS, [Field('x', ZX_XPOS, 0, 8, readonly=True)]),
+    Register('ZPOS', ZX_ZPOS, [Field('z', ZX_ZPOS, 0, 8, readonly=True)]),
+    Register('LRNG', ZX_LRNG, [Field('left_range', ZX_LRNG, 0, 8, readonly=True)]),
+    Register('RRNG', ZX_RRNG, [Field('right_range', ZX_RRNG, 0, 8, readonly=True)]),
+    Register('REGVER', ZX_REGVER, [Field('register_map_version', ZX_REGVER, 0, 8, readonly=True)]),
+    Register('MODEL', ZX_MODEL, [Field('model_version', ZX_MODEL, 0, 8, readonly=True)]),
+))
+
+# interrupt_type -> (DRE bits, whether they replace the enabled sources)
+_GESTURE_BITS = (1 << DRE_SWP) | (1 << DRE_HOVER) | (1 << DRE_HVG)
+INTERRUPT_DRE_BITS = {
+    interrupt_type.NO_INTERRUPTS: (0x00, True),
+    interrupt_type.POSITION_INTERRUPTS: (1 << DRE_CRD, False),
+    interrupt_type.GESTURE_INTERRUPTS: (_GESTURE_BITS, False),
+    interrupt_type.ALL_INTERRUPTS: (SET_ALL_DRE, True),
+}
+
+
+class ZxConfig(object):
+    """ The writable configuration of a zx_sensor: the ZX_CONFIG_REGISTERS
+    values, with every field of DRE and DRCFG as an attribute
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, values=None, **fields):
+        """
+        Args:
+            values(dict, optional): register address -> value. Defaults to
+                all config registers 0
+            **fields: field values to set, e.g. swipe_interrupt=True
+        """
+        self._values = dict((reg, 0) for reg in ZX_CONFIG_REGISTERS)
+        if (values != None):
+            for reg, value in values.items():
+                self[reg] = value
+        for name, value in fields.items():
+            if (not isinstance(getattr(type(self), name, None), Field)):
+                raise AttributeError("ZxConfig has no field {!r}".format(name))
+            setattr(self, name, value)
+
+    def __getitem__(self, reg):
+        return self._values[reg]
+
+    def __setitem__(self, reg, value):
+        if (reg not in self._values):
+            raise KeyError("0x{:02X} is not a config register".format(reg))
+        value = int(value)
+        if (not 0 <= value <= 0xFF):
+            raise ValueError("register 0x{:02X} takes 0-255, got {}".format(reg, value))
+        self._values[reg] = value
+
+    def __eq__(self, other):
+        return isinstance(other, ZxConfig) and self._values == other._values
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        fields = ', '.join('{}={}'.format(field.name, field.__get__(self, ZxConfig))
+                           for field in DRE_FIELDS + DRCFG_FIELDS)
+        return 'ZxConfig({})'.format(fields)
+
+    def copy(self):
+        return ZxConfig(self._values)
+
+    def registers(self):
+        """Returns the register values as an address -> value dict"""
+        return dict(self._values)
+
+    def set_interrupts(self, interrupts):
+        """Applies an interrupt_type the way set_interrupt_trigger() always
+        has: POSITION and GESTURE add their sources to the enabled ones,
+        NO_INTERRUPTS and ALL_INTERRUPTS replace them
+        """
+        bits, replace = INTERRUPT_DRE_BITS[interrupts]
+        self[ZX_DRE] = bits if replace else self[ZX_DRE] | bits
+
+    def changes(self, current):
+        """The block writes turning `current` into this configuration
+
+        Args:
+            current(dict): register address -> value known on the device;
+                registers missing from it are written
+
+        Returns:
+            a list of (first register, [values]) runs of contiguous changed
+            registers, empty if nothing changed
+        """
+        runs = []
+        for reg in sorted(self._values):
+            value = self._values[reg]
+            if (current.get(reg) == value):
+                continue
+            if (runs) and (runs[-1][0] + len(runs[-1][1]) == reg):
+                runs[-1][1].append(value)
+            else:
+                runs.append((reg, [value]))
+        return runs
+
+
+# the fields are the attributes of ZxConfig
+for _field in DRE_FIELDS + DRCFG_FIELDS:
+    setattr(ZxConfig, _field.name, _field)
+del _field
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+""" Retries, time budgets and a circuit breaker around a transport
+
+ResilientTransport wraps any ZxTransport. A failed transaction (-1 from a
+read, a non-None return from a write, or an IOError) is retried with
+exponential backoff and full jitter until it succeeds, the retries are
+used up or the time budget is spent, and then a typed exception from
+errors.py is raised instead of handing -1 back to the caller.
+
+Consecutive failures open a per-device circuit breaker: further
+transactions fail immediately with ZxCircuitOpenError until
+`reset_timeout` has passed, then a single trial transaction decides
+whether the breaker closes again. Listeners registered with on_recover()
+are called once a failing device answers again. They run inside that
+transaction, below any wrappers stacked on top, so ZxSensor only notes the
+recovery there and checks its configuration once the transaction has
+returned through the whole stack.
+"""
+
+# standard
+from __future__ import division, print_function
+import logging
+import random
+import time
+# project
+from .errors import ZxBusError, ZxTimeoutError, ZxCircuitOpenError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def _is_failure(op, val):
+    if (op in ('readU8', 'readList', 'readinto')):
+        return val == None or (op != 'readList' and val < 0) or \
+            (op == 'readList' and not isinstance(val, list))
+    return val != None
+
+
+class ResilientTransport(object):
+    """ Transport wrapper with retries and a circuit breaker
+    """
+
+    def __init__(self, transport, retries=3, backoff=0.001, max_backoff=0.05,
+                 timeout=0.25, failure_threshold=5, reset_timeout=1.0, seed=None):
+        """
+        Args:
+            transport(:obj:`ZxTransport`): the transport to wrap
+            retries(:obj:`int`, optional): extra attempts after a failure.
+                Defaults to 3
+            backoff(:obj:`float`, optional): first backoff in seconds, it
+                doubles with every retry. Defaults to 0.001
+            max_backoff(:obj:`float`, optional): backoff cap in seconds.
+                Defaults to 0.05
+            timeout(:obj:`float`, optional): time budget in seconds for one
+                transaction including its retries. None for no budget.
+                Defaults to 0.25
+            failure_threshold(:obj:`int`, optional): consecutive failed
+                transactions that open the breaker. Defaults to 5
+            reset_timeout(:obj:`float`, optional): seconds the breaker stays
+                open before a trial transaction. Defaults to 1.0
+            seed(optional): seed for the jitter
+        """
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logging.getLogger('ZxSensor.resilient')
+        self.state = CLOSED
+        self._random = random.Random(seed)
+        self._failures = 0
+        self._opened_at = None
+        # start of the current outage, None while the device answers
+        self._outage_start = None
+        self._listeners = []
+        self.reset_stats()
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def reset_stats(self):
+        """Zeroes the counters and recovery times"""
+        self.transactions = 0
+        self.attempts = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self.breaker_opened = 0
+        self.recovery_times = []
+
+    def on_recover(self, callback):
+        """Registers `callback(outage_seconds)`, called from the transaction
+        that first succeeds after one or more failed transactions
+        """
+        self._listeners.append(callback)
+
+    # ===============
+    # Circuit breaker
+    # ===============
+
+    def _admit(self):
+        if (self.state != OPEN):
+            return
+        waited = time.monotonic() - self._opened_at
+        if (waited < self.reset_timeout):
+            self.rejected += 1
+            raise ZxCircuitOpenError(getattr(self.transport, 'address', None),
+                                     self.reset_timeout - waited)
+        self.state = HALF_OPEN
+        self.logger.info("circuit half open, trying one transaction")
+
+    def _succeeded(self):
+        self._failures = 0
+        if (self.state != CLOSED):
+            self.logger.info("circuit closed")
+            self.state = CLOSED
+        if (self._outage_start != None):
+            outage = time.monotonic() - self._outage_start
+            self._outage_start = None
+            self.recovery_times.append(outage)
+            for callback in list(self._listeners):
+                callback(outage)
+
+    def _failed(self):
+        self.failed += 1
+        self._failures += 1
+        if (self._outage_start == None):
+            self._outage_start = time.monotonic()
+        if (self.state == HALF_OPEN) or (self._failures >= self.failure_threshold):
+            if (self.state != OPEN):
+                self.breaker_opened += 1
+                self.logger.warning("circuit open after %d failed transactions", self._failures)
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    # ============
+    # Transactions
+    # ============
+
+    def _call(self, op, reg, *args):
+        self._admit()
+        self.transactions += 1
+        method = getattr(self.transport, op)
+        start = time.monotonic()
+        delay = self.backoff
+        cause = None
+        attempt = 0
+        while (True):
+            attempt += 1
+            self.attempts += 1
+            try:
+                val = method(reg, *args)
+                if (not _is_failure(op, val)):
+                    self._succeeded()
+                    return val
+                cause = getattr(self.transport, 'lastError', None) or val
+            except IOError as err:
+                cause = err
+            if (attempt > self.retries) or (self.state == HALF_OPEN):
+                break
+            sleep = self._random.uniform(0, min(delay, self.max_backoff))
+            if (self.timeout != None) and (time.monotonic() - start + sleep > self.timeout):
+                self._failed()
+                raise ZxTimeoutError(op, reg, attempt, cause)
+            self.retried += 1
+            time.sleep(sleep)
+            delay *= 2
+        self._failed()
+        raise ZxBusError(op, reg, attempt, cause)
+
+    def readU8(self, reg):
+        return self._call('readU8', reg)
+
+    def readList(self, reg, length):
+        return self._call('readList', reg, length)
+
+    def readinto(self, reg, buffer):
+        return self._call('readinto', reg, buffer)
+
+    def write8(self, reg, value):
+        return self._call('write8', reg, value)
+
+    def writeList(self, reg, list):
+        return self._call('writeList', reg, list)
+
+    def report(self):
+        """Error rates and recovery times
+
+        Returns:
+            a JSON serialisable dict
+        """
+        recovery = sorted(self.recovery_times)
+        return {
+            'state': self.state,
+            'transactions': self.transactions,
+            'attempts': self.attempts,
+            'retried': self.retried,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'breaker_opened': self.breaker_opened,
+            'attempt_error_rate': (self.attempts - self.transactions + self.failed) / self.attempts
+                if self.attempts else 0.0,
+            'failure_rate': self.failed / self.transactions if self.transactions else 0.0,
+            'recoveries': len(recovery),
+            'recovery_mean_s': sum(recovery) / len(recovery) if recovery else 0.0,
+            'recovery_max_s': recovery[-1] if recovery else 0.0,
+        }
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+""" Pure-Python model of the zx_sensor for hardware-free testing and
+benchmarking
+
+SimulatedZxSensor implements the ZxTransport interface on top of the full
+register map in i2c_registers: STATUS flags clear on read, DRE/DRCFG
+control a (simulated) DR pin, and a script of Frames moves a virtual hand
+in front of the sensor. Every transaction can be given a fixed latency.
+"""
+
+# standard
+from __future__ import division, print_function
+from collections import deque, namedtuple
+import math
+import random
+import threading
+import time
+# project
+from .i2c_registers import *
+from .transport import ZxTransport
+
+
+class Frame(namedtuple('Frame', ['x', 'z', 'gesture', 'speed', 'flags'])):
+    """ One sensor frame of a scripted hand movement
+
+    Attributes:
+        x(int): X position 0-240, None if no object is in range
+        z(int): Z position 0-240, None if no object is in range
+        gesture(gesture_type): gesture reported with this frame, or None
+        speed(int): gesture speed reported with the gesture
+        flags(int): extra STATUS bits raised with this frame, e.g.
+            1 << STATUS_HOVER
+    """
+    __slots__ = ()
+
+    def __new__(cls, x=None, z=None, gesture=None, speed=0, flags=0):
+        return super(Frame, cls).__new__(cls, x, z, gesture, speed, flags)
+
+
+# ==================
+# Scripted movements
+# ==================
+
+def idle_frames(count):
+    """Frames with nothing in front of the sensor"""
+    return [Frame() for _ in range(count)]
+
+
+def move_frames(start, end, count):
+    """Frames moving the hand in a straight line
+
+    Args:
+        start(tuple): (x, z) of the first frame
+        end(tuple): (x, z) of the last frame
+        count(:obj:`int`): number of frames
+    """
+    frames = []
+    for i in range(count):
+        t = i / (count - 1) if count > 1 else 1.0
+        frames.append(Frame(int(round(start[0] + (end[0] - start[0]) * t)),
+                            int(round(start[1] + (end[1] - start[1]) * t))))
+    return frames
+
+
+def hover_frames(x, z, count):
+    """Frames holding the hand still; the last one reports a hover"""
+    frames = [Frame(x, z) for _ in range(count)]
+    if (frames):
+        frames[-1] = Frame(x, z, flags=(1 << STATUS_HOVER))
+    return frames
+
+
+def swipe_frames(gesture, count=10, z=60, speed=10):
+    """Frames of a swipe that ends with the sensor reporting the gesture
+
+    Args:
+        gesture(gesture_type): RIGHT_SWIPE, LEFT_SWIPE or UP_SWIPE
+        count(:obj:`int`, optional): number of frames. Defaults to 10
+        z(:obj:`int`, optional): height of the swipe. Defaults to 60
+        speed(:obj:`int`, optional): reported GSPEED. Defaults to 10
+    """
+    if (gesture == gesture_type.RIGHT_SWIPE):
+        frames = move_frames((20, z), (220, z), count)
+    elif (gesture == gesture_type.LEFT_SWIPE):
+        frames = move_frames((220, z), (20, z), count)
+    else:
+        frames = move_frames((MAX_X // 2, z), (MAX_X // 2, MAX_Z - 20), count)
+    last = frames[-1]
+    frames[-1] = Frame(last.x, last.z, gesture, speed, 1 << STATUS_SWP)
+    return frames
+
+
+# DRE source bit -> STATUS bit it reacts to
+_DRE_STATUS = ((DRE_RNG, STATUS_DAV), (DRE_CRD, STATUS_DAV),
+               (DRE_SWP, STATUS_SWP), (DRE_HOVER, STATUS_HOVER),
+               (DRE_HVG, STATUS_HVG), (DRE_EDGE, STATUS_EDGE))
+# bits that can actually be written
+_WRITE_MASKS = {ZX_DRE: SET_ALL_DRE,
+                ZX_DRCFG: (1 << DRCFG_POLARITY) | (1 << DRCFG_EDGE) | (1 << DRCFG_FORCE) | (1 << DRCFG_EN)}
+
+
+class SimulatedZxSensor(ZxTransport):
+    """ Register level model of a zx_sensor
+    """
+
+    # emitter geometry of the range model, in X/Z units
+    LEFT_EMITTER_X = 60
+    RIGHT_EMITTER_X = 180
+
+    def __init__(self, address=0x10, frames=None, frame_rate=50.0, loop=False,
+                 latency=0.0, error_rate=0.0, pin=None, seed=None):
+        """
+        Args:
+            address(:obj:`int`, optional): the simulated i2c address
+            frames(list, optional): Frames to play
+            frame_rate(:obj:`float`, optional): frames per second. None
+                means frames are only advanced by step(). Defaults to 50
+            loop(bool, optional): restart the script when it runs out.
+                Defaults to False
+            latency(:obj:`float`, optional): seconds added to every
+                transaction. Defaults to 0
+            error_rate(:obj:`float`, optional): probability of a transaction
+                failing with an IOError. Defaults to 0
+            pin(:obj:`SimulatedPin`, optional): pin driven like the DR pin
+            seed(optional): seed for the error injection
+        """
+        self.address = address
+        self.busnum = 'sim'
+        self.debug = False
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pin = pin
+        self.loop = loop
+        self.frame_period = None if frame_rate == None else 1.0 / frame_rate
+        self.regs = bytearray(256)
+        self.regs[ZX_MODEL] = ZX_MODEL_VER
+        self.regs[ZX_REGVER] = ZX_REG_MAP_VER
+        self.regs[ZX_XPOS] = ZX_ERROR
+        self.regs[ZX_ZPOS] = ZX_ERROR
+        self.counts = {'readU8': 0, 'readList': 0, 'write8': 0, 'writeList': 0}
+        self.errors = 0
+        self.lastError = None
+        self._script = []
+        self._frames = deque()
+        self._present = False
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._started = time.monotonic()
+        self._frames_applied = 0
+        if (frames != None):
+            self.load(frames)
+
+    @property
+    def transactions(self):
+        """Total number of bus transactions seen"""
+        return sum(self.counts.values())
+
+    # =========
+    # Scripting
+    # =========
+
+    def load(self, frames):
+        """Replaces the script and restarts the frame clock"""
+        with self._lock:
+            self._script = list(frames)
+            self._frames = deque(self._script)
+            self._started = time.monotonic()
+            self._frames_applied = 0
+
+    def step(self, count=1):
+        """Applies the next `count` frames immediately"""
+        with self._lock:
+            for _ in range(count):
+                self._next_frame()
+
+    def reset(self):
+        """Simulates a power cycle: all registers return to their defaults"""
+        with self._lock:
+            self.regs[ZX_STATUS] = 0
+            self.regs[ZX_DRE] = 0
+            self.regs[ZX_DRCFG] = 0
+            self._update_dr()
+
+    def ranges_for(self, x, z):
+        """Range registers the model reports for a hand position
+
+        Ranges grow as the hand gets closer to the left/right emitter:
+        range = 240 - distance, clamped to 0-240.
+        """
+        def rng(emitter_x):
+            distance = math.hypot(x - emitter_x, z)
+            return int(max(0, min(MAX_Z, round(MAX_Z - distance))))
+        return rng(self.LEFT_EMITTER_X), rng(self.RIGHT_EMITTER_X)
+
+    def _next_frame(self):
+        if (not self._frames):
+            if (not self.loop) or (not self._script):
+                return
+            self._frames.extend(self._script)
+        self._apply(self._frames.popleft())
+
+    def _advance(self):
+        if (self.frame_period == None):
+            return
+        due = int((time.monotonic() - self._started) / self.frame_period)
+        while (self._frames_applied < due):
+            self._frames_applied += 1
+            self._next_frame()
+
+    def _apply(self, frame):
+        regs = self.regs
+        status = regs[ZX_STATUS] | frame.flags
+        present = frame.x != None
+        if (present != self._present):
+            status |= 1 << STATUS_EDGE
+            self._present = present
+        if (present):
+            regs[ZX_XPOS] = frame.x
+            regs[ZX_ZPOS] = frame.z
+            regs[ZX_LRNG], regs[ZX_RRNG] = self.ranges_for(frame.x, frame.z)
+            status |= 1 << STATUS_DAV
+        else:
+            regs[ZX_XPOS] = ZX_ERROR
+            regs[ZX_ZPOS] = ZX_ERROR
+            regs[ZX_LRNG] = 0
+            regs[ZX_RRNG] = 0
+        if (frame.gesture != None):
+            regs[ZX_GESTURE] = frame.gesture.value
+            regs[ZX_GSPEED] = frame.speed
+        regs[ZX_STATUS] = status
+        self._update_dr()
+
+    # ======
+    # DR pin
+    # ======
+
+    @property
+    def dr_asserted(self):
+        """True if the DR line is currently asserted"""
+        drcfg = self.regs[ZX_DRCFG]
+        if (not drcfg & (1 << DRCFG_EN)):
+            return False
+        if (drcfg & (1 << DRCFG_FORCE)):
+            return True
+        dre = self.regs[ZX_DRE]
+        status = self.regs[ZX_STATUS]
+        for dre_bit, status_bit in _DRE_STATUS:
+            if (dre & (1 << dre_bit)) and (status & (1 << status_bit)):
+                return True
+        return False
+
+    def _update_dr(self):
+        if (self.pin == None):
+            return
+        active_high = bool(self.regs[ZX_DRCFG] & (1 << DRCFG_POLARITY))
+        asserted = self.dr_asserted
+        if (asserted and self.regs[ZX_DRCFG] & (1 << DRCFG_EDGE)):
+            # pulse mode: a short pulse instead of a level
+            self.pin.set(active_high)
+            self.pin.set(not active_high)
+        else:
+            self.pin.set(active_high if asserted else not active_high)
+
+    # ============
+    # Transactions
+    # ============
+
+    def _transaction(self, op):
+        self.counts[op] += 1
+        if (self.latency):
+            time.sleep(self.latency)
+        self._advance()
+        if (self.error_rate) and (self._random.random() < self.error_rate):
+            self.errors += 1
+            self.lastError = IOError(121, 'Remote I/O error (simulated)')
+            return False
+        return True
+
+    def _read(self, reg):
+        val = self.regs[reg]
+        if (reg == ZX_STATUS):
+            # flags clear on read, the heartbeat bit toggles
+            self.regs[ZX_STATUS] = (val & (1 << STATUS_HB)) ^ (1 << STATUS_HB)
+            self._update_dr()
+        return val
+
+    def _write(self, reg, value):
+        mask = _WRITE_MASKS.get(reg)
+        if (mask == None):
+            # read-only register, the write is ignored like on the device
+            return
+        self.regs[reg] = value & mask
+        self._update_dr()
+
+    def readU8(self, reg):
+        with self._lock:
+            if (not self._transaction('readU8')):
+                return -1
+            return self._read(reg)
+
+    def readList(self, reg, length):
+        with self._lock:
+            if (not self._transaction('readList')):
+                return -1
+            return [self._read((reg + i) & 0xFF) for i in range(min(length, 32))]
+
+    def write8(self, reg, value):
+        with self._lock:
+            if (not self._transaction('write8')):
+                return -1
+            self._write(reg, value)
+
+    def writeList(self, reg, list):
+        with self._lock:
+            if (not self._transaction('writeList')):
+                return -1
+            for i, value in enumerate(list[:32]):
+                self._write((reg + i) & 0xFF, value)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
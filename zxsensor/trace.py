@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+""" Bounded in-memory trace of recent bus transactions
+
+ZxSensor.enable_trace() wraps the transport in a TracingTransport that
+appends one tuple per transaction to a fixed size deque. Nothing is
+formatted until the trace is dumped, e.g. after a fault. Without tracing
+the sensor calls its transport directly.
+"""
+
+# standard
+from __future__ import division, print_function
+from collections import deque, namedtuple
+import logging
+import time
+
+
+class TraceRecord(namedtuple('TraceRecord', ['timestamp', 'address', 'op', 'reg', 'value', 'result'])):
+    """ One traced transaction
+
+    Attributes:
+        timestamp(float): time.monotonic() when the transaction completed
+        address(int): i2c address of the device
+        op(str): transport method, e.g. 'readU8'
+        reg(int): first register
+        value: value or list written, length requested for readList
+        result: value returned by the transport (-1 on read errors), or
+            the IOError it raised, e.g. a ZxBusError
+    """
+    __slots__ = ()
+
+    def failed(self):
+        """True if the transport reported an error for this transaction"""
+        if (isinstance(self.result, IOError)):
+            return True
+        if (self.op in ('readU8', 'readList')):
+            return self.result == None or self.result == -1
+        return self.result != None
+
+    def format(self):
+        """Renders the record as one human readable line"""
+        if (self.op in ('write8', 'writeList')):
+            detail = 'wrote {}'.format(_hex(self.value))
+        elif (self.op == 'readList'):
+            detail = 'read {} -> {}'.format(self.value, _hex(self.result))
+        else:
+            detail = 'read -> {}'.format(_hex(self.result))
+        return '{:.6f} 0x{:02X} {:<9} reg 0x{:02X} {}{}'.format(
+            self.timestamp, self.address or 0, self.op, self.reg, detail,
+            ' FAILED' if self.failed() else '')
+
+
+def _hex(value):
+    if (isinstance(value, IOError)):
+        return '{}({})'.format(type(value).__name__, value)
+    if (isinstance(value, (list, tuple, bytearray))):
+        return '[' + ' '.join('{:02X}'.format(v) for v in value) + ']'
+    if (isinstance(value, int) and value >= 0):
+        return '0x{:02X}'.format(value)
+    return str(value)
+
+
+class BusTrace(object):
+    """ Ring of the most recent TraceRecords
+    """
+
+    def __init__(self, size=256):
+        """
+        Args:
+            size(:obj:`int`, optional): number of transactions kept.
+                Defaults to 256
+        """
+        self.records = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.records)
+
+    def clear(self):
+        self.records.clear()
+
+    def failures(self):
+        """Returns the traced transactions that failed"""
+        return [record for record in self.records if record.failed()]
+
+    def dump(self):
+        """Returns the trace as a list of formatted lines, oldest first"""
+        return [record.format() for record in list(self.records)]
+
+    def log(self, logger=None, level=logging.ERROR):
+        """Writes the trace to a logger, e.g. from an error handler"""
+        logger = logger or logging.getLogger('ZxSensor.trace')
+        for line in self.dump():
+            logger.log(level, line)
+
+
+class TracingTransport(object):
+    """ Transport wrapper that appends every transaction to a BusTrace
+    """
+
+    def __init__(self, transport, trace):
+        self.transport = transport
+        self.trace = trace
+        self._append = trace.records.append
+        self._address = getattr(transport, 'address', None)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def readU8(self, reg):
+        try:
+            result = self.transport.readU8(reg)
+        except IOError as err:
+            self._append(TraceRecord(time.monotonic(), self._address, 'readU8', reg, None, err))
+            raise
+        self._append(TraceRecord(time.monotonic(), self._address, 'readU8', reg, None, result))
+        return result
+
+    def readList(self, reg, length):
+        try:
+            result = self.transport.readList(reg, length)
+        except IOError as err:
+            self._append(TraceRecord(time.monotonic(), self._address, 'readList', reg, length, err))
+            raise
+        self._append(TraceRecord(time.monotonic(), self._address, 'readList', reg, length, result))
+        return result
+
+    def readinto(self, reg, buffer):
+        # traced as a readList; the record needs its own copy of the buffer
+        length = len(buffer)
+        try:
+            result = self.transport.readinto(reg, buffer)
+        except IOError as err:
+            self._append(TraceRecord(time.monotonic(), self._address, 'readList', reg, length, err))
+            raise
+        data = list(buffer[:result]) if (result != None) and (result >= 0) else -1
+        self._append(TraceRecord(time.monotonic(), self._address, 'readList', reg, length, data))
+        return result
+
+    def write8(self, reg, value):
+        try:
+            result = self.transport.write8(reg, value)
+        except IOError as err:
+            self._append(TraceRecord(time.monotonic(), self._address, 'write8', reg, value, err))
+            raise
+        self._append(TraceRecord(time.monotonic(), self._address, 'write8', reg, value, result))
+        return result
+
+    def writeList(self, reg, list):
+        # a copy, the caller may reuse its list
+        values = [value for value in list]
+        try:
+            result = self.transport.writeList(reg, list)
+        except IOError as err:
+            self._append(TraceRecord(time.monotonic(), self._address, 'writeList', reg, values, err))
+            raise
+        self._append(TraceRecord(time.monotonic(), self._address, 'writeList', reg, values, result))
+        return result
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
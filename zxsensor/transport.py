@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+""" Transport interface between ZxSensor and the bus
+
+ZxSensor only ever talks to the sensor through the four methods below. The
+smbus backed Adafruit_I2C is the hardware transport; SimulatedZxSensor in
+zxsensor.simulator is a pure-Python one. Any object with the same methods
+can be passed to ZxSensor(i2c=...).
+"""
+
+# standard
+from __future__ import division, print_function
+
+
+class ZxTransport(object):
+    """ Byte and block register access to one device
+
+    Errors are reported the way Adafruit_I2C reports them: reads return -1
+    and writes return a value other than None.
+    """
+
+    # bus identifier, used to serialise access per bus
+    busnum = None
+
+    def readU8(self, reg):
+        """Reads one register
+
+        Returns:
+            the register value. -1 on error.
+        """
+        raise NotImplementedError
+
+    def readList(self, reg, length):
+        """Reads `length` consecutive registers in one transaction
+
+        Returns:
+            a list of register values. -1 on error.
+        """
+        raise NotImplementedError
+
+    def write8(self, reg, value):
+        """Writes one register
+
+        Returns:
+            None on success
+        """
+        raise NotImplementedError
+
+    def writeList(self, reg, list):
+        """Writes consecutive registers in one transaction
+
+        Returns:
+            None on success
+        """
+        raise NotImplementedError
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+""" NumPy column store and vectorized analytics for long sample runs
+
+Samples are kept in one preallocated structured array (SAMPLE_DTYPE), so
+millions of samples cost 15 bytes each and the store holds no per-sample
+Python objects. ZxSamples are converted on the way in, extend() does a
+whole batch with one array assignment; extend_array() takes records that
+are already SAMPLE_DTYPE without any per-sample work. X/Z hold the raw
+register values; invalid positions stay ZX_ERROR and are masked by the
+helpers below.
+
+NumPy is an optional dependency; it is only needed for this module.
+"""
+
+# standard
+from __future__ import division, print_function
+# external
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# project
+from .i2c_registers import *
+
+
+def _require_numpy():
+    if (np == None):
+        raise ImportError("zxsensor.zx_array needs numpy (pip install numpy)")
+
+
+if (np != None):
+    SAMPLE_DTYPE = np.dtype([
+        ('timestamp', '<f8'),
+        ('status', 'u1'),
+        ('x', 'u1'),
+        ('z', 'u1'),
+        ('lrng', 'u1'),
+        ('rrng', 'u1'),
+        ('gesture', 'u1'),
+        ('speed', 'u1'),
+    ])
+else:
+    SAMPLE_DTYPE = None
+
+
+def _record(sample):
+    # one ZxSample as a SAMPLE_DTYPE tuple
+    return (sample.timestamp, sample.status,
+            ZX_ERROR if sample.x == None else sample.x,
+            ZX_ERROR if sample.z == None else sample.z,
+            sample.lrng, sample.rrng, sample.gesture.value, sample.speed)
+
+
+class SampleColumnStore(object):
+    """ Fixed capacity structured array of samples
+
+    When full, the oldest samples are overwritten; `dropped` counts them.
+    """
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity(:obj:`int`): number of samples kept
+        """
+        _require_numpy()
+        if (capacity < 1):
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._array = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        # total number of samples ever appended
+        self._written = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    def clear(self):
+        self._written = 0
+        self.dropped = 0
+
+    def append(self, sample):
+        """Appends one ZxSample"""
+        self._array[self._written % self.capacity] = _record(sample)
+        if (self._written >= self.capacity):
+            self.dropped += 1
+        self._written += 1
+
+    def extend(self, samples):
+        """Appends a list of ZxSamples, e.g. from ZxStream.drain(), as one
+        block
+        """
+        if (samples):
+            self.extend_array(np.array([_record(sample) for sample in samples], dtype=SAMPLE_DTYPE))
+
+    def extend_array(self, block):
+        """Appends an array of SAMPLE_DTYPE records with at most two copies"""
+        block = np.asarray(block, dtype=SAMPLE_DTYPE)
+        total = len(block)
+        # records that would be overwritten within this very block
+        skipped = max(0, total - self.capacity)
+        block = block[skipped:]
+        count = len(block)
+        self.dropped += skipped + max(0, len(self) + count - self.capacity)
+        # sample number n always lives in slot n % capacity
+        start = (self._written + skipped) % self.capacity
+        first = min(count, self.capacity - start)
+        self._array[start:start + first] = block[:first]
+        self._array[:count - first] = block[first:]
+        self._written += total
+
+    def to_array(self):
+        """Returns the stored samples in chronological order
+
+        The result is a view while the store has not wrapped, a copy after.
+        """
+        if (self._written <= self.capacity):
+            return self._array[:self._written]
+        start = self._written % self.capacity
+        return np.concatenate((self._array[start:], self._array[:start]))
+
+
+def from_samples(samples):
+    """Converts an iterable of ZxSamples into a SAMPLE_DTYPE array"""
+    _require_numpy()
+    samples = list(samples)
+    store = SampleColumnStore(max(1, len(samples)))
+    store.extend(samples)
+    return store.to_array()
+
+
+# ====================
+# Vectorized analytics
+# ====================
+
+def valid_mask(data):
+    """Boolean mask of samples with both X and Z in range
+
+    Args:
+        data: SAMPLE_DTYPE array
+
+    Returns:
+        bool array, False where X or Z is ZX_ERROR or out of range
+    """
+    x = data['x']
+    z = data['z']
+    return (x <= MAX_X) & (z <= MAX_Z)
+
+
+def positions(data):
+    """Returns X and Z as float arrays with NaN for invalid samples"""
+    mask = valid_mask(data)
+    x = np.where(mask, data['x'], np.nan)
+    z = np.where(mask, data['z'], np.nan)
+    return x, z
+
+
+def velocity(data):
+    """Finite difference velocity between consecutive samples
+
+    Args:
+        data: SAMPLE_DTYPE array
+
+    Returns:
+        (t, vx, vz) arrays of len(data) - 1: the midpoint time of every
+        interval and the X/Z velocity in units per second, NaN where either
+        endpoint is invalid
+    """
+    t = data['timestamp']
+    x, z = positions(data)
+    dt = np.diff(t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vx = np.where(dt > 0, np.diff(x) / dt, np.nan)
+        vz = np.where(dt > 0, np.diff(z) / dt, np.nan)
+    return t[:-1] + dt / 2, vx, vz
+
+
+def resample(data, rate_hz, max_gap=None):
+    """Linearly interpolates the valid positions onto a uniform time grid
+
+    Args:
+        data: SAMPLE_DTYPE array, sorted by timestamp
+        rate_hz(:obj:`float`): output sample rate
+        max_gap(:obj:`float`, optional): output points further than this
+            many seconds from any valid input sample are NaN. Defaults to
+            two output periods
+
+    Returns:
+        (t, x, z) float arrays
+    """
+    if (max_gap == None):
+        max_gap = 2.0 / rate_hz
+    mask = valid_mask(data)
+    t_valid = data['timestamp'][mask]
+    if (len(t_valid) == 0):
+        empty = np.empty(0)
+        return empty, empty, empty
+    t = np.arange(t_valid[0], t_valid[-1] + 0.5 / rate_hz, 1.0 / rate_hz)
+    x = np.interp(t, t_valid, data['x'][mask].astype(np.float64))
+    z = np.interp(t, t_valid, data['z'][mask].astype(np.float64))
+    # distance to the nearest valid input sample
+    right = np.clip(np.searchsorted(t_valid, t), 0, len(t_valid) - 1)
+    left = np.clip(right - 1, 0, len(t_valid) - 1)
+    gap = np.minimum(np.abs(t - t_valid[left]), np.abs(t_valid[right] - t))
+    x[gap > max_gap] = np.nan
+    z[gap > max_gap] = np.nan
+    return t, x, z
+
+
+def windowed_stats(values, window, block=65536):
+    """Trailing window mean, standard deviation, min and max, ignoring NaN
+
+    Every window is centred on its own mean before the squares are summed,
+    so the standard deviation does not lose precision to cancellation the
+    way running sums of squares do on long runs. Windows are strided views
+    processed `block` at a time, which bounds the temporary memory to
+    about block * window values.
+
+    Args:
+        values: 1-D float array, e.g. from positions()
+        window(:obj:`int`): window length in samples
+        block(:obj:`int`, optional): windows per processing step.
+            Defaults to 65536
+
+    Returns:
+        dict of 'mean', 'std', 'min', 'max' arrays of len(values) -
+        window + 1; NaN where the window holds no valid value
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if (window < 1) or (window > len(values)):
+        raise ValueError("window must be between 1 and len(values)")
+    count = len(values) - window + 1
+    result = dict((key, np.empty(count)) for key in ('mean', 'std', 'min', 'max'))
+    view = np.lib.stride_tricks.sliding_window_view
+    windows = view(values, window)
+    valid = view(~np.isnan(values), window)
+    for start in range(0, count, block):
+        part = slice(start, start + block)
+        w = windows[part]
+        ok = valid[part]
+        n = ok.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(ok, w, 0.0).sum(axis=1) / n
+            dev = np.where(ok, w - mean[:, None], 0.0)
+            var = (dev * dev).sum(axis=1) / n
+        empty = n == 0
+        minimum = np.where(ok, w, np.inf).min(axis=1)
+        maximum = np.where(ok, w, -np.inf).max(axis=1)
+        minimum[empty] = np.nan
+        maximum[empty] = np.nan
+        result['mean'][part] = mean
+        result['std'][part] = np.sqrt(var)
+        result['min'][part] = minimum
+        result['max'][part] = maximum
+    return result
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
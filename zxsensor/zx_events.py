@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+""" Interrupt driven event engine for the zx_sensor
+
+On every DR edge the engine does one burst read of the register block,
+works out which DRE sources fired from the STATUS bits and hands typed
+events to subscribers on a worker thread, so the GPIO callback thread only
+ever spends a single bus transaction.
+"""
+
+# standard
+from __future__ import division, print_function
+from collections import namedtuple
+import logging
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+# project
+from .i2c_registers import *
+
+
+# ======
+# Events
+# ======
+
+class ZxEvent(namedtuple('ZxEvent', ['timestamp', 'sample'])):
+    """ Base class of all events. `sample` is the ZxSample the event was
+    decoded from.
+    """
+    __slots__ = ()
+
+
+class RangeEvent(ZxEvent):
+    """ New range data (DRE_RNG) """
+    __slots__ = ()
+
+
+class PositionEvent(ZxEvent):
+    """ New X/Z coordinates (DRE_CRD) """
+    __slots__ = ()
+
+
+class SwipeEvent(ZxEvent):
+    """ Swipe gesture detected (DRE_SWP) """
+    __slots__ = ()
+
+
+class HoverEvent(ZxEvent):
+    """ Hover gesture detected (DRE_HOVER) """
+    __slots__ = ()
+
+
+class HoverMoveEvent(ZxEvent):
+    """ Hover-and-move gesture detected (DRE_HVG) """
+    __slots__ = ()
+
+
+class EdgeEvent(ZxEvent):
+    """ Object entered or left the detection area (DRE_EDGE) """
+    __slots__ = ()
+
+
+# DRE source bit -> (STATUS bit that reports it, event type)
+DRE_EVENT_SOURCES = (
+    (DRE_RNG, STATUS_DAV, RangeEvent),
+    (DRE_CRD, STATUS_DAV, PositionEvent),
+    (DRE_SWP, STATUS_SWP, SwipeEvent),
+    (DRE_HOVER, STATUS_HOVER, HoverEvent),
+    (DRE_HVG, STATUS_HVG, HoverMoveEvent),
+    (DRE_EDGE, STATUS_EDGE, EdgeEvent),
+)
+
+
+# raw STATUS byte -> ((DRE mask, event type), ...) of the sources it reports
+_EVENT_TABLE = tuple(tuple((1 << dre_bit, event_type)
+                           for dre_bit, status_bit, event_type in DRE_EVENT_SOURCES
+                           if status & (1 << status_bit))
+                     for status in range(256))
+
+
+def decode_events(sample, dre=SET_ALL_DRE):
+    """Works out which enabled DRE sources fired for a sample
+
+    Args:
+        sample(:obj:`ZxSample`): the sample read after the interrupt
+        dre(:obj:`int`, optional): the DRE register value. Sources that are
+            not enabled are ignored. Defaults to all sources
+
+    Returns:
+        a list of ZxEvents, possibly empty
+    """
+    return [event_type(sample.timestamp, sample)
+            for dre_mask, event_type in _EVENT_TABLE[sample.status]
+            if dre & dre_mask]
+
+
+# ===============
+# DR pin backends
+# ===============
+
+class DrPin(object):
+    """ Base class for DR pin backends
+
+    A backend calls the callback passed to start() from its own thread
+    whenever the pin changes to the asserted level.
+    """
+
+    def __init__(self, active_high=True):
+        self.active_high = active_high
+
+    def start(self, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def is_asserted(self):
+        raise NotImplementedError
+
+
+class RPiGPIOPin(DrPin):
+    """ DR pin read through RPi.GPIO edge detection """
+
+    def __init__(self, channel=17, active_high=True, bouncetime=None):
+        """
+        Args:
+            channel(:obj:`int`, optional): BCM pin number. Defaults to 17
+            active_high(bool, optional): DR polarity. Defaults to True
+            bouncetime(:obj:`int`, optional): debounce time in ms
+        """
+        DrPin.__init__(self, active_high)
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self.channel = channel
+        self.bouncetime = bouncetime
+
+    def start(self, callback):
+        GPIO = self.GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.channel, GPIO.IN)
+        edge = GPIO.RISING if self.active_high else GPIO.FALLING
+        kwargs = {'callback': lambda channel: callback()}
+        if (self.bouncetime != None):
+            kwargs['bouncetime'] = self.bouncetime
+        GPIO.add_event_detect(self.channel, edge, **kwargs)
+
+    def stop(self):
+        self.GPIO.remove_event_detect(self.channel)
+
+    def is_asserted(self):
+        return bool(self.GPIO.input(self.channel)) == self.active_high
+
+
+class GpiochipPin(DrPin):
+    """ DR pin read through the Linux GPIO character device (libgpiod) """
+
+    def __init__(self, line=17, chip='/dev/gpiochip0', active_high=True):
+        """
+        Args:
+            line(:obj:`int`, optional): line offset on the chip. Defaults to 17
+            chip(:obj:`str`, optional): gpiochip device. Defaults to
+                /dev/gpiochip0
+            active_high(bool, optional): DR polarity. Defaults to True
+        """
+        DrPin.__init__(self, active_high)
+        import gpiod
+        self.gpiod = gpiod
+        self.chip = gpiod.Chip(chip)
+        self.line = self.chip.get_line(line)
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self, callback):
+        gpiod = self.gpiod
+        edge = gpiod.LINE_REQ_EV_RISING_EDGE if self.active_high else gpiod.LINE_REQ_EV_FALLING_EDGE
+        self.line.request(consumer='zxsensor', type=edge)
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, args=(callback,), name='GpiochipPin')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, callback):
+        while (self._running.is_set()):
+            # wake up periodically to notice stop()
+            if (self.line.event_wait(sec=0, nsec=100000000)):
+                self.line.event_read()
+                callback()
+
+    def stop(self):
+        self._running.clear()
+        if (self._thread != None):
+            self._thread.join()
+            self._thread = None
+        self.line.release()
+
+    def is_asserted(self):
+        return bool(self.line.get_value()) == self.active_high
+
+
+class SimulatedPin(DrPin):
+    """ Software DR pin for tests and simulations. Call set() to change the
+    level; the callback runs in the calling thread.
+    """
+
+    def __init__(self, active_high=True):
+        DrPin.__init__(self, active_high)
+        self.level = not active_high
+        self._callback = None
+
+    def start(self, callback):
+        self._callback = callback
+
+    def stop(self):
+        self._callback = None
+
+    def set(self, level):
+        """Drives the pin to a logic level"""
+        level = bool(level)
+        edge = (level != self.level) and (level == self.active_high)
+        self.level = level
+        if (edge) and (self._callback != None):
+            self._callback()
+
+    def assert_pin(self):
+        self.set(self.active_high)
+
+    def release_pin(self):
+        self.set(not self.active_high)
+
+    def is_asserted(self):
+        return self.level == self.active_high
+
+
+# ============
+# Event engine
+# ============
+
+class ZxEventEngine(object):
+    """ Reads the sensor on DR edges and dispatches typed events
+    """
+
+    def __init__(self, sensor, pin, interrupts=interrupt_type.GESTURE_INTERRUPTS,
+                 poll_interval=0.5, queue_size=256):
+        """
+        Args:
+            sensor(:obj:`ZxSensor`): the sensor to read
+            pin(:obj:`DrPin`): backend for the DR pin
+            interrupts(:obj:`interrupt_type`, optional): DRE sources to
+                enable. Defaults to GESTURE_INTERRUPTS
+            poll_interval(:obj:`float`, optional): seconds between checks for
+                a DR pin that stayed asserted without an edge being seen.
+                None disables the fallback poll. Defaults to 0.5
+            queue_size(:obj:`int`, optional): maximum number of undispatched
+                events. Defaults to 256
+        """
+        self.logger = logging.getLogger('ZxEventEngine')
+        self.sensor = sensor
+        self.pin = pin
+        self.interrupts = interrupts
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue(queue_size)
+        self._subscribers = []
+        self._dre = SET_ALL_DRE
+        self._running = threading.Event()
+        self._threads = []
+        self._last_read = 0.0
+        # counters
+        self.edges = 0
+        self.recovered = 0
+        self.read_errors = 0
+        self.dropped = 0
+
+    def subscribe(self, callback, event_type=ZxEvent):
+        """Registers a callback for events of a type (and its subclasses)
+
+        Args:
+            callback(callable): called with the event on the worker thread
+            event_type(type, optional): only events that are instances of
+                this type are delivered. Defaults to all events
+        """
+        self._subscribers.append((event_type, callback))
+
+    def unsubscribe(self, callback):
+        """Removes every registration of a callback"""
+        self._subscribers = [(t, c) for t, c in self._subscribers if c != callback]
+
+    def start(self):
+        """Configures the sensor interrupts and starts dispatching"""
+        if (self._running.is_set()):
+            return
+        sensor = self.sensor
+        if (not sensor.set_interrupt_trigger(self.interrupts)):
+            self.logger.error("Could not set interrupt triggers")
+        sensor.configure_interrupts(self.pin.active_high, False)
+        sensor.enable_interrupts()
+        dre = sensor.read_register(ZX_DRE)
+        if (dre != None):
+            self._dre = dre
+
+        self._running.set()
+        worker = threading.Thread(target=self._dispatch, name='ZxEventEngine')
+        worker.daemon = True
+        worker.start()
+        self._threads = [worker]
+        if (self.poll_interval != None):
+            poller = threading.Thread(target=self._poll, name='ZxEventEngine-poll')
+            poller.daemon = True
+            poller.start()
+            self._threads.append(poller)
+
+        self.pin.start(self._on_edge)
+        # clear anything latched before we were listening
+        self._read()
+
+    def stop(self):
+        """Stops dispatching. The sensor interrupts are left configured."""
+        self.pin.stop()
+        self._running.clear()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _on_edge(self):
+        self.edges += 1
+        self._read()
+
+    def _read(self):
+        self._last_read = time.monotonic()
+        sample = self.sensor.read_snapshot()
+        if (sample == None):
+            self.read_errors += 1
+            return
+        for event in decode_events(sample, self._dre):
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def _poll(self):
+        interval = self.poll_interval
+        while (self._running.is_set()):
+            time.sleep(interval)
+            # DR still asserted long after the last read: the edge was missed
+            if (self.pin.is_asserted()) and (time.monotonic() - self._last_read >= interval):
+                self.recovered += 1
+                self._read()
+
+    def _dispatch(self):
+        while (self._running.is_set()):
+            try:
+                event = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            for event_type, callback in self._subscribers:
+                if (isinstance(event, event_type)):
+                    try:
+                        callback(event)
+                    except Exception:
+                        self.logger.exception("Subscriber %s failed on %s", callback, event)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
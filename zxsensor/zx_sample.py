@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+""" Immutable sample objects decoded from a burst read of the zx_sensor
+register block (STATUS..RRNG)
+
+ZxSample is the one representation of a reading: the I2C, UART, replay
+and shared memory paths all produce it. Raw GESTURE and STATUS bytes are
+decoded through the 256 entry tables below instead of comparisons.
+"""
+
+# standard
+from __future__ import division, print_function
+from collections import namedtuple
+# project
+from .i2c_registers import *
+
+
+class StatusFlags(namedtuple('StatusFlags', ['dav', 'ovf', 'swp', 'hover', 'hvg', 'edge', 'heartbeat'])):
+    """ The bits of a STATUS register value
+
+    Attributes:
+        dav(bool): new position or range data (STATUS_DAV)
+        ovf(bool): data was overwritten before it was read (STATUS_OVF)
+        swp(bool): swipe detected (STATUS_SWP)
+        hover(bool): hover detected (STATUS_HOVER)
+        hvg(bool): hover-move detected (STATUS_HVG)
+        edge(bool): object entered or left the detection area (STATUS_EDGE)
+        heartbeat(bool): heartbeat bit, toggles every update (STATUS_HB)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_status(cls, status):
+        return cls(*[bool(status & (1 << bit)) for bit in
+                     (STATUS_DAV, STATUS_OVF, STATUS_SWP, STATUS_HOVER, STATUS_HVG,
+                      STATUS_EDGE, STATUS_HB)])
+
+
+# raw GESTURE byte -> gesture_type; codes the sensor does not report decode
+# to NO_GESTURE, among them the host-only members of gesture_type
+_SENSOR_GESTURES = (gesture_type.RIGHT_SWIPE, gesture_type.LEFT_SWIPE, gesture_type.UP_SWIPE)
+GESTURE_TABLE = tuple(next((gesture for gesture in _SENSOR_GESTURES if gesture.value == code),
+                           gesture_type.NO_GESTURE) for code in range(256))
+
+# raw STATUS byte -> StatusFlags
+STATUS_TABLE = tuple(StatusFlags.from_status(status) for status in range(256))
+
+
+def decode_gesture(code):
+    """Maps a raw GESTURE register value to a gesture_type
+
+    Args:
+        code(:obj:`int`): value of the GESTURE register, None on read error
+
+    Returns:
+        the matching gesture_type. NO_GESTURE for unknown codes.
+    """
+    if (code == None):
+        return gesture_type.NO_GESTURE
+    return GESTURE_TABLE[code & 0xFF]
+
+
+def decode_status(status):
+    """Maps a raw STATUS register value to its StatusFlags
+
+    Args:
+        status(:obj:`int`): value of the STATUS register, None on read error
+
+    Returns:
+        the StatusFlags, all False for None
+    """
+    if (status == None):
+        return STATUS_TABLE[0]
+    return STATUS_TABLE[status & 0xFF]
+
+
+def decode_position(pos, limit):
+    """Validates a raw X or Z register value
+
+    Args:
+        pos(:obj:`int`): value of the XPOS or ZPOS register, None or -1 on
+            read error
+        limit(:obj:`int`): largest valid value (MAX_X or MAX_Z)
+
+    Returns:
+        the position (0 is valid), or None if the read failed or the sensor
+        reported no valid position
+    """
+    if (pos == None) or (pos < 0) or (pos > limit):
+        return None
+    return pos
+
+
+class ZxSample(namedtuple('ZxSample', ['timestamp', 'status', 'gesture',
+                                       'speed', 'x', 'z', 'lrng', 'rrng'])):
+    """ One coherent reading of the sensor, taken from a single I2C transfer
+
+    Attributes:
+        timestamp(float): time.monotonic() value at which the read completed
+        status(int): raw STATUS register
+        gesture(gesture_type): decoded GESTURE register
+        speed(int): raw GSPEED register
+        x(int): X position 0-240, None if invalid
+        z(int): Z position 0-240, None if invalid
+        lrng(int): raw left range register (ZX_LRNG)
+        rrng(int): raw right range register (ZX_RRNG)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_registers(cls, regs, timestamp):
+        """Decodes a register block read starting at ZX_SNAPSHOT_START
+
+        Args:
+            regs(list): ZX_SNAPSHOT_LENGTH register values
+            timestamp(float): time the block was read
+
+        Returns:
+            a new ZxSample
+        """
+        return cls(timestamp,
+                   regs[ZX_STATUS],
+                   GESTURE_TABLE[regs[ZX_GESTURE]],
+                   regs[ZX_GSPEED],
+                   decode_position(regs[ZX_XPOS], MAX_X),
+                   decode_position(regs[ZX_ZPOS], MAX_Z),
+                   regs[ZX_LRNG],
+                   regs[ZX_RRNG])
+
+    @property
+    def flags(self):
+        """The STATUS bits as StatusFlags"""
+        return STATUS_TABLE[self.status]
+
+    @property
+    def position_available(self):
+        """True if the DAV bit was set in STATUS"""
+        return bool(self.status & (1 << STATUS_DAV))
+
+    @property
+    def gesture_available(self):
+        """True if any of the SWP, HOVER or HVG bits was set in STATUS"""
+        return bool(self.status & 0b11100)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
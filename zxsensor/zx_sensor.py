@@ -3,16 +3,26 @@
 # standard
 from __future__ import division, print_function
 import logging
+import os
+import threading
+import time
 # external
-from Adafruit_I2C import Adafruit_I2C
+from .Adafruit_I2C import Adafruit_I2C
 # project
-from i2c_registers import *
+from .i2c_registers import *
+from .zx_sample import ZxSample, STATUS_TABLE, decode_gesture, decode_position
+from .zx_stream import ZxStream
+from .register_map import ZxConfig
+# the optional features (adaptive, metrics, trace, resilient, recording) are
+# imported when first enabled, which keeps them out of the import time
+
 
 class ZxSensor:
     """ Main class for interfacing with the zx_sensor
     """
 
-    def __init__(self, address=0x10, interrupts=interrupt_type.NO_INTERRUPTS, active_high = True):
+    def __init__(self, address=0x10, interrupts=interrupt_type.NO_INTERRUPTS, active_high = True, i2c=None,
+                 probe=True, configure=True):
         """
         Main constructor for the class ZxSensor. Initializes the sensor and the interrupts    
 
@@ -21,23 +31,122 @@ class ZxSensor:
             interrupts(:obj:`interrupt_type`, optional): which types of interrupts that 
                 enables DR pin to assert on events. Defaults to NO_INTERRUPTS
             active_high(bool, optional): sets the interrupt pin to active high or low. Defaults to True 
+            i2c(:obj:`ZxTransport`, optional): the transport to talk to the
+                sensor through, e.g. an Adafruit_I2C sharing its bus handle
+                via ZxBus or a SimulatedZxSensor. Defaults to a new
+                Adafruit_I2C on the auto-detected bus
+            probe(bool, optional): read and log the model and register map
+                versions. False saves two transactions. Defaults to True
+            configure(bool, optional): apply `interrupts` and `active_high`
+                now, with one block read and one block write. False defers
+                it to a later call of configure(). Defaults to True
         """
         self.logger = logging.getLogger('ZxSensor')
 
-        self.i2c = Adafruit_I2C(address)
-        self.i2c.debug = False 
+        if (i2c == None):
+            i2c = Adafruit_I2C(address)
+            i2c.debug = False 
+        self.i2c = i2c
+        # serialises multi-transaction sequences, shared by all devices on a ZxBus
+        self.lock = getattr(i2c, 'lock', None) or threading.RLock()
+        # write-through copies of the config registers, see update_register
+        self._shadow = {}
+        # register block for transports that can read into a buffer
+        self._snapshot = bytearray(ZX_SNAPSHOT_LENGTH)
+        # the transport stack last checked for readinto(), and the answer
+        self._readinto_for = None
+        self._readinto = False
+        self._stream = None
+        self.metrics = None
+        self.trace = None
+        self.resilience = None
+        self.recording = None
+        # host side X/Z from the ranges, see read_position
+        self.position_solver = None
+        # last exception raised by the transport, e.g. a ZxBusError
+        self.last_error = None
+        self._replaying = False
+        # outage to check the config after, see _recovered
+        self._recovery = None
+        self.interrupts = interrupts
+        self.active_high = active_high
+
+        if (probe):
+            self.logger.info("model version %s", self.get_model_version())
+            self.logger.info("register map version %s", self.get_reg_map_version())
+
+        if (configure) and (not self.configure()):
+            self.logger.error("Could not configure interrupts!")
+
+    def configure(self, interrupts=None, active_high=None, pin_pulse=False):
+        """Sets the interrupt triggers and the DR pin behaviour in one go,
+        see apply_config()
 
-        self.logger.info("model version %s", self.get_model_version())
-        self.logger.info(self.get_reg_map_version())
+        Args:
+            interrupts(:obj:`interrupt_type`, optional): which types of
+                interrupts enable the DR pin. Defaults to the constructor's
+            active_high(bool, optional): DR active-high or active-low.
+                Defaults to the constructor's
+            pin_pulse(bool, optional): true: DR pulse. False: DR pin asserts
+                until STATUS read. Defaults to False
 
-        # Enable DR interrupts based on desired interrupts
-        if (not self.set_interrupt_trigger(interrupts)):
-            print("Could not set interrupt triggers!")
-        self.configure_interrupts(active_high, False);
-        if (interrupts == interrupt_type.NO_INTERRUPTS): 
-            self.disable_interrupts()
-        else:
-            self.enable_interrupts()
+        Returns:
+            True if operation successful. False otherwise.
+        """
+        if (interrupts != None):
+            self.interrupts = interrupts
+        if (active_high != None):
+            self.active_high = active_high
+        with self.lock:
+            config = self.read_config()
+            if (config == None):
+                return False
+            config.set_interrupts(self.interrupts)
+            config.active_high = self.active_high
+            config.pulse = pin_pulse
+            config.enabled = self.interrupts != interrupt_type.NO_INTERRUPTS
+            return self.apply_config(config)
+
+    def read_config(self):
+        """Returns the device configuration as a ZxConfig, from the shadow
+        cache or, if that is incomplete, one block read
+
+        Returns:
+            a ZxConfig, None on read error.
+        """
+        with self.lock:
+            if (any(reg not in self._shadow for reg in ZX_CONFIG_REGISTERS)) and \
+                    (not self.resync_register_cache()):
+                return None
+            return ZxConfig(dict((reg, self._shadow[reg]) for reg in ZX_CONFIG_REGISTERS))
+
+    def apply_config(self, config):
+        """Writes a ZxConfig to the device. Only registers that differ from
+        the shadow cache are written, contiguous ones in one block write,
+        so a change of DRE and DRCFG is a single bus transaction.
+
+        Args:
+            config(:obj:`ZxConfig`): the configuration, validated when its
+                fields were set
+
+        Returns:
+            True if operation successful. False otherwise.
+        """
+        with self.lock:
+            for reg, values in config.changes(self._shadow):
+                if (len(values) == 1):
+                    retval = self._write(self.i2c.write8, reg, values[0])
+                else:
+                    retval = self._write(self.i2c.writeList, reg, values)
+                if (retval != None):
+                    self.logger.error("Writing config %s to register %s failed: %s", values, reg, retval)
+                    # the device state is unknown now, re-read on next access
+                    self._shadow.clear()
+                    self._count('config_write_failed')
+                    return False
+                for offset, value in enumerate(values):
+                    self._shadow[reg + offset] = value
+            return True
 
     def get_model_version(self):
         """Reads the sensor model version
@@ -45,7 +154,7 @@ class ZxSensor:
         Returns:
             sensor model version number
         """
-        return self.i2c.readU8(ZX_MODEL)
+        return self._read_u8(ZX_MODEL)
 
     def get_reg_map_version(self):
         """Reads the register map version
@@ -53,7 +162,7 @@ class ZxSensor:
         Returns:
             register map version number
         """
-        return self.i2c.readU8(ZX_REGVER)
+        return self._read_u8(ZX_REGVER)
 
     # =======================    
     # Interrupt Configuration
@@ -68,23 +177,12 @@ class ZxSensor:
         Returns:
             True if operation successful. False otherwise.
         """
-        if (interrupts == interrupt_type.POSITION_INTERRUPTS):
-            if (not self.set_register_bit(ZX_DRE, DRE_CRD)):
-                return False
-        elif (interrupts == interrupt_type.GESTURE_INTERRUPTS):
-            if (not self.set_register_bit(ZX_DRE, DRE_SWP)):
-                return False
-            if (not self.set_register_bit(ZX_DRE, DRE_HOVER)):
-                return False
-            if (not self.set_register_bit(ZX_DRE, DRE_HVG)):
+        with self.lock:
+            config = self.read_config()
+            if (config == None):
                 return False
-        elif (interrupts == interrupt_type.ALL_INTERRUPTS):
-            if (self.i2c.write8(ZX_DRE, SET_ALL_DRE) != None):
-                return False
-        else:
-            if (self.i2c.write8(ZX_DRE, 0x00) != None):
-                return False
-        return True    
+            config.set_interrupts(interrupts)
+            return self.apply_config(config)
 
     def configure_interrupts(self, active_high=False, pin_pulse=False):
         """Configures the behavior of the DR pin on an interrupt
@@ -99,21 +197,13 @@ class ZxSensor:
             True if operation successful. False otherwise.
         """
         self.logger.debug("configuring interrupts, active_high: %s, pin_pulse: %s", active_high, pin_pulse)
-        # Set or clear polarity bit to make DR active-high or active-low
-        if (active_high): 
-            if (not self.set_register_bit(ZX_DRCFG, DRCFG_POLARITY)):
-                return False
-        else:
-            if (not self.clear_register_bit(ZX_DRCFG, DRCFG_POLARITY)):
-                return False
-    
-        # Set or clear edge bit to make DR pulse or remain set until STATUS read 
-        if (pin_pulse):
-            if (not self.set_register_bit(ZX_DRCFG, DRCFG_EDGE)):
-                return False
-        else:
-            if (not self.clear_register_bit(ZX_DRCFG, DRCFG_EDGE)):
+        with self.lock:
+            config = self.read_config()
+            if (config == None):
                 return False
+            config.active_high = active_high
+            config.pulse = pin_pulse
+            return self.apply_config(config)
 
     def enable_interrupts(self):
         """Turns on interrupts so that DR asserts on desired events.
@@ -142,96 +232,589 @@ class ZxSensor:
             True if operation successful. False otherwise.
         """
         self.logger.debug("Clearing interupts")
-        val = self.i2c.readU8(ZX_STATUS)
+        val = self._read_u8(ZX_STATUS)
         if (val == None):
-            self.logger.error("Could not read from register {}, error: {}".format(ZX_STATUS, val))
+            self.logger.error("Could not read from register %s, error: %s", ZX_STATUS, val)
             return False
         return True
 
+    # ==============
+    # Burst read
+    # ==============
+
+    def read_snapshot(self):
+        """Reads STATUS, GESTURE, GSPEED, XPOS, ZPOS and both ranges in a
+        single I2C block transfer.
+
+        Note that reading STATUS clears its gesture bits on the sensor, the
+        same as gesture_available() does.
+
+        Returns:
+            a ZxSample, None on read error.
+        """
+        if (self._can_readinto()):
+            # e.g. I2cDevTransport: read into the preallocated block
+            with self.lock:
+                if (self._read_into(ZX_SNAPSHOT_START, self._snapshot) == ZX_SNAPSHOT_LENGTH):
+                    return self._decode_snapshot(self._snapshot)
+            regs = None
+        else:
+            regs = self._read_list(ZX_SNAPSHOT_START, ZX_SNAPSHOT_LENGTH)
+        if (regs == None) or (len(regs) != ZX_SNAPSHOT_LENGTH):
+            self.logger.error("Burst read of register block returned %s", regs)
+            self._count('snapshot_failed')
+            return None
+        return self._decode_snapshot(regs)
+
+    def _decode_snapshot(self, regs):
+        sample = ZxSample.from_registers(regs, time.monotonic())
+        if (self.recording != None):
+            # with the sample's own timestamp, so seeking a recording by
+            # the timestamp of a live sample finds that sample
+            self.recording.append_registers(sample.timestamp, regs)
+        return sample
+
+    def _can_readinto(self):
+        # whether the device under the wrappers reads into a buffer; the
+        # wrappers all pass readinto() through. Checked again whenever the
+        # stack changes, see _remove_wrapper
+        i2c = self.i2c
+        if (i2c is not self._readinto_for):
+            node = i2c
+            while ('transport' in getattr(node, '__dict__', ())):
+                node = node.transport
+            self._readinto = getattr(type(node), 'readinto', None) != None
+            self._readinto_for = i2c
+        return self._readinto
+
+    # =================
+    # Metrics & tracing
+    # =================
+
+    def enable_metrics(self, metrics=None):
+        """Starts recording bus transactions, errors and latencies
+
+        Args:
+            metrics(:obj:`BusMetrics`, optional): where to record. Defaults
+                to a new BusMetrics labelled with the sensor address
+
+        Returns:
+            the BusMetrics being recorded into
+        """
+        if (metrics == None):
+            address = getattr(self.i2c, 'address', None)
+            labels = {'address': '0x{:02X}'.format(address)} if address != None else None
+            from .metrics import BusMetrics
+            metrics = BusMetrics(labels=labels)
+        self.disable_metrics()
+        from .metrics import InstrumentedTransport
+        self.i2c = InstrumentedTransport(self.i2c, metrics)
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        """Stops recording and talks to the transport directly again"""
+        from .metrics import InstrumentedTransport
+        self._remove_wrapper(InstrumentedTransport)
+        self.metrics = None
+
+    def enable_trace(self, size=256):
+        """Starts keeping the most recent bus transactions in memory
+
+        Args:
+            size(:obj:`int`, optional): number of transactions kept.
+                Defaults to 256
+
+        Returns:
+            the BusTrace; call dump() or log() on it after a fault
+        """
+        self.disable_trace()
+        from .trace import BusTrace, TracingTransport
+        self.trace = BusTrace(size)
+        self.i2c = TracingTransport(self.i2c, self.trace)
+        return self.trace
+
+    def disable_trace(self):
+        """Stops tracing and talks to the transport directly again"""
+        from .trace import TracingTransport
+        self._remove_wrapper(TracingTransport)
+        self.trace = None
+
+    def enable_recording(self, path, trace=False, chunk_records=512):
+        """Appends every snapshot read to a binary recording, see
+        zxsensor.recording. Works with read_snapshot() and streaming.
+
+        Args:
+            path(:obj:`str`): recording file, appended to if it exists
+            trace(bool, optional): also record every bus transaction.
+                Defaults to False
+            chunk_records(:obj:`int`, optional): records per chunk
+
+        Returns:
+            the RecordingWriter
+        """
+        self.disable_recording()
+        from .recording import RecordingWriter, RecordingTransport
+        self.recording = RecordingWriter(path, chunk_records, trace)
+        if (trace):
+            self.i2c = RecordingTransport(self.i2c, self.recording)
+        return self.recording
+
+    def disable_recording(self):
+        """Stops recording and closes the file"""
+        from .recording import RecordingTransport
+        self._remove_wrapper(RecordingTransport)
+        if (self.recording != None):
+            self.recording.close()
+            self.recording = None
+
+    def _remove_wrapper(self, wrapper_type):
+        # the wrappers may be stacked in any order; each keeps the
+        # transport it wraps in its own `transport` attribute
+        self._readinto_for = None
+        outer = None
+        node = self.i2c
+        while ('transport' in getattr(node, '__dict__', ())):
+            if (isinstance(node, wrapper_type)):
+                if (outer == None):
+                    self.i2c = node.transport
+                else:
+                    outer.transport = node.transport
+                return
+            outer = node
+            node = node.transport
+
+    # ==========
+    # Resilience
+    # ==========
+
+    def enable_resilience(self, **kwargs):
+        """Retries failed transactions and guards the device with a circuit
+        breaker, see ResilientTransport. After an outage the config
+        registers are checked and replayed from the shadow cache if the
+        sensor lost them (brownout).
+
+        Args:
+            **kwargs: ResilientTransport arguments, e.g. retries or timeout
+
+        Returns:
+            the ResilientTransport; report() has error rates and recovery
+            times
+        """
+        self.disable_resilience()
+        from .resilient import ResilientTransport
+        self.resilience = ResilientTransport(self.i2c, **kwargs)
+        self.resilience.on_recover(self._recovered)
+        self.i2c = self.resilience
+        return self.resilience
+
+    def disable_resilience(self):
+        """Talks to the transport without retries again"""
+        from .resilient import ResilientTransport
+        self._remove_wrapper(ResilientTransport)
+        self.resilience = None
+
+    def verify_config(self):
+        """Compares the config registers on the device with the shadow cache
+        and replays the cached values if they differ, e.g. because the
+        sensor browned out and came back with its defaults
+
+        Returns:
+            True if the device config matches (again). False otherwise.
+        """
+        first = ZX_CONFIG_REGISTERS[0]
+        expected = [self._shadow.get(reg) for reg in ZX_CONFIG_REGISTERS]
+        if (None in expected):
+            # nothing known to compare against
+            return self.resync_register_cache()
+        regs = self._read_list(first, len(ZX_CONFIG_REGISTERS))
+        if (regs == None):
+            return False
+        if (list(regs) == expected):
+            return True
+        self.logger.warning("config registers %s, expected %s: replaying config", regs, expected)
+        self._count('brownout')
+        return self.replay_config()
+
+    def replay_config(self):
+        """Writes the shadow copies of the config registers back to the
+        device in one transfer
+
+        Returns:
+            True if successful write operation. False otherwise.
+        """
+        first = ZX_CONFIG_REGISTERS[0]
+        values = [self._shadow.get(reg) for reg in ZX_CONFIG_REGISTERS]
+        if (None in values):
+            return False
+        retval = self._write(self.i2c.writeList, first, values)
+        if (retval != None):
+            self.logger.error("Replaying config registers failed: %s", retval)
+            self._count('config_replay_failed')
+            return False
+        self._count('config_replayed')
+        return True
+
+    def _recovered(self, outage):
+        # called from inside the first transaction that succeeded again, below
+        # the metrics and trace wrappers: check the config once it returned
+        if (not self._replaying):
+            self._recovery = outage
+
+    def _verify_recovered(self):
+        outage = self._recovery
+        self._recovery = None
+        self.logger.info("bus recovered after %.3fs, verifying config", outage)
+        self._replaying = True
+        try:
+            with self.lock:
+                self.verify_config()
+        finally:
+            self._replaying = False
+
+    # ================
+    # Transport access
+    # ================
+
+    # The transport reports errors either Adafruit_I2C style (-1 from a read,
+    # a non-None return from a write) or with an IOError such as ZxBusError.
+    # These helpers turn both into None / an error value, and run the config
+    # check after a recovery once the transaction is done.
+
+    def _read_u8(self, reg):
+        try:
+            val = self.i2c.readU8(reg)
+        except IOError as err:
+            self.last_error = err
+            return None
+        if (self._recovery != None):
+            self._verify_recovered()
+        if (val == None) or (val < 0):
+            return None
+        return val
+
+    def _read_list(self, reg, length):
+        try:
+            regs = self.i2c.readList(reg, length)
+        except IOError as err:
+            self.last_error = err
+            return None
+        if (self._recovery != None):
+            self._verify_recovered()
+        if (not isinstance(regs, list)):
+            return None
+        return regs
+
+    def _read_into(self, reg, buffer):
+        try:
+            count = self.i2c.readinto(reg, buffer)
+        except IOError as err:
+            self.last_error = err
+            return None
+        if (self._recovery != None):
+            self._verify_recovered()
+        return count
+
+    def _write(self, method, reg, value):
+        try:
+            retval = method(reg, value)
+        except IOError as err:
+            self.last_error = err
+            return err
+        if (self._recovery != None):
+            self._verify_recovered()
+        return retval
+
+    def _count(self, event):
+        # only called on error paths, the success paths stay untouched
+        if (self.metrics != None):
+            self.metrics.count(event)
+
+    # =========
+    # Streaming
+    # =========
+
+    def start_streaming(self, rate_hz, buffer_size=1024):
+        """Starts sampling the sensor from a background thread
+
+        A reader thread calls read_snapshot() at a fixed cadence and stores
+        the samples in a preallocated ring buffer. Use latest(), drain() or
+        iterate over the returned stream to consume them.
+
+        Args:
+            rate_hz(:obj:`float`): target sample rate
+            buffer_size(:obj:`int`, optional): ring buffer capacity in
+                samples. Defaults to 1024
+
+        Returns:
+            the running ZxStream
+        """
+        self.stop_streaming()
+        self._stream = ZxStream(self, rate_hz, buffer_size)
+        self._stream.start()
+        return self._stream
+
+    def start_adaptive_streaming(self, target_latency=0.05, max_rate_hz=200.0,
+                                 buffer_size=1024, **kwargs):
+        """Starts sampling at a rate that follows the sensor's data-ready
+        cadence instead of a fixed one, see AdaptivePoller
+
+        Args:
+            target_latency(:obj:`float`, optional): longest interval in
+                seconds between reads while an object is in range
+            max_rate_hz(:obj:`float`, optional): upper bound of the read rate
+            buffer_size(:obj:`int`, optional): ring buffer capacity in
+                samples. Defaults to 1024
+            **kwargs: further AdaptivePoller arguments
+
+        Returns:
+            the running AdaptivePoller; report() shows the achieved sample
+            rate against the bus transactions spent
+        """
+        self.stop_streaming()
+        from .adaptive import AdaptivePoller
+        self._stream = AdaptivePoller(self, target_latency, max_rate_hz,
+                                      buffer_size=buffer_size, **kwargs)
+        self._stream.start()
+        return self._stream
+
+    def start_presence_monitor(self, pin, rate_hz=100.0, buffer_size=1024, **kwargs):
+        """Sleeps on the DR pin until an object is in range, then samples at
+        `rate_hz` until it has been gone for a while, see PresenceMonitor
+
+        Args:
+            pin(:obj:`DrPin`): backend for the DR pin, see zx_events
+            rate_hz(:obj:`float`, optional): sample rate while an object is
+                in range. Defaults to 100
+            buffer_size(:obj:`int`, optional): ring buffer capacity in
+                samples. Defaults to 1024
+            **kwargs: further PresenceMonitor arguments, e.g. idle_timeout
+
+        Returns:
+            the running PresenceMonitor; report() shows the time spent in
+            each state and the bus and CPU savings
+        """
+        self.stop_streaming()
+        from .presence import PresenceMonitor
+        self._stream = PresenceMonitor(self, pin, rate_hz, buffer_size=buffer_size, **kwargs)
+        self._stream.start()
+        return self._stream
+
+    def stop_streaming(self):
+        """Stops the background reader thread or adaptive poller, if any"""
+        if (self._stream != None):
+            self._stream.stop()
+            self._stream = None
+
     # ==============
     # Data available
     # ==============
 
-    def gesture_available(self):
+    def gesture_available(self, snapshot=None):
         """Indicates that new gesture data is available
         
+        Args:
+            snapshot(:obj:`ZxSample`, optional): decode from this sample
+                instead of reading the STATUS register
+
         Returns:
             True if data is ready to be read. False otherwise.
         """
+        if (snapshot != None):
+            return snapshot.gesture_available
         # read STATUS register
-        status = self.i2c.readU8(ZX_STATUS)
+        status = self._read_u8(ZX_STATUS)
+        if (status == None):
+            # a failed read is not a gesture
+            return False
         # extract bits and return
         return status & 0b11100
 
-    def position_available(self):
+    def position_available(self, snapshot=None):
         """Indicates that new position (X or Z) data is available
         
+        Args:
+            snapshot(:obj:`ZxSample`, optional): decode from this sample
+                instead of reading the STATUS register
+
         Returns:
             True if data is ready to be read. False otherwise.
         """
+        if (snapshot != None):
+            return snapshot.position_available
         # read STATUS register
-        status = self.i2c.readU8(ZX_STATUS)
+        status = self._read_u8(ZX_STATUS)
+        if (status == None):
+            return False
         # extract DAV bit and return
         return status & 1
 
+    def read_status(self, snapshot=None):
+        """Reads the STATUS register and decodes all of its bits. Note that
+        reading STATUS clears its gesture bits on the sensor.
+
+        Args:
+            snapshot(:obj:`ZxSample`, optional): decode from this sample
+                instead of reading the STATUS register
+
+        Returns:
+            a StatusFlags, None on read error.
+        """
+        if (snapshot != None):
+            return snapshot.flags
+        status = self._read_u8(ZX_STATUS)
+        if (status == None):
+            return None
+        return STATUS_TABLE[status & 0xFF]
+
     # ================
     # Sensor data read
     # ================
 
-    def read_x(self):
+    def read_x(self, snapshot=None):
         """Reads the X position data from the sensor
  
+        Args:
+            snapshot(:obj:`ZxSample`, optional): take the value from this
+                sample instead of reading the XPOS register
+
         Returns:
             0-240 for X position. 0xFF on read error.
         """
-        x_pos = self.i2c.readU8(ZX_XPOS)
-        if (not x_pos) or (x_pos > MAX_X):
+        if (snapshot != None):
+            x_pos = snapshot.x
+        else:
+            x_pos = decode_position(self._read_u8(ZX_XPOS), MAX_X)
+        if (x_pos == None):
+            self._count('invalid_x')
             return ZX_ERROR
         return x_pos
 
-    def read_z(self):
+    def read_z(self, snapshot=None):
         """Reads the Z position data from the sensor
  
+        Args:
+            snapshot(:obj:`ZxSample`, optional): take the value from this
+                sample instead of reading the ZPOS register
+
         Returns:
             0-240 for Z position. 0xFF on read error.
         """
-        z_pos = self.i2c.readU8(ZX_ZPOS)
-        if (not z_pos) or (z_pos > MAX_Z):
+        if (snapshot != None):
+            z_pos = snapshot.z
+        else:
+            z_pos = decode_position(self._read_u8(ZX_ZPOS), MAX_Z)
+        if (z_pos == None):
+            self._count('invalid_z')
             return ZX_ERROR
         return z_pos
 
-    def read_gesture(self):
+    def read_ranges(self, snapshot=None):
+        """Reads the left and right range registers in one transfer
+
+        Args:
+            snapshot(:obj:`ZxSample`, optional): take the values from this
+                sample instead of reading LRNG..RRNG
+
+        Returns:
+            (left, right) raw ranges, 0 when nothing is in range. None on
+            read error.
+        """
+        if (snapshot != None):
+            return snapshot.lrng, snapshot.rrng
+        regs = self._read_list(ZX_LRNG, ZX_RRNG - ZX_LRNG + 1)
+        if (regs == None) or (len(regs) != ZX_RRNG - ZX_LRNG + 1):
+            self._count('ranges_failed')
+            return None
+        return regs[0], regs[ZX_RRNG - ZX_LRNG]
+
+    def read_position(self, snapshot=None):
+        """Computes X and Z on the host from both ranges, at a finer
+        resolution than read_x() and read_z(), see zxsensor.position
+
+        Args:
+            snapshot(:obj:`ZxSample`, optional): use the ranges of this
+                sample instead of reading them
+
+        Returns:
+            (x, z) as floats in 0-240, None if nothing is in range or on
+            read error.
+        """
+        ranges = self.read_ranges(snapshot)
+        if (ranges == None):
+            return None
+        if (self.position_solver == None):
+            self.set_calibration(None)
+        return self.position_solver.solve(*ranges)
+
+    def set_calibration(self, calibration):
+        """Sets the PositionCalibration used by read_position()
+
+        Args:
+            calibration(:obj:`PositionCalibration`): None for the nominal
+                geometry
+        """
+        from .position import PositionSolver
+        self.position_solver = PositionSolver(calibration)
+
+    def load_calibration(self, path=None):
+        """Loads this unit's PositionCalibration, e.g. at startup
+
+        Args:
+            path(:obj:`str`, optional): a file written by
+                PositionCalibration.save(). Defaults to
+                default_calibration_path() for the sensor address
+
+        Returns:
+            the calibration, None if there is none at the default path
+        """
+        from .position import PositionCalibration, default_calibration_path
+        if (path == None):
+            path = default_calibration_path(getattr(self.i2c, 'address', 0x10))
+            if (not os.path.exists(path)):
+                self.logger.info("no calibration at %s, using the nominal geometry", path)
+                return None
+        calibration = PositionCalibration.load(path)
+        self.set_calibration(calibration)
+        return calibration
+
+    def read_gesture(self, snapshot=None):
         """Reads the last detected gesture from the sensor
         0x01 Right Swipe
         0x02 Left Swipe
         0x08 Up Swipe
         
+        Args:
+            snapshot(:obj:`ZxSample`, optional): take the value from this
+                sample instead of reading the GESTURE register
+
         Returns:
             a number corresponding to  a gesture. 0xFF on error.
 
         """
+        if (snapshot != None):
+            return snapshot.gesture
+
         # Read GESTURE register and return the value 
-        gesture = self.i2c.readU8(ZX_GESTURE)
-        self.logger.debug("Read gesture {} from register {}".format(gesture, ZX_GESTURE))
-
-        if (gesture == None):
-            return gesture_type.NO_GESTURE
-        elif (gesture == gesture_type.RIGHT_SWIPE.value):
-            return gesture_type.RIGHT_SWIPE
-        elif (gesture == gesture_type.LEFT_SWIPE.value):
-            return gesture_type.LEFT_SWIPE 
-        elif (gesture == gesture_type.UP_SWIPE.value):
-            return gesture_type.UP_SWIPE 
-        else:
-            return gesture_type.NO_GESTURE
+        gesture = self._read_u8(ZX_GESTURE)
+        self.logger.debug("Read gesture %s from register %s", gesture, ZX_GESTURE)
+        return decode_gesture(gesture)
     
-    def read_gesture_speed(self):
+    def read_gesture_speed(self, snapshot=None):
         """Reads the speed of the last gesture from the sensor
  
+        Args:
+            snapshot(:obj:`ZxSample`, optional): take the value from this
+                sample instead of reading the GSPEED register
+
         Returns:
             a number corresponding to the speed of the gesture. 0xFF on error.
         """
-        val = self.i2c.readU8(ZX_GSPEED)
+        if (snapshot != None):
+            return snapshot.speed
+        val = self._read_u8(ZX_GSPEED)
+        if (val == None):
+            return ZX_ERROR
         return val
 
     # ================
@@ -248,23 +831,8 @@ class ZxSensor:
         Returns:
             True if successful write operation. False otherwise.
         """
-        self.logger.debug("Setting bit {} in register {:02X}".format(bit, reg))
-        # Read value from register 
-        val = self.i2c.readU8(reg)
-        if (val == None):
-            self.logger.error("Read from i2c register %s returned no value!", reg)
-            return False
-
-        self.logger.debug("Read value {:08b} from register {}".format(val, reg))
-        # Set bits in register and write back to the register
-        val |= (1 << bit)
-        self.logger.debug("Setting value {:08b} to register {}".format(val, reg))
-
-        retval = self.i2c.write8(reg, val)
-        if (retval != None):
-            self.logger.error("Writing value %s to register %s was not successfull. Error message: %s", val, reg, retval)
-            return False
-        return True
+        self.logger.debug("Setting bit %s in register %02X", bit, reg)
+        return self.update_register(reg, set_mask=(1 << bit))
 
     def clear_register_bit(self, reg, bit):
         """clears a bit in a register over I2C
@@ -276,20 +844,98 @@ class ZxSensor:
         Returns:
             True if successful write operation. False otherwise.
         """
-        self.logger.debug("Clearing bit {} from register {:02X}".format(bit, reg))
-        # clear the value from register
-        val = self.i2c.readU8(reg)
+        self.logger.debug("Clearing bit %s from register %02X", bit, reg)
+        return self.update_register(reg, clear_mask=(1 << bit))
+
+    def update_register(self, reg, set_mask=0, clear_mask=0):
+        """Sets and clears several bits of a register with a single write.
+
+        Config registers (ZX_CONFIG_REGISTERS) are taken from the shadow
+        cache, so no read is needed once the cache holds them. The write is
+        skipped if it would not change the register.
+
+        Args:
+            reg(:obj:`int`): the register to update
+            set_mask(:obj:`int`, optional): bits to set
+            clear_mask(:obj:`int`, optional): bits to clear
+
+        Returns:
+            True if successful write operation. False otherwise.
+        """
+        with self.lock:
+            val = self.read_register(reg)
+            if (val == None):
+                return False
+
+            new_val = (val & ~clear_mask & 0xFF) | set_mask
+            if (self.logger.isEnabledFor(logging.DEBUG)):
+                # binary formatting is only paid for when DEBUG is on
+                self.logger.debug("Register %s: %s -> %s", reg, format(val, '08b'), format(new_val, '08b'))
+            if (new_val == val) and (reg in self._shadow):
+                return True
+            return self.write_register(reg, new_val)
+
+    def read_register(self, reg):
+        """Reads a register, serving config registers from the shadow cache
+
+        Args:
+            reg(:obj:`int`): the register to read
+
+        Returns:
+            the register value. None on read error.
+        """
+        if (reg in self._shadow):
+            return self._shadow[reg]
+        val = self._read_u8(reg)
         if (val == None):
             self.logger.error("Read from i2c register %s returned no value!", reg)
-            return False
+            self._count('register_read_failed')
+            return None
+        if (reg in ZX_CONFIG_REGISTERS):
+            self._shadow[reg] = val
+        return val
+
+    def write_register(self, reg, val):
+        """Writes a register and updates the shadow cache (write-through)
+
+        Args:
+            reg(:obj:`int`): the register to write
+            val(:obj:`int`): the value to write
 
-        self.logger.debug("Read value {:08b} from register {}".format(val, reg))
-        val &= ~(1 << bit)
-        self.logger.debug("Setting value {:08b} to register {}, bit: {}".format(val, reg, bit))
-        retval = self.i2c.write8(reg, val)
+        Returns:
+            True if successful write operation. False otherwise.
+        """
+        retval = self._write(self.i2c.write8, reg, val)
         if (retval != None):
             self.logger.error("Writing value %s to register %s was not successfull. Error message: %s", val, reg, retval)
+            # the device state is unknown now, re-read on next access
+            self._shadow.pop(reg, None)
+            self._count('register_write_failed')
+            return False
+        if (reg in ZX_CONFIG_REGISTERS):
+            self._shadow[reg] = val
+        return True
+
+    def invalidate_register_cache(self):
+        """Drops the shadow copies of the config registers, e.g. after the
+        sensor has been reset. They are re-read on next access.
+        """
+        self._shadow.clear()
+
+    def resync_register_cache(self):
+        """Reloads the shadow cache from the device with one block read
+
+        Returns:
+            True if successful read operation. False otherwise.
+        """
+        first = ZX_CONFIG_REGISTERS[0]
+        regs = self._read_list(first, len(ZX_CONFIG_REGISTERS))
+        if (regs == None) or (len(regs) != len(ZX_CONFIG_REGISTERS)):
+            self.logger.error("Could not resync config registers, read returned %s", regs)
+            self._shadow.clear()
             return False
+        for offset, val in enumerate(regs):
+            self._shadow[first + offset] = val
         return True
 
 if __name__ == '__main__':
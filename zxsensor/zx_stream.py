@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+""" Background acquisition of zx_sensor samples into a fixed size ring buffer
+"""
+
+# standard
+from __future__ import division, print_function
+import logging
+import threading
+import time
+
+
+class SampleRing(object):
+    """ Preallocated single-producer/single-consumer ring buffer
+
+    The producer only ever advances the write counter and the consumer only
+    ever advances the read counter, so neither side takes a lock. When the
+    consumer falls more than `capacity` samples behind, the oldest samples
+    are overwritten; push() counts every overwritten unread sample in
+    `overflows`, whether the consumer uses drain() or only latest().
+    """
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity(:obj:`int`): number of samples the ring can hold
+        """
+        if (capacity < 1):
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        # total number of samples ever written / consumed
+        self._written = 0
+        self._read = 0
+        self.overflows = 0
+        self._data_ready = threading.Event()
+
+    def __len__(self):
+        return min(self._written - self._read, self.capacity)
+
+    def push(self, sample):
+        """Stores a sample, overwriting the oldest one if the ring is full.
+        Must only be called from the producer thread.
+        """
+        written = self._written
+        if (written - self._read >= self.capacity):
+            self.overflows += 1
+        self._slots[written % self.capacity] = sample
+        self._written = written + 1
+        self._data_ready.set()
+
+    def latest(self):
+        """Returns the most recent sample without consuming anything.
+        None if nothing has been written yet.
+        """
+        written = self._written
+        if (written == 0):
+            return None
+        return self._slots[(written - 1) % self.capacity]
+
+    def drain(self):
+        """Consumes and returns all unread samples, oldest first.
+        Must only be called from the consumer thread.
+        """
+        written = self._written
+        start = self._read
+        if (written - start > self.capacity):
+            start = written - self.capacity
+        samples = [self._slots[i % self.capacity] for i in range(start, written)]
+        # the producer may have lapped us while copying; drop what it
+        # overwrote, push() has counted it
+        lapped = self._written - self.capacity - start
+        if (lapped > 0):
+            samples = samples[lapped:]
+        self._read = written
+        return samples
+
+    def wait(self, timeout=None):
+        """Blocks until unread samples are available
+
+        Args:
+            timeout(:obj:`float`, optional): seconds to wait. Forever if None
+
+        Returns:
+            True if samples are available. False on timeout.
+        """
+        self._data_ready.clear()
+        if (self._written != self._read):
+            return True
+        return self._data_ready.wait(timeout)
+
+    def wake(self):
+        """Releases consumers blocked in wait()"""
+        self._data_ready.set()
+
+
+class ZxStream(object):
+    """ Samples a ZxSensor at a fixed cadence from a dedicated reader thread
+
+    Every sample is a ZxSample from read_snapshot(), timestamped with
+    time.monotonic(). Iterating over the stream blocks until new samples
+    arrive and ends once the stream is stopped.
+    """
+
+    def __init__(self, sensor, rate_hz, buffer_size=1024):
+        """
+        Args:
+            sensor(:obj:`ZxSensor`): the sensor to sample
+            rate_hz(:obj:`float`): target sample rate
+            buffer_size(:obj:`int`, optional): ring buffer capacity in
+                samples. Defaults to 1024
+        """
+        if (rate_hz <= 0):
+            raise ValueError("rate_hz must be positive")
+        self.logger = logging.getLogger('ZxStream')
+        self.sensor = sensor
+        self.period = 1.0 / rate_hz
+        self.ring = SampleRing(buffer_size)
+        # number of failed reads and of ticks that ran later than one period
+        self.errors = 0
+        self.late_ticks = 0
+        self._running = threading.Event()
+        self._thread = None
+
+    @property
+    def overflows(self):
+        """Number of samples overwritten before the consumer read them"""
+        return self.ring.overflows
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    def start(self):
+        """Starts the reader thread"""
+        if (self.running):
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name='ZxStream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the reader thread and waits for it to exit"""
+        self._running.clear()
+        # wake up consumers blocked in the iterator
+        self.ring.wake()
+        if (self._thread != None):
+            self._thread.join(timeout)
+            self._thread = None
+
+    def latest(self):
+        """Returns the most recent sample, None before the first one"""
+        return self.ring.latest()
+
+    def drain(self):
+        """Returns all samples since the previous drain, oldest first"""
+        return self.ring.drain()
+
+    def drain_into(self, store):
+        """Moves all samples since the previous drain into a column store
+
+        Args:
+            store(:obj:`SampleColumnStore`): destination, see zx_array
+
+        Returns:
+            the number of samples moved
+        """
+        samples = self.ring.drain()
+        store.extend(samples)
+        return len(samples)
+
+    def __iter__(self):
+        while (self.running):
+            if (not self.ring.wait(self.period * 10)):
+                continue
+            for sample in self.ring.drain():
+                yield sample
+        for sample in self.ring.drain():
+            yield sample
+
+    def _run(self):
+        period = self.period
+        deadline = time.monotonic()
+        while (self._running.is_set()):
+            sample = self.sensor.read_snapshot()
+            if (sample == None):
+                self.errors += 1
+            else:
+                self.ring.push(sample)
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if (delay > 0):
+                time.sleep(delay)
+            elif (delay < -period):
+                # fell more than one period behind: skip ahead instead of
+                # bursting to catch up
+                self.late_ticks += 1
+                deadline = time.monotonic()
+        self.logger.debug("reader thread stopped, %d errors, %d late ticks", self.errors, self.late_ticks)
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+""" Reader for the zx_sensor UART data stream (115200 baud, 8N1)
+
+The sensor pushes framed messages without being polled:
+
+    ZX_UART_RANGES  0xFE <left> <right>
+    ZX_UART_X       0xFA <x>
+    ZX_UART_Z       0xFB <z>
+    ZX_UART_GESTURE 0xFC <gesture> <speed>
+    ZX_UART_ID      0xF1 <sensor type> <hw version> <fw version>
+    ZX_UART_END     0xFF
+
+Payload bytes can take any value, header values included: ranges, gesture
+and speed bytes run up to 0xFF. The parser therefore counts payload bytes by
+the frame type and only looks for a header once a frame is complete. A
+non-header byte where a header is expected means bytes were lost; the parser
+skips to the next header byte and counts one resync. A frame cut short by a
+lost byte swallows the start of the next one and decodes wrong once before
+the parser locks on again.
+"""
+
+# standard
+from __future__ import division, print_function
+import logging
+import time
+# project
+from .i2c_registers import *
+from .zx_sample import ZxSample, decode_gesture, decode_position
+
+# payload length of every message header
+UART_PAYLOAD_LENGTHS = {
+    ZX_UART_END: 0,
+    ZX_UART_RANGES: 2,
+    ZX_UART_X: 1,
+    ZX_UART_Z: 1,
+    ZX_UART_GESTURE: 2,
+    ZX_UART_ID: 3,
+}
+
+_DAV = 1 << STATUS_DAV
+_SWP = 1 << STATUS_SWP
+
+
+class ZxUartParser(object):
+    """ Incremental state machine over the UART byte stream
+
+    feed() can be given arbitrary chunks; partial frames are carried over to
+    the next call. A ZxSample is produced after every Z message (with the
+    most recent X and ranges) and after every gesture message.
+    """
+
+    def __init__(self):
+        self._header = None
+        self._need = 0
+        self._payload = bytearray(3)
+        self._fill = 0
+        self._stray = False
+        # latest decoded values
+        self.x = None
+        self.z = None
+        self.lrng = 0
+        self.rrng = 0
+        self.sensor_id = None
+        # counters
+        self.frames = 0
+        self.resyncs = 0
+        self.skipped = 0
+
+    def feed(self, data):
+        """Parses a chunk of the stream
+
+        Args:
+            data: bytes, bytearray or memoryview
+
+        Returns:
+            a list of ZxSamples completed by this chunk, possibly empty
+        """
+        samples = []
+        lengths = UART_PAYLOAD_LENGTHS
+        payload = self._payload
+        for byte in memoryview(data).cast('B'):
+            if (self._header == None):
+                need = lengths.get(byte)
+                if (need == None):
+                    # payload byte outside a frame, wait for the next header
+                    if (not self._stray):
+                        self.resyncs += 1
+                        self._stray = True
+                    self.skipped += 1
+                    continue
+                self._stray = False
+                self._header = byte
+                self._need = need
+                self._fill = 0
+            else:
+                payload[self._fill] = byte
+                self._fill += 1
+            if (self._fill == self._need):
+                sample = self._complete(self._header, payload)
+                self._header = None
+                if (sample != None):
+                    samples.append(sample)
+        return samples
+
+    def _complete(self, header, payload):
+        self.frames += 1
+        if (header == ZX_UART_RANGES):
+            self.lrng = payload[0]
+            self.rrng = payload[1]
+        elif (header == ZX_UART_X):
+            self.x = decode_position(payload[0], MAX_X)
+        elif (header == ZX_UART_Z):
+            self.z = decode_position(payload[0], MAX_Z)
+            return ZxSample(time.monotonic(), _DAV, gesture_type.NO_GESTURE,
+                            0, self.x, self.z, self.lrng, self.rrng)
+        elif (header == ZX_UART_GESTURE):
+            return ZxSample(time.monotonic(), _SWP, decode_gesture(payload[0]),
+                            payload[1], self.x, self.z, self.lrng, self.rrng)
+        elif (header == ZX_UART_ID):
+            self.sensor_id = (payload[0], payload[1], payload[2])
+        return None
+
+
+class ZxSensorUart(object):
+    """ Reads samples from the sensor's UART stream
+
+    Works with a pyserial Serial, a pty, a pipe or any file-like object
+    with read() or readinto(). A tty or pty must be in raw mode
+    (tty.setraw), otherwise the line discipline rewrites payload bytes;
+    pyserial does this on open.
+    """
+
+    def __init__(self, stream, chunk_size=64, eof_on_empty=True):
+        """
+        Args:
+            stream: the byte stream to read from
+            chunk_size(:obj:`int`, optional): bytes requested per read.
+                Defaults to 64
+            eof_on_empty(bool, optional): treat an empty read as end of
+                stream. Serial ports return nothing on a read timeout, so
+                open() turns this off. Defaults to True
+        """
+        self.logger = logging.getLogger('ZxSensorUart')
+        self.stream = stream
+        self.eof_on_empty = eof_on_empty
+        self.parser = ZxUartParser()
+        self._buffer = bytearray(chunk_size)
+        self._view = memoryview(self._buffer)
+
+    @classmethod
+    def open(cls, port, baudrate=115200, timeout=0.1):
+        """Opens a serial port with pyserial
+
+        Args:
+            port(:obj:`str`): the serial device, e.g. /dev/ttyAMA0
+            baudrate(:obj:`int`, optional): Defaults to 115200
+            timeout(:obj:`float`, optional): read timeout in seconds
+        """
+        import serial
+        return cls(serial.Serial(port, baudrate, timeout=timeout), eof_on_empty=False)
+
+    def read_samples(self):
+        """Reads one chunk from the stream and parses it
+
+        Returns:
+            a list of ZxSamples, empty if the chunk completed none. None at
+            end of stream (see eof_on_empty).
+        """
+        readinto = getattr(self.stream, 'readinto', None)
+        if (readinto != None):
+            count = readinto(self._buffer)
+            if (count == None):
+                # non-blocking stream without data
+                return []
+            chunk = self._view[:count]
+        else:
+            chunk = self.stream.read(len(self._buffer))
+            if (chunk == None):
+                return []
+            count = len(chunk)
+        if (count == 0):
+            return None if self.eof_on_empty else []
+        return self.parser.feed(chunk)
+
+    def __iter__(self):
+        """Yields samples until the stream ends"""
+        while (True):
+            samples = self.read_samples()
+            if (samples == None):
+                return
+            for sample in samples:
+                yield sample
+
+    def gestures(self):
+        """Yields only the samples carrying a gesture"""
+        for sample in self:
+            if (sample.gesture_available):
+                yield sample
+
+    @property
+    def sensor_id(self):
+        """(sensor type, hw version, fw version) from the last ID message"""
+        return self.parser.sensor_id
+
+    def close(self):
+        self.stream.close()
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4